@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+"""
+Generates an lfsr module as a shared XOR netlist using common subexpression elimination
+"""
+
+import argparse
+import heapq
+import itertools
+import os
+import sys
+
+try:
+    from lfsr_model import lfsr_masks
+except ImportError:
+    # attempt import from testbench directory
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'tb'))
+    try:
+        from lfsr_model import lfsr_masks
+    finally:
+        del sys.path[0]
+
+from lfsr_flat import param_header, module_text
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('-w', '--lfsr-width', type=int, default=31, help="LFSR width")
+    parser.add_argument('-p', '--lfsr-poly', type=lambda x: int(x, 0), default=0x10000001, help="LFSR polynomial")
+    parser.add_argument('-c', '--lfsr-config', type=str, default="FIBONACCI", help="LFSR configuration (FIBONACCI or GALOIS)")
+    parser.add_argument('-f', '--lfsr-feed-forward', type=int, default=0, help="LFSR feed forward")
+    parser.add_argument('-r', '--reverse', type=int, default=0, help="bit-reverse input and output")
+    parser.add_argument('-d', '--data-width', type=int, default=8, help="data width")
+    parser.add_argument('-n', '--name', type=str, help="module name")
+    parser.add_argument('-o', '--output', type=str, help="output file name")
+    parser.add_argument('--state-only', action='store_true', help="only generate state_out (CRC), tie off data_out")
+
+    args = parser.parse_args()
+
+    try:
+        generate(**args.__dict__)
+    except IOError as ex:
+        print(ex)
+        exit(1)
+
+
+class XorNetwork:
+    """
+    XOR network computing each output as the XOR of a set of inputs
+
+    Inputs are numbered 0..n_inputs-1, gates are numbered from n_inputs upwards.
+    Each gate is a 2-input XOR (a, b).  Each output is a list of signals that are
+    combined with a balanced tree of additional gates when the netlist is built.
+    """
+
+    def __init__(self, masks, n_inputs):
+        self.n_inputs = n_inputs
+        self.gates = []
+        self.depth = [0]*n_inputs
+        self.outputs = [[n for n in range(n_inputs) if (mask >> n) & 1] for mask in masks]
+
+    def add_gate(self, a, b):
+        self.gates.append((a, b))
+        self.depth.append(max(self.depth[a], self.depth[b])+1)
+        return self.n_inputs+len(self.gates)-1
+
+    def optimize(self):
+        # Paar-style greedy extraction: repeatedly replace the most frequently
+        # occurring pair of signals with a new gate.  Ties are broken in favor
+        # of the shallowest pair to keep logic depth down.
+        rows = [set(row) for row in self.outputs]
+        count = {}
+        where = {}
+
+        def add_pair(p, r):
+            count[p] = count.get(p, 0)+1
+            where.setdefault(p, set()).add(r)
+            return p
+
+        for r, row in enumerate(rows):
+            for p in itertools.combinations(sorted(row), 2):
+                add_pair(p, r)
+
+        def key(p):
+            return (-count[p], max(self.depth[p[0]], self.depth[p[1]]), p)
+
+        heap = [key(p) for p, c in count.items() if c > 1]
+        heapq.heapify(heap)
+
+        while heap:
+            c, d, p = heapq.heappop(heap)
+            if count.get(p, 0) != -c or max(self.depth[p[0]], self.depth[p[1]]) != d:
+                # stale entry
+                continue
+
+            a, b = p
+            t = self.add_gate(a, b)
+
+            touched = set()
+            for r in list(where[p]):
+                row = rows[r]
+                row.discard(a)
+                row.discard(b)
+
+                # remove pairs involving a or b
+                for x in row:
+                    for q in ((min(a, x), max(a, x)), (min(b, x), max(b, x))):
+                        count[q] -= 1
+                        where[q].discard(r)
+                        touched.add(q)
+
+                # add pairs involving the new signal
+                for x in row:
+                    touched.add(add_pair((x, t), r))
+
+                row.add(t)
+
+            del count[p]
+            del where[p]
+
+            for q in touched:
+                if count.get(q, 0) > 1:
+                    heapq.heappush(heap, key(q))
+                elif q in count and count[q] == 0:
+                    del count[q]
+                    del where[q]
+
+        self.outputs = [sorted(row) for row in rows]
+        return self
+
+    def build(self):
+        # combine remaining terms of each output, shallowest first
+        nets = list(self.gates)
+        depth = list(self.depth)
+        outputs = []
+        for row in self.outputs:
+            if not row:
+                outputs.append(None)
+                continue
+            heap = [(depth[n], n) for n in row]
+            heapq.heapify(heap)
+            while len(heap) > 1:
+                da, a = heapq.heappop(heap)
+                db, b = heapq.heappop(heap)
+                nets.append((a, b))
+                depth.append(max(da, db)+1)
+                heapq.heappush(heap, (depth[-1], self.n_inputs+len(nets)-1))
+            outputs.append(heap[0][1])
+        return nets, depth, outputs
+
+    def stats(self):
+        nets, depth, outputs = self.build()
+        return len(nets), max((depth[n] for n in outputs if n is not None), default=0)
+
+    def evaluate(self, inputs):
+        # evaluate the network on an integer input vector, returns integer output vector
+        nets, depth, outputs = self.build()
+        vals = [(inputs >> n) & 1 for n in range(self.n_inputs)]
+        for a, b in nets:
+            vals.append(vals[a] ^ vals[b])
+        return sum(vals[n] << k for k, n in enumerate(outputs) if n is not None)
+
+
+def flat_stats(masks):
+    # gate count and depth with every output computed on its own
+    gates = sum(max(bin(m).count('1')-1, 0) for m in masks)
+    depth = max(((bin(m).count('1')-1).bit_length() for m in masks), default=0)
+    return gates, depth
+
+
+def generate(lfsr_width=31, lfsr_poly=0x10000001, lfsr_config="FIBONACCI", lfsr_feed_forward=0,
+        reverse=0, data_width=8, name=None, output=None, state_only=False):
+    if name is None:
+        name = "lfsr"
+
+    if output is None:
+        output = "lfsr_cse.v"
+
+    # never overwrite the parametrizable module
+    if os.path.realpath(output) == os.path.realpath(os.path.join(os.path.dirname(__file__), "lfsr.v")):
+        raise IOError(f"Refusing to overwrite '{output}'")
+
+    print(f"Generating XOR network LFSR module {name}...")
+
+    masks = lfsr_masks(lfsr_width, lfsr_poly, lfsr_config, int(bool(lfsr_feed_forward)), int(bool(reverse)), data_width)
+    if state_only:
+        masks = masks[:lfsr_width]
+
+    n_inputs = lfsr_width+data_width
+    net = XorNetwork(masks, n_inputs).optimize()
+
+    before = flat_stats(masks)
+    after = net.stats()
+    print(f"XOR gates: {before[0]} -> {after[0]}, logic depth: {before[1]} -> {after[1]}")
+
+    nets, depth, outputs = net.build()
+
+    def sig(n):
+        if n < lfsr_width:
+            return f"state_in[{n}]"
+        elif n < n_inputs:
+            return f"data_in[{n-lfsr_width}]"
+        return f"x[{n-n_inputs}]"
+
+    lines = []
+    if nets:
+        lines.append(f"wire [{len(nets)-1}:0] x;")
+        lines.append("")
+        for k, (a, b) in enumerate(nets):
+            lines.append(f"assign x[{k}] = {sig(a)} ^ {sig(b)};")
+        lines.append("")
+
+    def out(n):
+        return "1'b0" if n is None else sig(n)
+
+    for k in range(lfsr_width):
+        lines.append(f"assign state_out[{k}] = {out(outputs[k])};")
+    lines.append("")
+    for k in range(data_width):
+        if state_only:
+            lines.append(f"assign data_out[{k}] = 1'b0;")
+        else:
+            lines.append(f"assign data_out[{k}] = {out(outputs[k+lfsr_width])};")
+
+    params = (lfsr_width, lfsr_poly, lfsr_config, int(bool(lfsr_feed_forward)), int(bool(reverse)), data_width)
+    description = (f" * XOR network combinatorial parallel LFSR/CRC\n"
+        f" * Generated by lfsr_cse.py for LFSR_WIDTH={lfsr_width}, LFSR_POLY={lfsr_width}'h{lfsr_poly:x},\n"
+        f" * LFSR_CONFIG=\"{lfsr_config}\", LFSR_FEED_FORWARD={params[3]}, REVERSE={params[4]}, DATA_WIDTH={data_width}\n"
+        f" * {after[0]} XOR gates (flat: {before[0]}), logic depth {after[1]} (flat: {before[1]})")
+    if state_only:
+        description += "\n * state_out only, data_out is tied off"
+
+    text = module_text(name, description, param_header(*params), "\n".join(lines)+"\n")
+
+    print(f"Writing file '{output}'...")
+
+    with open(output, 'w') as f:
+        f.write(text)
+        f.flush()
+
+    print("Done")
+
+    return before, after
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+"""
+Generates a flattened lfsr module with explicit XOR equations for one parameter set
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    from lfsr_model import lfsr_masks
+except ImportError:
+    # attempt import from testbench directory
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'tb'))
+    try:
+        from lfsr_model import lfsr_masks
+    finally:
+        del sys.path[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('-w', '--lfsr-width', type=int, default=31, help="LFSR width")
+    parser.add_argument('-p', '--lfsr-poly', type=lambda x: int(x, 0), default=0x10000001, help="LFSR polynomial")
+    parser.add_argument('-c', '--lfsr-config', type=str, default="FIBONACCI", help="LFSR configuration (FIBONACCI or GALOIS)")
+    parser.add_argument('-f', '--lfsr-feed-forward', type=int, default=0, help="LFSR feed forward")
+    parser.add_argument('-r', '--reverse', type=int, default=0, help="bit-reverse input and output")
+    parser.add_argument('-d', '--data-width', type=int, default=8, help="data width")
+    parser.add_argument('-n', '--name', type=str, help="module name")
+    parser.add_argument('-o', '--output', type=str, help="output file name")
+    parser.add_argument('--benchmark', action='store_true', help="compare elaboration time against lfsr.v")
+
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark()
+        return
+
+    try:
+        generate(**{k: v for k, v in args.__dict__.items() if k != 'benchmark'})
+    except IOError as ex:
+        print(ex)
+        exit(1)
+
+
+def xor_expr(mask, lfsr_width):
+    terms = []
+    n = 0
+    while mask:
+        if mask & 1:
+            if n < lfsr_width:
+                terms.append(f"state_in[{n}]")
+            else:
+                terms.append(f"data_in[{n-lfsr_width}]")
+        mask >>= 1
+        n += 1
+    return " ^ ".join(terms) if terms else "1'b0"
+
+
+def param_header(lfsr_width, lfsr_poly, lfsr_config, lfsr_feed_forward, reverse, data_width):
+    return f"""(
+    // width of LFSR
+    parameter LFSR_WIDTH = {lfsr_width},
+    // LFSR polynomial
+    parameter LFSR_POLY = {lfsr_width}'h{lfsr_poly:x},
+    // LFSR configuration: "GALOIS", "FIBONACCI"
+    parameter LFSR_CONFIG = "{lfsr_config}",
+    // LFSR feed forward enable
+    parameter LFSR_FEED_FORWARD = {lfsr_feed_forward},
+    // bit-reverse input and output
+    parameter REVERSE = {reverse},
+    // width of data input
+    parameter DATA_WIDTH = {data_width},
+    // implementation style: "AUTO", "LOOP", "REDUCTION" (ignored)
+    parameter STYLE = "AUTO"
+)
+(
+    input  wire [DATA_WIDTH-1:0] data_in,
+    input  wire [LFSR_WIDTH-1:0] state_in,
+    output wire [DATA_WIDTH-1:0] data_out,
+    output wire [LFSR_WIDTH-1:0] state_out
+);
+
+// check parameters against generated configuration
+initial begin
+    if (LFSR_WIDTH != {lfsr_width} || LFSR_POLY != {lfsr_width}'h{lfsr_poly:x} || LFSR_CONFIG != "{lfsr_config}" ||
+            LFSR_FEED_FORWARD != {lfsr_feed_forward} || REVERSE != {reverse} || DATA_WIDTH != {data_width}) begin
+        $error("Error: parameters do not match generated configuration (instance %m)");
+        $finish;
+    end
+end
+"""
+
+
+def module_text(name, description, header, body):
+    return f"""/*
+
+Copyright (c) 2023 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+*/
+
+// Language: Verilog 2001
+
+`resetall
+`timescale 1ns / 1ps
+`default_nettype none
+
+/*
+{description}
+ */
+module {name} #
+{header}
+{body}
+endmodule
+
+`resetall
+"""
+
+
+def generate(lfsr_width=31, lfsr_poly=0x10000001, lfsr_config="FIBONACCI", lfsr_feed_forward=0,
+        reverse=0, data_width=8, name=None, output=None):
+    if name is None:
+        name = "lfsr"
+
+    if output is None:
+        output = "lfsr_flat.v"
+
+    # never overwrite the parametrizable module
+    if os.path.realpath(output) == os.path.realpath(os.path.join(os.path.dirname(__file__), "lfsr.v")):
+        raise IOError(f"Refusing to overwrite '{output}'")
+
+    print(f"Generating flattened LFSR module {name}...")
+
+    masks = lfsr_masks(lfsr_width, lfsr_poly, lfsr_config, int(bool(lfsr_feed_forward)), int(bool(reverse)), data_width)
+
+    lines = []
+    for n in range(lfsr_width):
+        lines.append(f"assign state_out[{n}] = {xor_expr(masks[n], lfsr_width)};")
+    lines.append("")
+    for n in range(data_width):
+        lines.append(f"assign data_out[{n}] = {xor_expr(masks[n+lfsr_width], lfsr_width)};")
+
+    params = (lfsr_width, lfsr_poly, lfsr_config, int(bool(lfsr_feed_forward)), int(bool(reverse)), data_width)
+    description = (f" * Flattened combinatorial parallel LFSR/CRC\n"
+        f" * Generated by lfsr_flat.py for LFSR_WIDTH={lfsr_width}, LFSR_POLY={lfsr_width}'h{lfsr_poly:x},\n"
+        f" * LFSR_CONFIG=\"{lfsr_config}\", LFSR_FEED_FORWARD={params[3]}, REVERSE={params[4]}, DATA_WIDTH={data_width}")
+
+    text = module_text(name, description, param_header(*params), "\n".join(lines)+"\n")
+
+    print(f"Writing file '{output}'...")
+
+    with open(output, 'w') as f:
+        f.write(text)
+        f.flush()
+
+    print("Done")
+
+
+def benchmark(configs=None):
+    # compare iverilog elaboration time for lfsr_crc built on lfsr.v and on flattened modules
+    if configs is None:
+        configs = [(32, 0x04c11db7, "GALOIS", 0, 1, w) for w in [64, 128, 256, 512, 1024]]
+
+    iverilog = shutil.which("iverilog")
+    if iverilog is None:
+        print("iverilog not found")
+        return
+
+    rtl_dir = os.path.dirname(os.path.abspath(__file__))
+
+    print(f"{'config':<40} {'lfsr.v':>10} {'flattened':>10} {'speedup':>8}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for params in configs:
+            lfsr_width, lfsr_poly, lfsr_config, lfsr_feed_forward, reverse, data_width = params
+            flat = os.path.join(tmp, "lfsr.v")
+            generate(*params, output=flat)
+
+            p = [
+                f"-Plfsr_crc.LFSR_WIDTH={lfsr_width}",
+                f"-Plfsr_crc.LFSR_POLY={lfsr_width}'h{lfsr_poly:x}",
+                f"-Plfsr_crc.LFSR_CONFIG=\"{lfsr_config}\"",
+                f"-Plfsr_crc.REVERSE={reverse}",
+                f"-Plfsr_crc.DATA_WIDTH={data_width}",
+            ]
+
+            times = []
+            for lfsr_src in [os.path.join(rtl_dir, "lfsr.v"), flat]:
+                cmd = [iverilog, "-g2012", "-o", os.path.join(tmp, "out.vvp"), "-s", "lfsr_crc"] + p
+                cmd += [os.path.join(rtl_dir, "lfsr_crc.v"), lfsr_src]
+                start = time.perf_counter()
+                subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+                times.append(time.perf_counter() - start)
+
+            desc = f"{lfsr_width}'h{lfsr_poly:x} {lfsr_config} DATA_WIDTH={data_width}"
+            print(f"{desc:<40} {times[0]:9.3f}s {times[1]:9.3f}s {times[0]/times[1]:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+"""
+
+Copyright (c) 2023 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import os
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from lfsr_model import popcount
+except ImportError:
+    # attempt import from current directory
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+    try:
+        from lfsr_model import popcount
+    finally:
+        del sys.path[0]
+
+
+# Bit error rate accounting for PRBS checkers.
+#
+# BerCounter records the error word from the checker (data_out of
+# lfsr_prbs_check) for every valid cycle into a preallocated buffer.  When the
+# buffer is full, or when results are read, the buffered words are processed in
+# one pass: popcounts with a NumPy byte table or int.bit_count, and the
+# per-lane counts, bursts and errored seconds from the errored words only, so
+# error-free words cost one buffer store.
+#
+# Words wider than 64 bits are stored as multiple 64-bit columns, LSB first.
+#
+# Reported values:
+#
+# ber                 errors / bits
+# lane_errors         error count per lane of lane_width bits (default per bit)
+# bursts, max_burst   runs of errored words separated by more than burst_gap
+#                     error-free words, and the longest run in words
+# errored_seconds     seconds containing at least one error, with the time base
+# error_free_seconds  given by words_per_second
+
+M64 = 2**64-1
+
+if np is not None:
+    popcount_table = np.array([bin(k).count("1") for k in range(256)], dtype=np.uint8)
+
+
+class BerCounter:
+    def __init__(self, data_width, lane_width=1, words_per_second=None, burst_gap=1, capacity=1 << 16):
+        self.data_width = data_width
+        self.lane_width = lane_width
+        self.lane_count = (data_width+lane_width-1) // lane_width
+        self.words_per_second = words_per_second
+        self.burst_gap = burst_gap
+        self.capacity = capacity
+        self.cols = (data_width+63) // 64
+
+        if np is not None:
+            self.buf = np.zeros((capacity, self.cols), dtype=np.uint64)
+        else:
+            self.buf = [0]*capacity
+
+        self.reset()
+
+    def __repr__(self):
+        return (f"{type(self).__name__}(data_width={self.data_width}, lane_width={self.lane_width}, "
+            f"words_per_second={self.words_per_second}, burst_gap={self.burst_gap})")
+
+    def reset(self):
+        self.fill = 0
+        self.word_count = 0
+        self.error_count = 0
+        self.errored_words = 0
+        self.lane_counts = [0]*self.lane_count
+        self.burst_count = 0
+        self.max_burst = 0
+        self.burst_start = None
+        self.last_error = None
+        self.errored_seconds = 0
+        self.last_second = None
+
+    def record(self, word):
+        if self.fill == self.capacity:
+            self.flush()
+        if np is None:
+            self.buf[self.fill] = int(word)
+        elif self.cols == 1:
+            self.buf[self.fill, 0] = int(word)
+        else:
+            word = int(word)
+            for c in range(self.cols):
+                self.buf[self.fill, c] = (word >> (64*c)) & M64
+        self.fill += 1
+
+    def record_words(self, words):
+        # record a sequence of error words, or a NumPy array of shape (n,) or (n, cols)
+        if np is not None and isinstance(words, np.ndarray):
+            words = words.reshape(len(words), -1).astype(np.uint64, copy=False)
+            k = 0
+            while k < len(words):
+                if self.fill == self.capacity:
+                    self.flush()
+                n = min(self.capacity-self.fill, len(words)-k)
+                self.buf[self.fill:self.fill+n] = words[k:k+n]
+                self.fill += n
+                k += n
+        else:
+            for word in words:
+                self.record(word)
+
+    def flush(self):
+        # process the buffered words
+        n = self.fill
+        if not n:
+            return
+
+        base = self.word_count
+
+        if np is not None:
+            block = self.buf[:n]
+            counts = popcount_table[block.view(np.uint8)].sum(axis=1, dtype=np.int64)
+            idx = np.flatnonzero(counts)
+            self.error_count += int(counts.sum())
+            if len(idx):
+                # per-bit counts from the errored words only
+                bits = np.unpackbits(block[idx].astype('<u8').view(np.uint8), axis=1, bitorder='little')
+                per_bit = bits.sum(axis=0, dtype=np.int64)[:self.data_width]
+                per_bit = np.pad(per_bit, (0, self.lane_count*self.lane_width-self.data_width))
+                lanes = per_bit.reshape(self.lane_count, self.lane_width).sum(axis=1)
+                self.lane_counts = [a+int(b) for a, b in zip(self.lane_counts, lanes)]
+            idx = idx.astype(np.int64) + base
+        else:
+            idx = [base+k for k in range(n) if self.buf[k]]
+            for k in idx:
+                word = self.buf[k-base]
+                self.error_count += popcount(word)
+                while word:
+                    low = word & -word
+                    self.lane_counts[(low.bit_length()-1) // self.lane_width] += 1
+                    word ^= low
+
+        self.account(idx)
+
+        self.word_count += n
+        self.fill = 0
+
+    def account(self, idx):
+        # bursts and errored seconds from the absolute indices of the errored words
+        if not len(idx):
+            return
+
+        self.errored_words += len(idx)
+
+        if np is not None:
+            idx = np.asarray(idx, dtype=np.int64)
+            split = np.diff(idx) > self.burst_gap
+            starts = idx[np.concatenate(([True], split))]
+            ends = idx[np.concatenate((split, [True]))]
+        else:
+            starts = [k for j, k in enumerate(idx) if j == 0 or k - idx[j-1] > self.burst_gap]
+            ends = [k for j, k in enumerate(idx) if j == len(idx)-1 or idx[j+1] - k > self.burst_gap]
+
+        starts = [int(k) for k in starts]
+        ends = [int(k) for k in ends]
+
+        # continue the open burst from the previous block
+        if self.last_error is not None and starts[0] - self.last_error <= self.burst_gap:
+            starts[0] = self.burst_start
+        else:
+            self.burst_count += 1
+        self.burst_count += len(starts)-1
+
+        self.max_burst = max(self.max_burst, max(e-s+1 for s, e in zip(starts, ends)))
+        self.burst_start = starts[-1]
+        self.last_error = ends[-1]
+
+        if self.words_per_second:
+            if np is not None:
+                seconds = np.unique(idx // self.words_per_second).tolist()
+            else:
+                seconds = sorted(set(k // self.words_per_second for k in idx))
+            self.errored_seconds += len(seconds) - (seconds[0] == self.last_second)
+            self.last_second = seconds[-1]
+
+    @property
+    def words(self):
+        return self.word_count + self.fill
+
+    @property
+    def bits(self):
+        return self.words * self.data_width
+
+    @property
+    def errors(self):
+        self.flush()
+        return self.error_count
+
+    @property
+    def ber(self):
+        bits = self.bits
+        return self.errors / bits if bits else 0.0
+
+    @property
+    def bursts(self):
+        self.flush()
+        return self.burst_count
+
+    @property
+    def lane_errors(self):
+        self.flush()
+        return list(self.lane_counts)
+
+    @property
+    def seconds(self):
+        if not self.words_per_second:
+            return None
+        return -(-self.words // self.words_per_second)
+
+    @property
+    def error_free_seconds(self):
+        if not self.words_per_second:
+            return None
+        self.flush()
+        return self.seconds - self.errored_seconds
+
+    def report(self):
+        self.flush()
+        return {
+            'words': self.words,
+            'bits': self.bits,
+            'errors': self.errors,
+            'ber': self.ber,
+            'errored_words': self.errored_words,
+            'bursts': self.bursts,
+            'max_burst': self.max_burst,
+            'seconds': self.seconds,
+            'errored_seconds': self.errored_seconds if self.words_per_second else None,
+            'error_free_seconds': self.error_free_seconds,
+            'lane_errors': self.lane_errors,
+        }
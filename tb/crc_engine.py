@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+"""
+
+Copyright (c) 2023 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import argparse
+import concurrent.futures
+import functools
+import itertools
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+
+try:
+    from lfsr_model import lfsr_jump
+except ImportError:
+    # attempt import from current directory
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+    try:
+        from lfsr_model import lfsr_jump
+    finally:
+        del sys.path[0]
+
+
+# Table-driven CRC reference model for lfsr_crc.
+#
+# Takes the same parameters as lfsr_crc (LFSR_WIDTH, LFSR_POLY, LFSR_INIT, REVERSE,
+# INVERT) and computes the CRC over a byte string using slicing-by-N lookup tables.
+# The tables are computed once per parameter set and cached.
+#
+# Data is processed in order, first byte first.  With REVERSE set, bytes are shifted
+# in LSB first, which corresponds to packing the bytes on the lfsr_crc data_in bus in
+# little-endian order.  With REVERSE cleared, bytes are shifted in MSB first, which
+# corresponds to big-endian packing.
+#
+# The CRC register is the state of a Galois LFSR, so the state after N zero bytes is
+# a GF(2) matrix power applied to the state.  combine() uses the cached matrix powers
+# from lfsr_model to compute CRC(A+B) from CRC(A), CRC(B) and the length of B, which
+# crc_file() uses to compute the CRC of a large file in parallel chunks.
+#
+# Settings for common CRC implementations:
+#
+# Name        Width   Polynomial      Init            Reverse Invert
+# CRC16-IBM   16      16'h8005        16'hffff        1       0
+# CRC16-CCITT 16      16'h1021        16'h1d0f        0       0
+# CRC32       32      32'h04c11db7    32'hffffffff    1       1
+# CRC32C      32      32'h1edc6f41    32'hffffffff    1       1
+
+
+def reverse_bits(val, width):
+    return int(f"{val:0{width}b}"[::-1], 2)
+
+
+def crc_shift_byte(state, data, width, poly, reverse):
+    # bit-serial reference, shifts one byte through the CRC register
+    # poly is given in the bit order of the state register
+    mask = 2**width-1
+    if reverse:
+        for i in range(8):
+            if (state ^ (data >> i)) & 1:
+                state = (state >> 1) ^ poly
+            else:
+                state = state >> 1
+    else:
+        for i in range(7, -1, -1):
+            if ((state >> (width-1)) ^ (data >> i)) & 1:
+                state = ((state << 1) & mask) ^ poly
+            else:
+                state = (state << 1) & mask
+    return state
+
+
+@functools.lru_cache(maxsize=None)
+def crc_tables(width, poly, reverse, slices):
+    if reverse:
+        poly = reverse_bits(poly, width)
+
+    # table k holds the state after shifting in one byte followed by k zero bytes,
+    # starting from a zero state
+    table = [crc_shift_byte(0, b, width, poly, reverse) for b in range(256)]
+    tables = [table]
+    for k in range(1, slices):
+        table = [crc_shift_byte(v, 0, width, poly, reverse) for v in table]
+        tables.append(table)
+
+    # order tables by byte position within the word, first byte first
+    return tuple(tuple(t) for t in reversed(tables))
+
+
+@functools.lru_cache(maxsize=None)
+def crc_word_func(width, reverse, slices):
+    # generate an unrolled slicing-by-N loop body, one table lookup per byte lane
+    terms = []
+    for k in range(slices):
+        if k*8 >= width:
+            # lane does not overlap the state
+            terms.append(f"t{k}[b{k}]")
+        elif reverse:
+            # state bits line up with the first bytes of the word
+            terms.append(f"t{k}[((state >> {k*8}) ^ b{k}) & 0xff]")
+        else:
+            # state bits are left-aligned with the word
+            shift = width-8-k*8
+            if shift >= 0:
+                terms.append(f"t{k}[((state >> {shift}) ^ b{k}) & 0xff]")
+            else:
+                terms.append(f"t{k}[((state << {-shift}) ^ b{k}) & 0xff]")
+
+    lanes = ", ".join(f"b{k}" for k in range(slices))
+    tables = ", ".join(f"t{k}" for k in range(slices))
+    terms = " ^\n            ".join(terms)
+
+    src = (f"def update_words(data, state, {tables}):\n"
+        f"    for {lanes}, in iter_unpack('{slices}B', data):\n"
+        f"        state = ({terms})\n"
+        f"    return state\n")
+
+    ns = {'iter_unpack': struct.iter_unpack}
+    exec(src, ns)
+    return ns['update_words']
+
+
+class Crc:
+    def __init__(self, width=32, poly=0x04c11db7, init=None, reverse=True, invert=True, slices=8):
+        self.width = width
+        self.poly = poly
+        self.mask = 2**width-1
+        self.init = self.mask if init is None else init
+        self.reverse = bool(reverse)
+        self.invert = bool(invert)
+
+        # each word must cover the whole CRC register
+        self.slices = max(slices, (width+7) // 8)
+
+        self.tables = crc_tables(width, poly, self.reverse, self.slices)
+        self.table = self.tables[-1]
+        self.update_words = crc_word_func(width, self.reverse, self.slices)
+
+    def __repr__(self):
+        return (f"{type(self).__name__}(width={self.width}, poly={self.poly:#x}, init={self.init:#x}, "
+            f"reverse={int(self.reverse)}, invert={int(self.invert)})")
+
+    def params(self):
+        return (self.width, self.poly, self.init, self.reverse, self.invert, self.slices)
+
+    def update(self, data, state=None):
+        # advance the raw CRC state (state_reg in lfsr_crc) over data
+        if state is None:
+            state = self.init
+
+        data = memoryview(data).cast('B')
+        end = len(data) - len(data) % self.slices
+        table = self.table
+        width = self.width
+
+        # full words
+        state = self.update_words(data[:end], state, *self.tables)
+
+        # remaining bytes
+        if self.reverse:
+            for b in data[end:]:
+                state = (state >> 8) ^ table[(state ^ b) & 0xff]
+        elif width >= 8:
+            shift = width-8
+            mask = self.mask
+            for b in data[end:]:
+                state = ((state << 8) & mask) ^ table[((state >> shift) ^ b) & 0xff]
+        else:
+            shift = 8-width
+            for b in data[end:]:
+                state = table[(state << shift) ^ b]
+
+        return state
+
+    def finalize(self, state):
+        # output value (crc_out in lfsr_crc)
+        if self.invert:
+            return ~state & self.mask
+        return state
+
+    def compute(self, data, state=None):
+        return self.finalize(self.update(data, state))
+
+    def __call__(self, data):
+        return self.compute(data)
+
+    def combine(self, crc_a, crc_b, len_b):
+        # CRC of A followed by B from CRC of A, CRC of B, and length of B in bytes
+        xor_out = self.mask if self.invert else 0
+        state = lfsr_jump(crc_a ^ xor_out ^ self.init, len_b*8, self.width, self.poly, "GALOIS", int(self.reverse))
+        return state ^ crc_b
+
+
+crc16_ibm = Crc(width=16, poly=0x8005, init=0xffff, reverse=True, invert=False)
+crc16_ccitt = Crc(width=16, poly=0x1021, init=0x1d0f, reverse=False, invert=False)
+crc32 = Crc(width=32, poly=0x04c11db7, init=0xffffffff, reverse=True, invert=True)
+crc32c = Crc(width=32, poly=0x1edc6f41, init=0xffffffff, reverse=True, invert=True)
+
+
+def crc_bitwise(data, width=32, poly=0x04c11db7, init=None, reverse=True, invert=True):
+    state = 2**width-1 if init is None else init
+    if reverse:
+        poly = reverse_bits(poly, width)
+    for b in data:
+        state = crc_shift_byte(state, b, width, poly, reverse)
+    if invert:
+        state = ~state & (2**width-1)
+    return state
+
+
+def crc_file_chunk(path, offset, length, params):
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            return Crc(*params).compute(memoryview(m)[offset:offset+length])
+
+
+def crc_file(path, crc=crc32, workers=None, chunk_size=1 << 24):
+    size = os.path.getsize(path)
+    if size == 0:
+        return crc(b'')
+
+    offsets = range(0, size, chunk_size)
+    lengths = [min(chunk_size, size-offset) for offset in offsets]
+
+    if workers == 1 or len(offsets) == 1:
+        vals = [crc_file_chunk(path, offset, length, crc.params()) for offset, length in zip(offsets, lengths)]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+            vals = list(pool.map(crc_file_chunk, itertools.repeat(path), offsets, lengths,
+                itertools.repeat(crc.params())))
+
+    val = vals[0]
+    for v, length in zip(vals[1:], lengths[1:]):
+        val = crc.combine(val, v, length)
+    return val
+
+
+def benchmark(size=1 << 20):
+    data = bytes(itertools.islice(itertools.cycle(range(251)), size))
+    small = data[:size // 16]
+
+    def run(name, func, data):
+        start = time.perf_counter()
+        val = func(data)
+        t = time.perf_counter() - start
+        print(f"{name:<24} {len(data)/t/1e6:10.3f} MB/s  (0x{val:08x})")
+        return len(data)/t
+
+    print(f"CRC32C, {size} bytes")
+    base = run("bitwise", functools.partial(crc_bitwise, poly=0x1edc6f41), small)
+    run("zlib (CRC32)", zlib.crc32, data)
+    for slices in [4, 8, 16]:
+        crc = Crc(width=32, poly=0x1edc6f41, slices=slices)
+        rate = run(f"slicing-by-{crc.slices}", crc, data)
+        print(f"{'':<24} {rate/base:10.1f}x bitwise")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute CRC of files, or run benchmark")
+    parser.add_argument('files', type=str, nargs='*', help="input files")
+    parser.add_argument('-w', '--width', type=int, default=32, help="CRC width (LFSR_WIDTH)")
+    parser.add_argument('-p', '--poly', type=lambda x: int(x, 0), default=0x04c11db7, help="polynomial (LFSR_POLY)")
+    parser.add_argument('-i', '--init', type=lambda x: int(x, 0), default=None, help="initial state (LFSR_INIT)")
+    parser.add_argument('-r', '--reverse', type=int, default=1, help="bit-reverse (REVERSE)")
+    parser.add_argument('-n', '--invert', type=int, default=1, help="invert output (INVERT)")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="number of worker processes")
+    parser.add_argument('--chunk-size', type=int, default=1 << 24, help="bytes per work item")
+
+    args = parser.parse_args()
+
+    if not args.files:
+        benchmark()
+        return
+
+    crc = Crc(args.width, args.poly, args.init, args.reverse, args.invert)
+    digits = (args.width+3) // 4
+
+    for path in args.files:
+        start = time.perf_counter()
+        val = crc_file(path, crc, args.jobs, args.chunk_size)
+        t = time.perf_counter() - start
+        print(f"{val:0{digits}x}  {path}  ({os.path.getsize(path)/t/1e6:.3f} MB/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+"""
+
+Copyright (c) 2023 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import argparse
+import json
+import os
+import sys
+
+try:
+    from lfsr_model import popcount
+    from lfsr_poly import full_poly, gf2_poly_str, lfsr_table, period
+    from lfsr_search import map_batches
+except ImportError:
+    # attempt import from current directory
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+    try:
+        from lfsr_model import popcount
+        from lfsr_poly import full_poly, gf2_poly_str, lfsr_table, period
+        from lfsr_search import map_batches
+    finally:
+        del sys.path[0]
+
+
+# CRC Hamming distance profile engine.
+#
+# For an lfsr_crc instance with LFSR_WIDTH n and LFSR_POLY p, the generator is
+# g(x) = x^n + p (as in lfsr_poly.py), and a codeword of k data bits is k+n
+# bits long.  An error pattern goes undetected if and only if it is a multiple
+# of g, that is, if the syndromes x^i mod g of its bit positions XOR to zero.
+# The Hamming distance (HD) at a codeword length L is the smallest weight of
+# such a pattern that fits in L bits.  LFSR_INIT, REVERSE and INVERT do not
+# change the HD, and neither does LFSR_CONFIG (the polynomial is the same).
+#
+# For each weight w, the engine finds L_w, the shortest codeword length that
+# contains an undetected pattern of weight w.  Multiplying by x is invertible
+# modulo g (LFSR_POLY bit 0 set), so patterns can be shifted to start at bit
+# 0, and the search runs over the highest bit position m with a table of the
+# syndromes s[i] = x^i mod g:
+#
+# w=2  L_2 = period(g)+1 from lfsr_poly
+# w=3  1 ^ s[m] is the syndrome of a lower position (set lookup)
+# w=4  1 ^ s[m] ^ s[c] is the syndrome of a lower position, for some c < m
+# w=5  1 ^ s[m] ^ s[d] is in the set of pair sums s[b] ^ s[c] below m
+# w=6  1 ^ s[m] ^ q is in the set of pair sums, for some pair sum q
+#
+# w=5 and w=6 are meet-in-the-middle searches on the pair sum set, which is
+# extended with the pairs ending at m after each step.  The weights are
+# searched in order and each search stops at the shortest length found so far,
+# since longer lengths already have a lower HD.  This also means that within
+# the search range there are no lower-weight patterns, so a lookup that hits
+# overlapping positions is impossible and no index bookkeeping is needed.
+# When g has an even number of terms, x+1 divides g and odd weights are
+# skipped.  The pair sum set has about L_w^2/2 entries, which bounds the
+# practical data word length for w=5 to a few thousand bits.
+#
+# sweep() computes the profiles of a list of polynomials in a process pool and
+# appends each result to a JSON lines checkpoint file as it completes.  When
+# restarted with the same checkpoint file and settings, completed polynomials
+# are loaded from the file instead of being recomputed.
+
+default_max_length = 1024
+default_weights = 6
+
+
+def syndromes(f, count):
+    # x^i mod f for i in range(count)
+    n = f.bit_length()-1
+    top = 1 << n
+    res = [0]*count
+    s = 1
+    for i in range(count):
+        res[i] = s
+        s <<= 1
+        if s & top:
+            s ^= f
+    return res
+
+
+def first_codeword(syn, weight, limit):
+    # shortest length up to limit with an undetected pattern of this weight, None if not found
+    # syn must cover limit positions, and limit must be below the L of all lower weights
+    seen = set()
+    pairs = set()
+    prefix = []
+    for m in range(1, limit):
+        sm = syn[m]
+        t = 1 ^ sm
+        if weight == 3:
+            found = t in seen
+        elif weight == 4:
+            found = not seen.isdisjoint(map(t.__xor__, prefix))
+        elif weight == 5:
+            found = not pairs.isdisjoint(map(t.__xor__, prefix))
+        elif weight == 6:
+            found = not pairs.isdisjoint(map(t.__xor__, pairs))
+        else:
+            raise ValueError(f"Unsupported weight {weight}")
+        if found:
+            return m+1
+        if weight >= 5:
+            pairs.update(map(sm.__xor__, prefix))
+        seen.add(sm)
+        prefix.append(sm)
+    return None
+
+
+def hd_lengths(lfsr_width, lfsr_poly, max_length=default_max_length, weights=default_weights):
+    # {w: L_w} for the weights with an undetected pattern within max_length data bits
+    f = full_poly(lfsr_width, lfsr_poly)
+    if not f & 1:
+        raise ValueError("LFSR_POLY bit 0 must be set")
+    limit = max_length+lfsr_width
+
+    res = {}
+    p = period(f)
+    if p+1 <= limit:
+        res[2] = p+1
+        limit = p
+
+    syn = syndromes(f, limit)
+    even = popcount(f) % 2 == 0
+    for w in range(3, weights+1):
+        if even and w % 2:
+            continue
+        length = first_codeword(syn, w, limit)
+        if length is not None:
+            res[w] = length
+            limit = length-1
+    return res
+
+
+def hd_profile(lfsr_width, lengths, max_length=default_max_length, weights=default_weights):
+    # [[hd, last data length], ...] in order of decreasing HD, from the hd_lengths() result
+    # an HD of weights+1 stands for "more than weights"
+    res = []
+    hd = weights+1
+    for w, length in sorted(lengths.items(), key=lambda x: x[1]):
+        if length-1-lfsr_width >= 1:
+            res.append([hd, length-1-lfsr_width])
+        hd = w
+    res.append([hd, max_length])
+    return res
+
+
+def hd_at(profile, data_len):
+    # HD at a data word length, None beyond the profile
+    for hd, last in profile:
+        if data_len <= last:
+            return hd
+    return None
+
+
+def crc_params(lfsr_width, lfsr_poly):
+    return {
+        'LFSR_WIDTH': lfsr_width,
+        'LFSR_POLY': f"{lfsr_width}'h{lfsr_poly:0{(lfsr_width+3)//4}x}",
+        'LFSR_CONFIG': "GALOIS",
+    }
+
+
+def analyze(lfsr_width, lfsr_poly, max_length=default_max_length, weights=default_weights):
+    f = full_poly(lfsr_width, lfsr_poly)
+    lengths = hd_lengths(lfsr_width, lfsr_poly, max_length, weights)
+    return {
+        'lfsr_width': lfsr_width,
+        'lfsr_poly': lfsr_poly,
+        # Koopman notation: x^n term kept, +1 term implied
+        'koopman': f >> 1,
+        'polynomial': gf2_poly_str(f),
+        'max_length': max_length,
+        'weights': weights,
+        'lengths': {str(w): length for w, length in sorted(lengths.items())},
+        'profile': hd_profile(lfsr_width, lengths, max_length, weights),
+        'params': crc_params(lfsr_width, lfsr_poly),
+    }
+
+
+def analyze_batch(lfsr_width, polys, max_length, weights):
+    return [analyze(lfsr_width, p, max_length, weights) for p in polys]
+
+
+def load_checkpoint(path, lfsr_width, max_length, weights):
+    # completed results from a checkpoint file, keyed by LFSR_POLY
+    res = {}
+    if path is None or not os.path.exists(path):
+        return res
+    with open(path) as f:
+        for line in f:
+            try:
+                r = json.loads(line)
+            except ValueError:
+                # partial line from an interrupted run
+                continue
+            if (r.get('lfsr_width'), r.get('max_length'), r.get('weights')) == (lfsr_width, max_length, weights):
+                res[r['lfsr_poly']] = r
+    return res
+
+
+def sweep(lfsr_width, polys, max_length=default_max_length, weights=default_weights, jobs=None, checkpoint=None, batch_size=1):
+    # yields result dicts in the order of polys, computing the missing ones in a process pool
+    polys = list(polys)
+    done = load_checkpoint(checkpoint, lfsr_width, max_length, weights)
+    todo = [p for p in polys if p not in done]
+
+    batches = ((lfsr_width, todo[k:k+batch_size], max_length, weights) for k in range(0, len(todo), batch_size))
+    results = map_batches(analyze_batch, batches, jobs)
+
+    f = None
+    if checkpoint is not None:
+        f = open(checkpoint, 'a+')
+        # terminate a partial line from an interrupted run
+        end = f.tell()
+        if end:
+            f.seek(end-1)
+            if f.read(1) != "\n":
+                f.write("\n")
+    k = 0
+    try:
+        for batch in results:
+            for res in batch:
+                done[res['lfsr_poly']] = res
+                if f is not None:
+                    f.write(json.dumps(res) + "\n")
+            if f is not None:
+                f.flush()
+            while k < len(polys) and polys[k] in done:
+                yield done[polys[k]]
+                k += 1
+        for p in polys[k:]:
+            yield done[p]
+    finally:
+        results.close()
+        if f is not None:
+            f.close()
+
+
+def crc_table():
+    # CRC entries of the settings table in the lfsr.v header
+    return [e for e in lfsr_table() if e['name'].startswith("CRC")]
+
+
+def format_profile(res):
+    w = res['weights']
+    return ", ".join(f"HD{'>' if hd > w else '='}{min(hd, w)} to {last}" for hd, last in res['profile'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute CRC Hamming distance profiles")
+    parser.add_argument('-w', '--lfsr-width', type=int, default=32, help="CRC width")
+    parser.add_argument('-p', '--lfsr-poly', type=lambda x: int(x.split("'h")[-1], 16) if "'h" in x else int(x, 0),
+        nargs='+', default=[0x04c11db7], help="CRC polynomials (LFSR_POLY notation, hex or Verilog literal)")
+    parser.add_argument('--all', action='store_true', help="sweep all polynomials of the given width with bit 0 set")
+    parser.add_argument('--table', action='store_true', help="profile the CRC entries in the lfsr.v header table")
+    parser.add_argument('-n', '--max-length', type=int, default=default_max_length, help="maximum data word length (bits)")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="worker processes (default CPU count)")
+    parser.add_argument('--checkpoint', type=str, help="JSON lines checkpoint file to resume from and append to")
+    parser.add_argument('--json', action='store_true', help="print one JSON object per line")
+
+    args = parser.parse_args()
+
+    if args.table:
+        runs = [(e['lfsr_width'], [e['lfsr_poly']]) for e in crc_table()]
+    elif args.all:
+        runs = [(args.lfsr_width, range(1, 2**args.lfsr_width, 2))]
+    else:
+        runs = [(args.lfsr_width, args.lfsr_poly)]
+
+    best = None
+    for width, polys in runs:
+        for res in sweep(width, polys, args.max_length, default_weights, args.jobs, args.checkpoint):
+            if args.json:
+                print(json.dumps(res), flush=True)
+            else:
+                print(f"{res['params']['LFSR_POLY']} (Koopman 0x{res['koopman']:x}): {format_profile(res)}", flush=True)
+            hd = hd_at(res['profile'], args.max_length)
+            if best is None or hd > best[0]:
+                best = (hd, res)
+
+    if best is not None and not args.json and sum(len(p) for w, p in runs) > 1:
+        p = best[1]['params']
+        print(f"Best at {args.max_length} data bits: LFSR_WIDTH={p['LFSR_WIDTH']} LFSR_POLY={p['LFSR_POLY']} "
+            f"LFSR_CONFIG=\"{p['LFSR_CONFIG']}\"")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,455 @@
+#!/usr/bin/env python
+"""
+
+Copyright (c) 2023 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import abc
+import heapq
+import os
+import sys
+import types
+
+try:
+    from lfsr_model import Lfsr
+    from multi_top import Param, param_value, read_ports
+    from vector_harness import port_widths
+except ImportError:
+    # attempt import from current directory
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+    try:
+        from lfsr_model import Lfsr
+        from multi_top import Param, param_value, read_ports
+        from vector_harness import port_widths
+    finally:
+        del sys.path[0]
+
+
+# Cycle-accurate models of the registered LFSR wrapper modules.
+#
+# LfsrCrc, LfsrScramble, LfsrDescramble, LfsrPrbsGen and LfsrPrbsCheck model the
+# state_reg/output_reg pipeline of the corresponding module in rtl/, including
+# synchronous reset to LFSR_INIT and data_in_valid/enable gating.  The ports are
+# read from the module header in rtl/, so a model has the same signal names and
+# widths as the RTL, and the parameters are available as attributes in the same
+# way as on a cocotb toplevel handle.
+#
+# run() executes a cocotb test coroutine against a model with a minimal
+# event-driven scheduler in place of the simulator.  The cocotb names used by
+# the test module (cocotb.start_soon, Clock, RisingEdge, FallingEdge, Timer) are
+# replaced with local equivalents for the duration of the run.  As with a
+# simulator, values written with .value = are applied after the current
+# coroutines have run, and values read after RisingEdge are the values from
+# before the edge.
+
+tb_dir = os.path.dirname(os.path.realpath(__file__))
+rtl_dir = os.path.abspath(os.path.join(tb_dir, '..', 'rtl'))
+
+time_units = {
+    'step': 1,
+    'fs': 1,
+    'ps': 10**3,
+    'ns': 10**6,
+    'us': 10**9,
+    'ms': 10**12,
+    'sec': 10**15,
+}
+
+
+class Value(int):
+    @property
+    def integer(self):
+        return int(self)
+
+
+class Signal:
+    def __init__(self, sim, name, width, value=0):
+        self._sim = sim
+        self._name = name
+        self._width = width
+        self._mask = 2**width-1
+        self._value = value
+
+    def __len__(self):
+        return self._width
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self._name}, width={self._width}, value={self._value:#x})"
+
+    @property
+    def value(self):
+        return Value(self._value)
+
+    @value.setter
+    def value(self, val):
+        self._sim.write(self, int(val) & self._mask)
+
+    def setimmediatevalue(self, val):
+        self._value = int(val) & self._mask
+
+
+class Trigger:
+    def __await__(self):
+        return (yield self)
+
+
+class Timer(Trigger):
+    def __init__(self, time, units="step"):
+        self.time = time * time_units[units]
+
+    def prime(self, task):
+        task.sim.schedule(task, self.time)
+
+
+class RisingEdge(Trigger):
+    edge = 1
+
+    def __init__(self, signal):
+        self.signal = signal
+
+    def prime(self, task):
+        task.sim.waiters.setdefault((self.signal, self.edge), []).append(task)
+
+
+class FallingEdge(RisingEdge):
+    edge = 0
+
+
+class Clock:
+    def __init__(self, signal, period, units="step"):
+        self.signal = signal
+        self.period = period * time_units[units]
+
+    async def start(self):
+        half = self.period // 2
+        while True:
+            self.signal.value = 1
+            await Timer(half)
+            self.signal.value = 0
+            await Timer(self.period - half)
+
+
+class Task(Trigger):
+    def __init__(self, sim, coro):
+        self.sim = sim
+        self.coro = coro
+        self.done = False
+        self.retval = None
+        self.joiners = []
+
+    def resume(self, value=None):
+        try:
+            trigger = self.coro.send(value)
+        except StopIteration as ex:
+            self.finish(ex.value)
+        except BaseException as ex:
+            self.done = True
+            self.sim.error = ex
+        else:
+            trigger.prime(self)
+
+    def finish(self, retval):
+        self.done = True
+        self.retval = retval
+        for task in self.joiners:
+            self.sim.ready.append(task)
+
+    def prime(self, task):
+        if self.done:
+            task.sim.ready.append(task)
+        else:
+            self.joiners.append(task)
+
+
+class Sim:
+    def __init__(self):
+        self.time = 0
+        self.seq = 0
+        self.timers = []
+        self.ready = []
+        self.waiters = {}
+        self.writes = []
+        self.models = []
+        self.error = None
+
+    def start_soon(self, coro):
+        task = Task(self, coro)
+        self.ready.append(task)
+        return task
+
+    def schedule(self, task, delay):
+        self.seq += 1
+        heapq.heappush(self.timers, (self.time+delay, self.seq, task))
+
+    def write(self, signal, val):
+        self.writes.append((signal, val))
+
+    def run_ready(self):
+        while self.ready:
+            ready, self.ready = self.ready, []
+            for task in ready:
+                task.resume()
+                if self.error is not None:
+                    return
+            self.commit()
+
+    def commit(self):
+        # apply deferred writes, evaluating the models on each clock edge
+        while self.writes:
+            writes, self.writes = self.writes, []
+            edges = []
+            for signal, val in writes:
+                if signal._value != val:
+                    signal._value = val
+                    edges.append(signal)
+            for signal in edges:
+                self.edge(signal)
+
+    def edge(self, signal):
+        val = signal._value & 1
+        updates = []
+        if val:
+            updates = [model for model in self.models if model.clk is signal]
+            for model in updates:
+                model.clock()
+
+        # waiters see the values from before the edge
+        for task in self.waiters.pop((signal, val), []):
+            task.resume()
+            if self.error is not None:
+                return
+
+        for model in updates:
+            model.update()
+
+    def run(self, coro):
+        main = self.start_soon(coro)
+        while not main.done:
+            self.run_ready()
+            if self.error is not None:
+                raise self.error
+            if main.done:
+                break
+            if not self.timers:
+                raise RuntimeError("Simulation stalled: no pending events")
+            t = self.timers[0][0]
+            self.time = t
+            while self.timers and self.timers[0][0] == t:
+                self.ready.append(heapq.heappop(self.timers)[2])
+        return main.retval
+
+
+class Model(abc.ABC):
+    """
+    Cycle-accurate model of an LFSR wrapper module
+
+    Parameters are given as keyword arguments using the Verilog names, with
+    either Python values or Verilog literals (as passed to cocotb-test).
+    """
+
+    module = None
+    feed_forward = 0
+    defaults = {}
+
+    def __init__(self, sim=None, **params):
+        self._sim = sim if sim is not None else Sim()
+        self._sim.models.append(self)
+
+        self.params = {}
+        for name, val in dict(self.defaults, **params).items():
+            try:
+                self.params[name] = param_value(val) if val is not None else None
+            except ValueError:
+                # plain string
+                self.params[name] = val
+        if self.params.get('LFSR_INIT') is None:
+            self.params['LFSR_INIT'] = 2**self.params['LFSR_WIDTH']-1
+
+        for name, val in self.params.items():
+            setattr(self, name, Param(val))
+
+        ports = port_widths(read_ports(os.path.join(rtl_dir, f"{self.module}.v"), self.module), self.params)
+        for d, name, width in ports:
+            setattr(self, name, Signal(self._sim, name, width))
+
+        self.lfsr = Lfsr(self.params['LFSR_WIDTH'], self.params['LFSR_POLY'], self.params['LFSR_CONFIG'],
+            self.feed_forward, self.params['REVERSE'], self.params['DATA_WIDTH'])
+
+        self.state_mask = 2**self.params['LFSR_WIDTH']-1
+        self.data_mask = 2**self.params['DATA_WIDTH']-1
+
+        self.state_reg = self.params['LFSR_INIT'] & self.state_mask
+        self.output_reg = 0
+        self.next_regs = None
+        self.outputs()
+
+    def __repr__(self):
+        params = ", ".join(f"{k}={v!r}" for k, v in self.params.items())
+        return f"{type(self).__name__}({params})"
+
+    def clock(self):
+        # register inputs at the rising edge
+        if self.rst._value:
+            self.next_regs = (self.params['LFSR_INIT'] & self.state_mask, 0)
+        else:
+            self.next_regs = self.next_state()
+
+    def update(self):
+        # commit registers after the edge
+        if self.next_regs is not None:
+            self.state_reg, self.output_reg = self.next_regs
+            self.next_regs = None
+            self.outputs()
+
+    @abc.abstractmethod
+    def next_state(self):
+        # (state_reg, output_reg) after a rising edge with rst low
+        pass
+
+    def outputs(self):
+        self.data_out._value = self.output_reg
+
+
+class LfsrCrc(Model):
+    module = "lfsr_crc"
+    defaults = {
+        'LFSR_WIDTH': 32,
+        'LFSR_POLY': 0x04c11db7,
+        'LFSR_INIT': None,
+        'LFSR_CONFIG': "GALOIS",
+        'REVERSE': 1,
+        'INVERT': 1,
+        'DATA_WIDTH': 8,
+        'STYLE': "AUTO",
+    }
+
+    def next_state(self):
+        if not self.data_in_valid._value:
+            return None
+        data_out, state = self.lfsr.step(self.data_in._value, self.state_reg)
+        if self.params['INVERT']:
+            return state, ~state & self.state_mask
+        return state, state
+
+    def outputs(self):
+        self.crc_out._value = self.output_reg
+
+
+class LfsrScramble(Model):
+    module = "lfsr_scramble"
+    defaults = {
+        'LFSR_WIDTH': 58,
+        'LFSR_POLY': 0x8000000001,
+        'LFSR_INIT': None,
+        'LFSR_CONFIG': "FIBONACCI",
+        'REVERSE': 1,
+        'DATA_WIDTH': 64,
+        'STYLE': "AUTO",
+    }
+
+    def next_state(self):
+        if not self.data_in_valid._value:
+            return None
+        data_out, state = self.lfsr.step(self.data_in._value, self.state_reg)
+        return state, data_out
+
+
+class LfsrDescramble(LfsrScramble):
+    module = "lfsr_descramble"
+    feed_forward = 1
+
+
+class LfsrPrbsGen(Model):
+    module = "lfsr_prbs_gen"
+    defaults = {
+        'LFSR_WIDTH': 31,
+        'LFSR_POLY': 0x10000001,
+        'LFSR_INIT': None,
+        'LFSR_CONFIG': "FIBONACCI",
+        'REVERSE': 0,
+        'INVERT': 1,
+        'DATA_WIDTH': 8,
+        'STYLE': "AUTO",
+    }
+
+    def next_state(self):
+        if not self.enable._value:
+            return None
+        data_out, state = self.lfsr.step(0, self.state_reg)
+        return state, 0
+
+    def outputs(self):
+        # data_out is combinatorial from state_reg
+        data_out, state = self.lfsr.step(0, self.state_reg)
+        if self.params['INVERT']:
+            data_out = ~data_out & self.data_mask
+        self.data_out._value = data_out
+
+
+class LfsrPrbsCheck(Model):
+    module = "lfsr_prbs_check"
+    feed_forward = 1
+    defaults = {
+        'LFSR_WIDTH': 31,
+        'LFSR_POLY': 0x10000001,
+        'LFSR_INIT': None,
+        'LFSR_CONFIG': "FIBONACCI",
+        'REVERSE': 0,
+        'INVERT': 1,
+        'DATA_WIDTH': 8,
+        'STYLE': "AUTO",
+    }
+
+    def next_state(self):
+        if not self.data_in_valid._value:
+            return None
+        data_in = self.data_in._value
+        if self.params['INVERT']:
+            data_in = ~data_in & self.data_mask
+        data_out, state = self.lfsr.step(data_in, self.state_reg)
+        return state, data_out
+
+
+models = {cls.module: cls for cls in [LfsrCrc, LfsrScramble, LfsrDescramble, LfsrPrbsGen, LfsrPrbsCheck]}
+
+
+def run(test, dut, **options):
+    # run cocotb test coroutine test(dut, **options) against a model
+    sim = dut._sim
+    module = sys.modules[test.__module__]
+
+    replace = {
+        'cocotb': types.SimpleNamespace(start_soon=sim.start_soon, fork=sim.start_soon, top=dut, SIM_NAME=None),
+        'Clock': Clock,
+        'RisingEdge': RisingEdge,
+        'FallingEdge': FallingEdge,
+        'Timer': Timer,
+    }
+    saved = {name: module.__dict__[name] for name in replace if name in module.__dict__}
+
+    try:
+        for name in saved:
+            setattr(module, name, replace[name])
+        return sim.run(test(dut, **options))
+    finally:
+        for name, val in saved.items():
+            setattr(module, name, val)
@@ -0,0 +1 @@
+../crc_engine.py
\ No newline at end of file
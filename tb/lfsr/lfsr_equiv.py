@@ -0,0 +1 @@
+../lfsr_equiv.py
\ No newline at end of file
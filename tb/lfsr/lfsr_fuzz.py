@@ -0,0 +1 @@
+../lfsr_fuzz.py
\ No newline at end of file
@@ -0,0 +1 @@
+../sim_bench.py
\ No newline at end of file
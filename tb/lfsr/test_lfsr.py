@@ -25,16 +25,50 @@ THE SOFTWARE.
 
 import itertools
 import logging
+import math
 import os
+import random
+import sys
 import zlib
 
 import pytest
-import cocotb_test.simulator
 
 import cocotb
 from cocotb.triggers import Timer
 from cocotb.regression import TestFactory
 
+try:
+    from crc_engine import Crc
+    from lfsr_model import Lfsr, lfsr_masks, popcount, gf2_poly_mulmod, gf2_poly_powmod, mersenne_factors
+    import lfsr_equiv
+    import lfsr_fuzz
+    import multi_top
+    import sim_cache
+except ImportError:
+    # attempt import from current directory
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+    try:
+        from crc_engine import Crc
+        from lfsr_model import Lfsr, lfsr_masks, popcount, gf2_poly_mulmod, gf2_poly_powmod, mersenne_factors
+        import lfsr_equiv
+        import lfsr_fuzz
+        import multi_top
+        import sim_cache
+    finally:
+        del sys.path[0]
+
+try:
+    import lfsr_flat
+    import lfsr_cse
+except ImportError:
+    # attempt import from rtl directory
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'rtl'))
+    try:
+        import lfsr_flat
+        import lfsr_cse
+    finally:
+        del sys.path[0]
+
 
 class TB:
     def __init__(self, dut):
@@ -55,15 +89,7 @@ def crc32(data):
     return zlib.crc32(data) & 0xffffffff
 
 
-def crc32c(data, crc=0xffffffff, poly=0x82f63b78):
-    for d in data:
-        crc = crc ^ d
-        for bit in range(0, 8):
-            if crc & 1:
-                crc = (crc >> 1) ^ poly
-            else:
-                crc = crc >> 1
-    return ~crc & 0xffffffff
+crc32c = Crc(width=32, poly=0x1edc6f41, init=0xffffffff, reverse=True, invert=True)
 
 
 async def run_test_crc(dut, ref_crc):
@@ -163,26 +189,31 @@ async def run_test_prbs(dut, ref_prbs):
         await Timer(10, 'ns')
 
 
-if cocotb.SIM_NAME:
+def select_test(dut):
+    # test coroutine and options for a parameter set
+    if dut.LFSR_POLY.value == 0x4c11db7:
+        return run_test_crc, {'ref_crc': crc32}
 
-    if cocotb.top.LFSR_POLY.value == 0x4c11db7:
-        factory = TestFactory(run_test_crc)
-        factory.add_option("ref_crc", [crc32])
-        factory.generate_tests()
+    if dut.LFSR_POLY.value == 0x1edc6f41:
+        return run_test_crc, {'ref_crc': crc32c}
 
-    if cocotb.top.LFSR_POLY.value == 0x1edc6f41:
-        factory = TestFactory(run_test_crc)
-        factory.add_option("ref_crc", [crc32c])
-        factory.generate_tests()
+    if dut.LFSR_POLY.value == 0x021:
+        return run_test_prbs, {'ref_prbs': prbs9}
 
-    if cocotb.top.LFSR_POLY.value == 0x021:
-        factory = TestFactory(run_test_prbs)
-        factory.add_option("ref_prbs", [prbs9])
-        factory.generate_tests()
+    if dut.LFSR_POLY.value == 0x10000001:
+        return run_test_prbs, {'ref_prbs': prbs31}
+
+    return None, {}
 
-    if cocotb.top.LFSR_POLY.value == 0x10000001:
-        factory = TestFactory(run_test_prbs)
-        factory.add_option("ref_prbs", [prbs31])
+
+if cocotb.SIM_NAME:
+
+    test, options = multi_top.select_test(cocotb.top, select_test)
+
+    if test is not None:
+        factory = TestFactory(test)
+        for name, val in options.items():
+            factory.add_option(name, [val])
         factory.generate_tests()
 
 
@@ -192,24 +223,87 @@ tests_dir = os.path.abspath(os.path.dirname(__file__))
 rtl_dir = os.path.abspath(os.path.join(tests_dir, '..', '..', 'rtl'))
 
 
+lfsr_params = [
+    (32, "32'h4c11db7", "GALOIS", 1, 8),
+    (32, "32'h4c11db7", "GALOIS", 1, 64),
+    (32, "32'h1edc6f41", "GALOIS", 1, 8),
+    (32, "32'h1edc6f41", "GALOIS", 1, 64),
+    (9,  "9'h021", "FIBONACCI", 0, 8),
+    (9,  "9'h021", "FIBONACCI", 0, 64),
+    (31, "31'h10000001", "FIBONACCI", 0, 8),
+    (31, "31'h10000001", "FIBONACCI", 0, 64),
+]
+
+
+@pytest.mark.skipif(multi_top.enabled, reason="covered by test_lfsr_multi")
+@pytest.mark.parametrize("sim", sim_cache.simulators)
 @pytest.mark.parametrize("style", ["AUTO", "LOOP"])
+@pytest.mark.parametrize(("lfsr_width", "lfsr_poly", "lfsr_config", "reverse", "data_width"), lfsr_params)
+def test_lfsr(request, lfsr_width, lfsr_poly, lfsr_config, reverse, data_width, style, sim):
+    dut = "lfsr"
+    module = os.path.splitext(os.path.basename(__file__))[0]
+    toplevel = dut
+
+    verilog_sources = [
+        os.path.join(rtl_dir, f"{dut}.v"),
+    ]
+
+    parameters = {}
+
+    parameters['LFSR_WIDTH'] = lfsr_width
+    parameters['LFSR_POLY'] = lfsr_poly
+    parameters['LFSR_CONFIG'] = f'"{lfsr_config}"'
+    parameters['LFSR_FEED_FORWARD'] = 0
+    parameters['REVERSE'] = reverse
+    parameters['DATA_WIDTH'] = data_width
+    parameters['STYLE'] = f'"{style}"'
+
+    extra_env = {f'PARAM_{k}': str(v) for k, v in parameters.items()}
+
+    sim_build = os.path.join(tests_dir, "sim_build",
+        request.node.name.replace('[', '-').replace(']', ''))
+
+    sim_cache.run(
+        simulator=sim,
+        python_search=[tests_dir],
+        verilog_sources=verilog_sources,
+        toplevel=toplevel,
+        module=module,
+        parameters=parameters,
+        sim_build=sim_build,
+        extra_env=extra_env,
+    )
+
+
+@pytest.mark.skipif(not multi_top.enabled, reason="SIM_MULTI not set")
+@pytest.mark.parametrize("sim", sim_cache.simulators)
+def test_lfsr_multi(request, sim):
+    # all parameter sets in one simulation
+    multi_top.run_tests("lfsr", ['LFSR_WIDTH', 'LFSR_POLY', 'LFSR_CONFIG', 'REVERSE', 'DATA_WIDTH'], lfsr_params, ["AUTO", "LOOP"], tests_dir, request, sim)
+
+
+@pytest.mark.parametrize("generator", [lfsr_flat, lfsr_cse], ids=["flat", "cse"])
 @pytest.mark.parametrize(("lfsr_width", "lfsr_poly", "lfsr_config", "reverse", "data_width"), [
-            (32, "32'h4c11db7", "GALOIS", 1, 8),
             (32, "32'h4c11db7", "GALOIS", 1, 64),
-            (32, "32'h1edc6f41", "GALOIS", 1, 8),
             (32, "32'h1edc6f41", "GALOIS", 1, 64),
-            (9,  "9'h021", "FIBONACCI", 0, 8),
             (9,  "9'h021", "FIBONACCI", 0, 64),
-            (31, "31'h10000001", "FIBONACCI", 0, 8),
             (31, "31'h10000001", "FIBONACCI", 0, 64),
         ])
-def test_lfsr(request, lfsr_width, lfsr_poly, lfsr_config, reverse, data_width, style):
+def test_lfsr_flat(request, lfsr_width, lfsr_poly, lfsr_config, reverse, data_width, generator):
     dut = "lfsr"
     module = os.path.splitext(os.path.basename(__file__))[0]
     toplevel = dut
 
+    sim_build = os.path.join(tests_dir, "sim_build",
+        request.node.name.replace('[', '-').replace(']', ''))
+
+    os.makedirs(sim_build, exist_ok=True)
+    flat_src = os.path.join(sim_build, f"{generator.__name__}.v")
+    generator.generate(lfsr_width, int(lfsr_poly.split("'h")[1], 16), lfsr_config, 0, reverse, data_width,
+        output=flat_src)
+
     verilog_sources = [
-        os.path.join(rtl_dir, f"{dut}.v"),
+        flat_src,
     ]
 
     parameters = {}
@@ -220,14 +314,10 @@ def test_lfsr(request, lfsr_width, lfsr_poly, lfsr_config, reverse, data_width,
     parameters['LFSR_FEED_FORWARD'] = 0
     parameters['REVERSE'] = reverse
     parameters['DATA_WIDTH'] = data_width
-    parameters['STYLE'] = f'"{style}"'
 
     extra_env = {f'PARAM_{k}': str(v) for k, v in parameters.items()}
 
-    sim_build = os.path.join(tests_dir, "sim_build",
-        request.node.name.replace('[', '-').replace(']', ''))
-
-    cocotb_test.simulator.run(
+    sim_cache.run(
         python_search=[tests_dir],
         verilog_sources=verilog_sources,
         toplevel=toplevel,
@@ -236,3 +326,183 @@ def test_lfsr(request, lfsr_width, lfsr_poly, lfsr_config, reverse, data_width,
         sim_build=sim_build,
         extra_env=extra_env,
     )
+
+
+@pytest.mark.parametrize("data_width", [1, 8, 64, 72])
+@pytest.mark.parametrize(("lfsr_width", "lfsr_poly", "lfsr_config", "reverse", "ref"), [
+            (32, 0x4c11db7, "GALOIS", 1, crc32),
+            (32, 0x1edc6f41, "GALOIS", 1, crc32c),
+            (9,  0x021, "FIBONACCI", 0, prbs9),
+            (31, 0x10000001, "FIBONACCI", 0, prbs31),
+        ])
+def test_lfsr_model(lfsr_width, lfsr_poly, lfsr_config, reverse, ref, data_width):
+    lfsr = Lfsr(lfsr_width, lfsr_poly, lfsr_config, 0, reverse, data_width)
+    lfsr_ff = Lfsr(lfsr_width, lfsr_poly, lfsr_config, 1, reverse, data_width)
+
+    state_mask = 2**lfsr_width-1
+    data_mask = 2**data_width-1
+
+    block = bytes(itertools.islice(itertools.cycle(range(256)), 72*8))
+    bits = int.from_bytes(block, 'little' if reverse else 'big')
+    words = [(bits >> k) & data_mask for k in range(0, len(block)*8, data_width)]
+    if not reverse:
+        words.reverse()
+
+    if ref in (crc32, crc32c):
+        state = state_mask
+        for w in words:
+            data, state = lfsr.step(w, state)
+        assert ~state & state_mask == ref(block)
+    else:
+        state = state_mask
+        val = 0
+        for k in range(len(block)*8 // data_width):
+            data, state = lfsr.step(0, state)
+            val = (val << data_width) | (~data & data_mask)
+        assert val == int.from_bytes(bytes(itertools.islice(ref(), len(block))), 'big')
+
+    # feed-forward LFSR undoes feedback LFSR
+    state = state_mask
+    state_ff = state_mask
+    for w in words:
+        data, state = lfsr.step(w, state)
+        data, state_ff = lfsr_ff.step(data, state_ff)
+        assert data == w
+
+
+@pytest.mark.parametrize(("lfsr_width", "lfsr_poly", "ref"), [
+            (9,  0x021, prbs9),
+            (31, 0x10000001, prbs31),
+        ])
+def test_lfsr_jump(lfsr_width, lfsr_poly, ref):
+    lfsr = Lfsr(lfsr_width, lfsr_poly, "FIBONACCI", 0, 0, 8)
+
+    init = 2**lfsr_width-1
+    period = 2**lfsr_width-1
+
+    stream = bytes(itertools.islice(ref(init), 1024))
+
+    # seek into the byte stream
+    for offset in [0, 1, 17, 500, 1000]:
+        state = lfsr.jump(init, offset*8)
+        assert bytes(itertools.islice(ref(state), 24)) == stream[offset:offset+24]
+        assert lfsr.jump(state, -offset*8) == init
+
+    # maximal length sequence
+    assert lfsr.jump(init, period) == init
+    assert lfsr.jump(init, 10**12 % period) == lfsr.jump(init, 10**12)
+    assert lfsr.jump(lfsr.jump(init, 10**12), -10**12) == init
+
+
+def test_gf2_poly():
+    # x^2 + x + 1
+    assert gf2_poly_mulmod(0b10, 0b11, 0b111) == 1
+    assert gf2_poly_powmod(0b10, 3, 0b111) == 1
+
+    for width in [2, 6, 23, 31, 32, 48, 64]:
+        factors = mersenne_factors(width)
+        assert math.prod(p**e for p, e in factors.items()) == 2**width-1
+        assert all(pow(2, p-1, p) == 1 for p in factors)
+
+    assert mersenne_factors(31) == {2**31-1: 1}
+    assert mersenne_factors(6) == {3: 2, 7: 1}
+
+
+@pytest.mark.parametrize(("lfsr_width", "lfsr_poly", "lfsr_config", "lfsr_feed_forward", "data_width"), [
+            (32, 0x4c11db7, "GALOIS", 0, 64),
+            (32, 0x1edc6f41, "GALOIS", 0, 128),
+            (31, 0x10000001, "FIBONACCI", 0, 64),
+            (58, 0x8000000001, "FIBONACCI", 1, 64),
+        ])
+def test_lfsr_cse_model(lfsr_width, lfsr_poly, lfsr_config, lfsr_feed_forward, data_width):
+    masks = lfsr_masks(lfsr_width, lfsr_poly, lfsr_config, lfsr_feed_forward, 1, data_width)
+    net = lfsr_cse.XorNetwork(masks, lfsr_width+data_width).optimize()
+
+    gates, depth = net.stats()
+    assert gates <= lfsr_cse.flat_stats(masks)[0]
+
+    for k in range(64):
+        inputs = random.getrandbits(lfsr_width+data_width)
+        ref = sum((popcount(m & inputs) & 1) << n for n, m in enumerate(masks))
+        assert net.evaluate(inputs) == ref
+
+
+@pytest.mark.parametrize("style", ["AUTO", "LOOP"])
+def test_lfsr_matrix(request, style):
+    work_dir = os.path.join(tests_dir, "sim_build",
+        request.node.name.replace('[', '-').replace(']', ''))
+
+    # all parameter sets, with and without LFSR_FEED_FORWARD, in one simulation
+    samples = []
+    for (lfsr_width, lfsr_poly, lfsr_config, reverse, data_width), feed_forward in itertools.product(lfsr_params, [0, 1]):
+        samples.append({'lfsr_width': lfsr_width, 'lfsr_poly': int(lfsr_poly.split("'h")[1], 16),
+            'lfsr_config': lfsr_config, 'lfsr_feed_forward': feed_forward, 'reverse': reverse,
+            'data_width': data_width, 'style': style})
+
+    results = lfsr_fuzz.run_samples(samples, work_dir=work_dir)
+
+    failed = [(p, res) for p, res in zip(samples, results) if res]
+    assert not failed, f"{len(failed)} parameter sets differ, first: {failed[0][0]}: {failed[0][1]}"
+
+
+def test_lfsr_equiv_matrix():
+    lfsr_width, data_width = 9, 12
+    masks = lfsr_masks(lfsr_width, 0x021, "FIBONACCI", 0, 1, data_width)
+    outputs = [('data_out', data_width), ('state_out', lfsr_width)]
+
+    # responses of an ideal lfsr instance to the unit vectors, packed {data_out, state_out}
+    words = []
+    for vec in lfsr_equiv.stimulus(lfsr_width, data_width):
+        words.append(sum((popcount(m & vec) & 1) << n for n, m in enumerate(masks)))
+
+    resp = lfsr_equiv.unpack_response(outputs, words)
+    extracted = lfsr_equiv.response_matrix(resp['state_out'], resp['data_out'], lfsr_width, data_width)
+    assert lfsr_equiv.compare_masks(extracted, masks, lfsr_width) == []
+
+    extracted[lfsr_width+3] ^= 1 << 5
+    assert lfsr_equiv.compare_masks(extracted, masks, lfsr_width) == [
+        ("data_out[3]", masks[lfsr_width+3] ^ (1 << 5), masks[lfsr_width+3])]
+
+    with pytest.raises(ValueError):
+        lfsr_equiv.response_matrix([1]+resp['state_out'][1:], resp['data_out'], lfsr_width, data_width)
+
+
+def test_lfsr_fuzz(request):
+    seed = lfsr_fuzz.env_seed()
+    work_dir = os.path.join(tests_dir, "sim_build", request.node.name)
+    os.makedirs(work_dir, exist_ok=True)
+    # keep the corpus out of the source tree unless requested
+    corpus = os.environ.get("LFSR_FUZZ_CORPUS", os.path.join(work_dir, "lfsr_fuzz_corpus.txt"))
+
+    failed = lfsr_fuzz.fuzz(range(seed, seed+lfsr_fuzz.count), corpus=corpus, work_dir=work_dir,
+        log=logging.getLogger().info)
+
+    assert not failed, f"Failing seeds from {seed} (added to {corpus}): {sorted(failed)}"
+
+
+def test_lfsr_fuzz_model(tmp_path):
+    seeds = list(range(100, 108))
+    samples = [lfsr_fuzz.sample(seed) for seed in seeds]
+    assert samples == [lfsr_fuzz.sample(seed) for seed in seeds]
+
+    lfsr_fuzz.generate(samples, "resp.txt", str(tmp_path / "lfsr_fuzz.v"))
+    assert (tmp_path / "lfsr_fuzz.v").read_text().count("lfsr #(") == len(seeds)
+
+    # responses of ideal lfsr instances
+    with open(tmp_path / "resp.txt", 'w') as f:
+        for k, p in enumerate(samples):
+            masks = lfsr_masks(p['lfsr_width'], p['lfsr_poly'], p['lfsr_config'], p['lfsr_feed_forward'],
+                p['reverse'], p['data_width'])
+            for n, vec in enumerate(lfsr_equiv.stimulus(p['lfsr_width'], p['data_width'])):
+                out = sum((popcount(m & vec) & 1) << i for i, m in enumerate(masks))
+                f.write(f"{k} {n} {out:x}\n")
+
+    resp = lfsr_fuzz.read_response(tmp_path / "resp.txt", samples)
+    assert all(lfsr_fuzz.check_response(p, outs) == [] for p, outs in zip(samples, resp))
+    resp[0][1] ^= 1 << samples[0]['lfsr_width']
+    assert lfsr_fuzz.check_response(samples[0], resp[0])[0][0] == "data_out[0]"
+
+    corpus = str(tmp_path / "corpus.txt")
+    lfsr_fuzz.add_corpus([5, 3], corpus)
+    lfsr_fuzz.add_corpus([3, 7], corpus)
+    assert lfsr_fuzz.read_corpus(corpus) == [5, 3, 7]
@@ -0,0 +1 @@
+../crc_hd.py
\ No newline at end of file
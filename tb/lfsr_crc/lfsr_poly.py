@@ -0,0 +1 @@
+../lfsr_poly.py
\ No newline at end of file
@@ -23,19 +23,42 @@ THE SOFTWARE.
 
 """
 
+import functools
 import itertools
 import logging
+import operator
 import os
+import random
+import sys
 import zlib
 
 import pytest
-import cocotb_test.simulator
 
 import cocotb
 from cocotb.clock import Clock
 from cocotb.triggers import RisingEdge
 from cocotb.regression import TestFactory
 
+try:
+    from crc_engine import Crc, crc_file
+    import crc_hd
+    import cycle_model
+    import multi_top
+    import sim_cache
+    import vector_harness
+except ImportError:
+    # attempt import from current directory
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+    try:
+        from crc_engine import Crc, crc_file
+        import crc_hd
+        import cycle_model
+        import multi_top
+        import sim_cache
+        import vector_harness
+    finally:
+        del sys.path[0]
+
 
 class TB:
     def __init__(self, dut):
@@ -69,7 +92,7 @@ def crc32(data):
     return zlib.crc32(data) & 0xffffffff
 
 
-def crc32c(data, crc=0xffffffff, poly=0x82f63b78):
+def crc32c_bitwise(data, crc=0xffffffff, poly=0x82f63b78):
     for d in data:
         crc = crc ^ d
         for bit in range(0, 8):
@@ -80,6 +103,9 @@ def crc32c(data, crc=0xffffffff, poly=0x82f63b78):
     return ~crc & 0xffffffff
 
 
+crc32c = Crc(width=32, poly=0x1edc6f41, init=0xffffffff, reverse=True, invert=True)
+
+
 async def run_test_crc(dut, ref_crc):
 
     data_width = len(dut.data_in)
@@ -126,16 +152,25 @@ async def run_test_crc(dut, ref_crc):
     await RisingEdge(dut.clk)
 
 
+def select_test(dut):
+    # test coroutine and options for a parameter set
+    if dut.LFSR_POLY.value == 0x4c11db7:
+        return run_test_crc, {'ref_crc': crc32}
+
+    if dut.LFSR_POLY.value == 0x1edc6f41:
+        return run_test_crc, {'ref_crc': crc32c}
+
+    return None, {}
+
+
 if cocotb.SIM_NAME:
 
-    if cocotb.top.LFSR_POLY.value == 0x4c11db7:
-        factory = TestFactory(run_test_crc)
-        factory.add_option("ref_crc", [crc32])
-        factory.generate_tests()
+    test, options = multi_top.select_test(cocotb.top, select_test)
 
-    if cocotb.top.LFSR_POLY.value == 0x1edc6f41:
-        factory = TestFactory(run_test_crc)
-        factory.add_option("ref_crc", [crc32c])
+    if test is not None:
+        factory = TestFactory(test)
+        for name, val in options.items():
+            factory.add_option(name, [val])
         factory.generate_tests()
 
 
@@ -145,14 +180,19 @@ tests_dir = os.path.abspath(os.path.dirname(__file__))
 rtl_dir = os.path.abspath(os.path.join(tests_dir, '..', '..', 'rtl'))
 
 
+lfsr_crc_params = [
+    (32, "32'h4c11db7", "32'hffffffff", "GALOIS", 1, 1, 8),
+    (32, "32'h4c11db7", "32'hffffffff", "GALOIS", 1, 1, 64),
+    (32, "32'h1edc6f41", "32'hffffffff", "GALOIS", 1, 1, 8),
+    (32, "32'h1edc6f41", "32'hffffffff", "GALOIS", 1, 1, 64),
+]
+
+
+@pytest.mark.skipif(multi_top.enabled, reason="covered by test_lfsr_crc_multi")
+@pytest.mark.parametrize("sim", sim_cache.simulators)
 @pytest.mark.parametrize("style", ["AUTO", "LOOP"])
-@pytest.mark.parametrize(("lfsr_width", "lfsr_poly", "lfsr_init", "lfsr_config", "reverse", "invert", "data_width"), [
-            (32, "32'h4c11db7", "32'hffffffff", "GALOIS", 1, 1, 8),
-            (32, "32'h4c11db7", "32'hffffffff", "GALOIS", 1, 1, 64),
-            (32, "32'h1edc6f41", "32'hffffffff", "GALOIS", 1, 1, 8),
-            (32, "32'h1edc6f41", "32'hffffffff", "GALOIS", 1, 1, 64),
-        ])
-def test_lfsr_crc(request, lfsr_width, lfsr_poly, lfsr_init, lfsr_config, reverse, invert, data_width, style):
+@pytest.mark.parametrize(("lfsr_width", "lfsr_poly", "lfsr_init", "lfsr_config", "reverse", "invert", "data_width"), lfsr_crc_params)
+def test_lfsr_crc(request, lfsr_width, lfsr_poly, lfsr_init, lfsr_config, reverse, invert, data_width, style, sim):
     dut = "lfsr_crc"
     module = os.path.splitext(os.path.basename(__file__))[0]
     toplevel = dut
@@ -178,7 +218,8 @@ def test_lfsr_crc(request, lfsr_width, lfsr_poly, lfsr_init, lfsr_config, revers
     sim_build = os.path.join(tests_dir, "sim_build",
         request.node.name.replace('[', '-').replace(']', ''))
 
-    cocotb_test.simulator.run(
+    sim_cache.run(
+        simulator=sim,
         python_search=[tests_dir],
         verilog_sources=verilog_sources,
         toplevel=toplevel,
@@ -187,3 +228,164 @@ def test_lfsr_crc(request, lfsr_width, lfsr_poly, lfsr_init, lfsr_config, revers
         sim_build=sim_build,
         extra_env=extra_env,
     )
+
+
+@pytest.mark.skipif(not multi_top.enabled, reason="SIM_MULTI not set")
+@pytest.mark.parametrize("sim", sim_cache.simulators)
+def test_lfsr_crc_multi(request, sim):
+    # all parameter sets in one simulation
+    multi_top.run_tests("lfsr_crc", ['LFSR_WIDTH', 'LFSR_POLY', 'LFSR_INIT', 'LFSR_CONFIG', 'REVERSE', 'INVERT', 'DATA_WIDTH'], lfsr_crc_params, ["AUTO", "LOOP"], tests_dir, request, sim)
+
+
+@pytest.mark.parametrize(("lfsr_width", "lfsr_poly", "lfsr_init", "lfsr_config", "reverse", "invert", "data_width"), lfsr_crc_params)
+def test_lfsr_crc_model(lfsr_width, lfsr_poly, lfsr_init, lfsr_config, reverse, invert, data_width):
+    dut = cycle_model.LfsrCrc(LFSR_WIDTH=lfsr_width, LFSR_POLY=lfsr_poly, LFSR_INIT=lfsr_init,
+        LFSR_CONFIG=lfsr_config, REVERSE=reverse, INVERT=invert, DATA_WIDTH=data_width)
+
+    # run the cocotb test against the cycle model, without a simulator
+    test, options = select_test(dut)
+    cycle_model.run(test, dut, **options)
+
+
+@pytest.mark.parametrize(("lfsr_width", "lfsr_poly", "lfsr_init", "lfsr_config", "reverse", "invert", "data_width"), lfsr_crc_params)
+def test_lfsr_crc_vectors(request, lfsr_width, lfsr_poly, lfsr_init, lfsr_config, reverse, invert, data_width):
+    dut = "lfsr_crc"
+    module = "vector_harness"
+    cycles = vector_harness.cycles
+
+    verilog_sources = [
+        os.path.join(rtl_dir, f"{dut}.v"),
+        os.path.join(rtl_dir, "lfsr.v"),
+    ]
+
+    parameters = {}
+
+    parameters['LFSR_WIDTH'] = lfsr_width
+    parameters['LFSR_POLY'] = lfsr_poly
+    parameters['LFSR_INIT'] = lfsr_init
+    parameters['LFSR_CONFIG'] = f'"{lfsr_config}"'
+    parameters['REVERSE'] = reverse
+    parameters['INVERT'] = invert
+    parameters['DATA_WIDTH'] = data_width
+
+    sim_build = os.path.join(tests_dir, "sim_build",
+        request.node.name.replace('[', '-').replace(']', ''))
+
+    os.makedirs(sim_build, exist_ok=True)
+    stim_file = os.path.join(sim_build, "stim.memh")
+    resp_file = os.path.join(sim_build, "resp.memh")
+    harness_src = os.path.join(sim_build, f"{dut}_vectors.v")
+
+    toplevel, inputs, outputs = vector_harness.generate(dut, verilog_sources[0], parameters, cycles,
+        stim_file, resp_file, harness_src)
+
+    # reset for two cycles, then random data with gaps in data_in_valid
+    rng = random.Random(data_width)
+    rst = [1, 1] + [0]*(cycles-2)
+    data = [rng.getrandbits(data_width) for k in range(cycles)]
+    valid = [0, 0] + [int(rng.random() < 0.9) for k in range(cycles-2)]
+    vector_harness.write_memh(stim_file,
+        vector_harness.pack(inputs, {'rst': rst, 'data_in': data, 'data_in_valid': valid}, cycles),
+        sum(w for p, w in inputs))
+
+    # output during cycle i reflects data up to cycle i-1
+    crc = Crc(lfsr_width, int(lfsr_poly.split("'h")[1], 16), int(lfsr_init.split("'h")[1], 16), reverse, invert)
+    state = crc.init
+    val = 0
+    expected = []
+    for d, v in zip(data, valid):
+        expected.append(val)
+        if v:
+            state = crc.update(d.to_bytes(data_width // 8, 'little'), state)
+            val = crc.finalize(state)
+
+    sim_cache.run(
+        python_search=[tests_dir],
+        verilog_sources=[harness_src]+verilog_sources,
+        toplevel=toplevel,
+        module=module,
+        sim_build=sim_build,
+    )
+
+    vals, invalid = vector_harness.read_memh(resp_file, lfsr_width)
+    vector_harness.compare(expected, vals, invalid, name="crc_out")
+
+
+@pytest.mark.parametrize("slices", [1, 4, 8, 16])
+def test_crc_engine(slices):
+    block = bytes(itertools.islice(itertools.cycle(range(256)), 1024))
+
+    crc32_engine = Crc(width=32, poly=0x04c11db7, init=0xffffffff, reverse=True, invert=True, slices=slices)
+    crc32c_engine = Crc(width=32, poly=0x1edc6f41, init=0xffffffff, reverse=True, invert=True, slices=slices)
+
+    for n in list(range(64)) + [1023, 1024]:
+        assert crc32_engine(block[:n]) == crc32(block[:n])
+        assert crc32c_engine(block[:n]) == crc32c_bitwise(block[:n])
+
+    # incremental update across word boundaries
+    state = crc32c_engine.init
+    for k in range(0, len(block), 7):
+        state = crc32c_engine.update(block[k:k+7], state)
+    assert crc32c_engine.finalize(state) == crc32c_bitwise(block)
+
+
+@pytest.mark.parametrize(("width", "poly", "init", "reverse", "invert"), [
+            (32, 0x04c11db7, 0xffffffff, 1, 1),
+            (32, 0x1edc6f41, 0xffffffff, 1, 1),
+            (16, 0x8005, 0xffff, 1, 0),
+            (16, 0x1021, 0x1d0f, 0, 0),
+            (5, 0x05, 0x1f, 0, 1),
+        ])
+def test_crc_combine(tmp_path, width, poly, init, reverse, invert):
+    crc = Crc(width, poly, init, reverse, invert)
+
+    block = bytes(itertools.islice(itertools.cycle(range(251)), 100000))
+
+    for a, b in [(0, 0), (0, 10), (10, 0), (1, 1), (100, 3), (1000, 65536)]:
+        assert crc.combine(crc(block[:a]), crc(block[a:a+b]), b) == crc(block[:a+b])
+
+    path = tmp_path / "data.bin"
+    path.write_bytes(block)
+    assert crc_file(path, crc, workers=2, chunk_size=4096) == crc(block)
+
+
+def test_crc_hd(tmp_path):
+    # CRC32 profile from Koopman's tables: HD=6 to 268 bits, HD=5 to 2974 bits
+    res = crc_hd.analyze(32, 0x04c11db7, 3000)
+    assert res['koopman'] == 0x82608edb
+    assert res['profile'] == [[7, 171], [6, 268], [5, 2974], [4, 3000]]
+    assert res['params'] == {'LFSR_WIDTH': 32, 'LFSR_POLY': "32'h04c11db7", 'LFSR_CONFIG': "GALOIS"}
+
+    # x+1 divides CRC16-CCITT, so HD=4 up to the period
+    assert crc_hd.hd_lengths(16, 0x1021, 1024) == {4: 17}
+
+    # brute force over all patterns ending at the top bit
+    for width in [3, 5, 7]:
+        for poly in range(1, 2**width, 2):
+            f = (1 << width) | poly
+            syn = crc_hd.syndromes(f, width+16)
+            ref = {}
+            for w in range(2, 7):
+                for length in range(w, width+17):
+                    for c in itertools.combinations(syn[:length-1], w-1):
+                        if functools.reduce(operator.xor, c, syn[length-1]) == 0:
+                            ref[w] = length
+                            break
+                    if w in ref:
+                        break
+            lengths = crc_hd.hd_lengths(width, poly, 16)
+            for length in range(width+1, width+17):
+                assert (min([w for w, l in lengths.items() if l <= length], default=7) ==
+                    min([w for w, l in ref.items() if l <= length], default=7))
+
+    # checkpointed sweep, resumed with one result missing
+    polys = [0x07, 0x0b, 0x1d, 0x2f, 0x9b]
+    path = tmp_path / "sweep.jsonl"
+    res = list(crc_hd.sweep(8, polys, 64, jobs=2, checkpoint=path))
+    assert [r['lfsr_poly'] for r in res] == polys
+    assert res == [crc_hd.analyze(8, p, 64) for p in polys]
+
+    lines = path.read_text().splitlines()
+    path.write_text("\n".join(lines[:3] + [lines[3][:10]]))
+    assert list(crc_hd.sweep(8, polys, 64, jobs=1, checkpoint=path)) == res
+    assert len(path.read_text().splitlines()) == 6
@@ -0,0 +1 @@
+../multi_top.py
\ No newline at end of file
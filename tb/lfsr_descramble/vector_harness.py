@@ -0,0 +1 @@
+../vector_harness.py
\ No newline at end of file
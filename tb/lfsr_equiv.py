@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+"""
+
+Copyright (c) 2023 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import argparse
+import contextlib
+import os
+import subprocess
+import sys
+import tempfile
+
+try:
+    from lfsr_model import lfsr_masks
+    from multi_top import param_value
+    from sim_bench import compile_sim
+    import vector_harness
+except ImportError:
+    # attempt import from current directory
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+    try:
+        from lfsr_model import lfsr_masks
+        from multi_top import param_value
+        from sim_bench import compile_sim
+        import vector_harness
+    finally:
+        del sys.path[0]
+
+
+# Matrix-level equivalence check for the lfsr module.
+#
+# lfsr is linear over GF(2), so its function is fully determined by the mask
+# matrix: output n is the parity of the inputs selected by mask n.  The matrix
+# is extracted from a single compiled instance with the file-based harness from
+# vector_harness.py by driving the zero vector followed by each unit vector on
+# {data_in, state_in}.  The response to unit vector k is column k of the matrix,
+# and the response to the zero vector must be zero.  The extracted matrix is then
+# compared with lfsr_masks() in one step.
+#
+# The matrix uses the same layout as lfsr_masks(): masks 0 to LFSR_WIDTH-1 are
+# state_out, the rest data_out, with the state_in bits in the low LFSR_WIDTH bits
+# of each mask and the data_in bits above them.
+
+tb_dir = os.path.dirname(os.path.realpath(__file__))
+rtl_dir = os.path.abspath(os.path.join(tb_dir, '..', 'rtl'))
+
+
+def stimulus(lfsr_width, data_width):
+    # zero vector, then unit vectors (state_in bits first, then data_in bits)
+    return [0] + [1 << k for k in range(lfsr_width+data_width)]
+
+
+def pack_stimulus(inputs, vecs, lfsr_width):
+    # pack {data_in, state_in} vectors into harness stimulus words
+    state_mask = 2**lfsr_width-1
+    return vector_harness.pack(inputs, {
+        'state_in': [v & state_mask for v in vecs],
+        'data_in': [v >> lfsr_width for v in vecs],
+    }, len(vecs))
+
+
+def unpack_response(outputs, words):
+    # split packed response words into per-port values
+    ret = {p: [] for p, w in outputs}
+    for word in words:
+        word = int(word)
+        for p, w in reversed(outputs):
+            ret[p].append(word & (2**w-1))
+            word >>= w
+    return ret
+
+
+def response_matrix(state_out, data_out, lfsr_width, data_width):
+    # masks from the responses to the unit vectors, responses[0] is the zero vector
+    outs = [s | (d << lfsr_width) for s, d in zip(state_out, data_out)]
+    if outs[0]:
+        raise ValueError(f"Nonzero response to zero input: 0x{outs[0]:x}")
+
+    masks = [0]*(lfsr_width+data_width)
+    for k, out in enumerate(outs[1:]):
+        for n in range(lfsr_width+data_width):
+            if (out >> n) & 1:
+                masks[n] |= 1 << k
+    return masks
+
+
+def compare_masks(masks, ref, lfsr_width):
+    # returns a list of (output name, mask, reference mask) for mismatched outputs
+    ret = []
+    for n, (m, r) in enumerate(zip(masks, ref)):
+        if m != r:
+            name = f"state_out[{n}]" if n < lfsr_width else f"data_out[{n-lfsr_width}]"
+            ret.append((name, m, r))
+    return ret
+
+
+def extract_matrix(params, sim="icarus", work_dir=None):
+    # compile and run one lfsr instance on the unit vectors, returns the mask matrix
+    lfsr_width = int(params['LFSR_WIDTH'])
+    data_width = int(params['DATA_WIDTH'])
+
+    if work_dir is None:
+        ctx = tempfile.TemporaryDirectory()
+    else:
+        os.makedirs(work_dir, exist_ok=True)
+        ctx = contextlib.nullcontext(work_dir)
+
+    with ctx as work_dir:
+        vecs = stimulus(lfsr_width, data_width)
+        stim_file = os.path.join(work_dir, "stim.memh")
+        resp_file = os.path.join(work_dir, "resp.memh")
+        harness_src = os.path.join(work_dir, "lfsr_vectors.v")
+        lfsr_src = os.path.join(rtl_dir, "lfsr.v")
+
+        toplevel, inputs, outputs = vector_harness.generate("lfsr", lfsr_src, params, len(vecs),
+            stim_file, resp_file, harness_src)
+
+        vector_harness.write_memh(stim_file, pack_stimulus(inputs, vecs, lfsr_width),
+            sum(w for p, w in inputs))
+
+        cmd, t = compile_sim(sim, toplevel, [harness_src, lfsr_src], work_dir)
+        subprocess.run(cmd + ["+finish"], cwd=work_dir, check=True, stdout=subprocess.DEVNULL)
+
+        words, invalid = vector_harness.read_memh(resp_file, sum(w for p, w in outputs))
+        if len(words) != len(vecs) or any(invalid):
+            raise ValueError(f"Invalid response: {len(words)} of {len(vecs)} lines, "
+                f"{sum(bool(x) for x in invalid)} with X/Z")
+
+    resp = unpack_response(outputs, words)
+    return response_matrix(resp['state_out'], resp['data_out'], lfsr_width, data_width)
+
+
+def check(lfsr_width=31, lfsr_poly=0x10000001, lfsr_config="FIBONACCI", lfsr_feed_forward=0,
+        reverse=0, data_width=8, style="AUTO", sim="icarus", work_dir=None):
+    # returns a list of mismatched outputs, empty if the RTL matches the model
+    params = {
+        'LFSR_WIDTH': lfsr_width,
+        'LFSR_POLY': f"{lfsr_width}'h{lfsr_poly:x}",
+        'LFSR_CONFIG': f'"{lfsr_config}"',
+        'LFSR_FEED_FORWARD': int(bool(lfsr_feed_forward)),
+        'REVERSE': int(bool(reverse)),
+        'DATA_WIDTH': data_width,
+        'STYLE': f'"{style}"',
+    }
+
+    masks = extract_matrix(params, sim, work_dir)
+    ref = lfsr_masks(lfsr_width, lfsr_poly, lfsr_config, int(bool(lfsr_feed_forward)), int(bool(reverse)), data_width)
+    return compare_masks(masks, ref, lfsr_width)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Matrix-level equivalence check of lfsr.v against the Python model")
+    parser.add_argument('-w', '--lfsr-width', type=int, default=31, help="LFSR width")
+    parser.add_argument('-p', '--lfsr-poly', type=lambda x: param_value(x) if "'" in x else int(x, 0),
+        default=0x10000001, help="LFSR polynomial")
+    parser.add_argument('-c', '--lfsr-config', type=str, default="FIBONACCI", help="LFSR configuration (FIBONACCI or GALOIS)")
+    parser.add_argument('-f', '--lfsr-feed-forward', type=int, default=0, help="LFSR feed forward")
+    parser.add_argument('-r', '--reverse', type=int, default=0, help="bit-reverse input and output")
+    parser.add_argument('-d', '--data-width', type=int, default=8, help="data width")
+    parser.add_argument('-s', '--style', type=str, default="AUTO", help="implementation style")
+    parser.add_argument('--sim', type=str, default="icarus", help="simulator (icarus or verilator)")
+
+    args = parser.parse_args()
+
+    mismatches = check(**args.__dict__)
+
+    for name, m, r in mismatches:
+        print(f"{name}: 0x{m:x} (ref: 0x{r:x})")
+
+    if mismatches:
+        print(f"FAIL: {len(mismatches)} of {args.lfsr_width+args.data_width} outputs differ")
+        sys.exit(1)
+
+    print(f"PASS: {args.lfsr_width+args.data_width} outputs match")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+"""
+
+Copyright (c) 2023 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import argparse
+import contextlib
+import os
+import random
+import subprocess
+import sys
+import tempfile
+
+try:
+    from lfsr_model import lfsr_masks
+    from sim_bench import compile_sim
+    import lfsr_equiv
+except ImportError:
+    # attempt import from current directory
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+    try:
+        from lfsr_model import lfsr_masks
+        from sim_bench import compile_sim
+        import lfsr_equiv
+    finally:
+        del sys.path[0]
+
+
+# Randomized configuration fuzzer for the lfsr module.
+#
+# Each seed selects one parameter set: LFSR_WIDTH 2 to 64, a random polynomial
+# with the x^0 term set, LFSR_CONFIG, LFSR_FEED_FORWARD, REVERSE, DATA_WIDTH 1 to
+# 256, and STYLE.  A batch of sampled instances is compiled into one top-level
+# that drives the zero vector followed by the unit vectors into all instances in
+# parallel and writes the responses to a text file, one line per instance and
+# vector.  The mask matrix of each instance is rebuilt from its responses as in
+# lfsr_equiv.py and compared with lfsr_masks().
+#
+# If a batch fails to compile or run, its seeds are checked one at a time with
+# lfsr_equiv.check() so that the failing parameter set can be identified.
+#
+# Failing seeds are appended to a corpus file (one seed per line) and replayed
+# at the start of every run.
+#
+# Environment variables (for test_lfsr_fuzz):
+#
+# LFSR_FUZZ_COUNT   number of random seeds (default 64)
+# LFSR_FUZZ_SEED    first seed (default 0), or "random" for a random first seed
+# LFSR_FUZZ_CORPUS  corpus file (default lfsr_fuzz_corpus.txt in the test
+#                   sim_build directory, tb/lfsr_fuzz_corpus.txt for the
+#                   command line)
+
+tb_dir = os.path.dirname(os.path.realpath(__file__))
+rtl_dir = os.path.abspath(os.path.join(tb_dir, '..', 'rtl'))
+
+count = int(os.environ.get("LFSR_FUZZ_COUNT", 64))
+default_seed = 0
+
+corpus_file = os.environ.get("LFSR_FUZZ_CORPUS", os.path.join(tb_dir, "lfsr_fuzz_corpus.txt"))
+
+
+def env_seed():
+    # first seed from LFSR_FUZZ_SEED, fixed unless "random" is requested
+    seed = os.environ.get("LFSR_FUZZ_SEED")
+    if seed is None:
+        return default_seed
+    if seed == "random":
+        return random.getrandbits(32)
+    return int(seed)
+
+
+def sample(seed):
+    # parameter set for a seed
+    rng = random.Random(seed)
+    lfsr_width = rng.randint(2, 64)
+    return {
+        'lfsr_width': lfsr_width,
+        'lfsr_poly': rng.getrandbits(lfsr_width) | 1,
+        'lfsr_config': rng.choice(["GALOIS", "FIBONACCI"]),
+        'lfsr_feed_forward': rng.randint(0, 1),
+        'reverse': rng.randint(0, 1),
+        'data_width': rng.randint(1, 256),
+        'style': rng.choice(["AUTO", "LOOP", "REDUCTION"]),
+    }
+
+
+def verilog_params(p):
+    return {
+        'LFSR_WIDTH': p['lfsr_width'],
+        'LFSR_POLY': f"{p['lfsr_width']}'h{p['lfsr_poly']:x}",
+        'LFSR_CONFIG': f'"{p["lfsr_config"]}"',
+        'LFSR_FEED_FORWARD': p['lfsr_feed_forward'],
+        'REVERSE': p['reverse'],
+        'DATA_WIDTH': p['data_width'],
+        'STYLE': f'"{p["style"]}"',
+    }
+
+
+def generate(samples, resp_file, output, name="lfsr_fuzz"):
+    # top-level with one lfsr instance per parameter set
+    lines = []
+    drive = []
+    dump = []
+    for k, p in enumerate(samples):
+        w = p['lfsr_width']
+        n = w + p['data_width']
+
+        lines.append(f"// instance {k}")
+        lines.append(f"reg  [{n-1}:0] u{k}_in = 0;")
+        lines.append(f"wire [{n-1}:0] u{k}_out;")
+        lines.append("")
+        lines.append("lfsr #(")
+        lines.append(",\n".join(f"    .{name}({v})" for name, v in verilog_params(p).items()))
+        lines.append(")")
+        lines.append(f"u{k} (")
+        lines.append(f"    .data_in(u{k}_in[{n-1}:{w}]),")
+        lines.append(f"    .state_in(u{k}_in[{w-1}:0]),")
+        lines.append(f"    .data_out(u{k}_out[{n-1}:{w}]),")
+        lines.append(f"    .state_out(u{k}_out[{w-1}:0])")
+        lines.append(");")
+        lines.append("")
+
+        drive.append(f"        u{k}_in = (k > 0 && k <= {n}) ? {{{{{n-1}{{1'b0}}}}, 1'b1}} << (k-1) : {n}'d0;")
+        dump.append(f"        if (k <= {n}) $fwrite(fd, \"{k} %0d %h\\n\", k, u{k}_out);")
+
+    cycles = max(p['lfsr_width'] + p['data_width'] for p in samples) + 1
+
+    body = "\n".join(lines)
+    drive = "\n".join(drive)
+    dump = "\n".join(dump)
+
+    text = f"""// Language: Verilog 2001
+
+`resetall
+`timescale 1ns / 1ps
+`default_nettype none
+
+/*
+ * lfsr configuration fuzzer ({len(samples)} instances)
+ */
+module {name};
+
+integer k;
+integer fd;
+
+{body}
+initial begin
+    fd = $fopen("{resp_file}", "w");
+    for (k = 0; k < {cycles}; k = k + 1) begin
+{drive}
+        #1;
+{dump}
+    end
+    $fclose(fd);
+    $finish;
+end
+
+endmodule
+
+`resetall
+"""
+
+    with open(output, 'w') as f:
+        f.write(text)
+
+    return name
+
+
+def read_response(path, samples):
+    # returns the per-instance responses, indexed by vector
+    resp = [[None]*(p['lfsr_width']+p['data_width']+1) for p in samples]
+    with open(path) as f:
+        for line in f:
+            inst, vec, val = line.split()
+            resp[int(inst)][int(vec)] = int(val, 16)
+    return resp
+
+
+def check_response(p, outs):
+    # returns a list of mismatched outputs for one instance
+    w = p['lfsr_width']
+    if None in outs:
+        raise ValueError(f"Missing response for vector {outs.index(None)}")
+    masks = lfsr_equiv.response_matrix([v & (2**w-1) for v in outs], [v >> w for v in outs],
+        w, p['data_width'])
+    ref = lfsr_masks(w, p['lfsr_poly'], p['lfsr_config'], p['lfsr_feed_forward'], p['reverse'], p['data_width'])
+    return lfsr_equiv.compare_masks(masks, ref, w)
+
+
+def run_samples(samples, sim="icarus", work_dir=None):
+    # check parameter sets in one simulation, returns mismatches or exception per set
+    if work_dir is None:
+        ctx = tempfile.TemporaryDirectory()
+    else:
+        os.makedirs(work_dir, exist_ok=True)
+        ctx = contextlib.nullcontext(work_dir)
+
+    with ctx as work_dir:
+        resp_file = os.path.join(work_dir, "resp.txt")
+        top_src = os.path.join(work_dir, "lfsr_fuzz.v")
+
+        toplevel = generate(samples, resp_file, top_src)
+        cmd, t = compile_sim(sim, toplevel, [top_src, os.path.join(rtl_dir, "lfsr.v")], work_dir)
+        subprocess.run(cmd, cwd=work_dir, check=True, stdout=subprocess.DEVNULL)
+        resp = read_response(resp_file, samples)
+
+    ret = []
+    for p, outs in zip(samples, resp):
+        try:
+            ret.append(check_response(p, outs))
+        except ValueError as ex:
+            ret.append(ex)
+    return ret
+
+
+def run_batch(seeds, sim="icarus", work_dir=None):
+    # check a batch of seeds in one simulation, returns {seed: mismatches or exception}
+    try:
+        results = run_samples([sample(seed) for seed in seeds], sim, work_dir)
+    except subprocess.CalledProcessError:
+        if len(seeds) == 1:
+            raise
+        # isolate the failing parameter set
+        return {seed: run_single(seed, sim) for seed in seeds}
+    return dict(zip(seeds, results))
+
+
+def run_single(seed, sim="icarus"):
+    try:
+        return lfsr_equiv.check(sim=sim, **sample(seed))
+    except (subprocess.CalledProcessError, ValueError) as ex:
+        return ex
+
+
+def read_corpus(path=None):
+    if path is None:
+        path = corpus_file
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [int(line.split()[0]) for line in f if line.strip() and not line.startswith('#')]
+
+
+def add_corpus(seeds, path=None):
+    if path is None:
+        path = corpus_file
+    known = set(read_corpus(path))
+    with open(path, 'a') as f:
+        for seed in seeds:
+            if seed not in known:
+                p = sample(seed)
+                f.write(f"{seed} # {p['lfsr_width']}'h{p['lfsr_poly']:x} {p['lfsr_config']} "
+                    f"ff={p['lfsr_feed_forward']} rev={p['reverse']} dw={p['data_width']} {p['style']}\n")
+                known.add(seed)
+
+
+def fuzz(seeds, sim="icarus", batch_size=64, corpus=None, work_dir=None, log=print):
+    # replay the corpus, then check the seeds in batches; returns {seed: result} for failing seeds
+    known = read_corpus(corpus)
+    seeds = known + [s for s in seeds if s not in set(known)]
+
+    failed = {}
+    for k in range(0, len(seeds), batch_size):
+        batch = seeds[k:k+batch_size]
+        results = run_batch(batch, sim, work_dir)
+        for seed, res in results.items():
+            if res:
+                failed[seed] = res
+                log(f"FAIL seed {seed}: {sample(seed)}: {res if isinstance(res, Exception) else res[0]}")
+        log(f"Checked {k+len(batch)} of {len(seeds)} seeds, {len(failed)} failures")
+
+    if failed:
+        add_corpus(failed, corpus)
+
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Randomized configuration fuzzer for lfsr.v")
+    parser.add_argument('-n', '--count', type=int, default=count, help="number of random seeds")
+    parser.add_argument('-s', '--seed', type=int, help="first seed (default random)")
+    parser.add_argument('-b', '--batch-size', type=int, default=64, help="instances per simulation")
+    parser.add_argument('--sim', type=str, default="icarus", help="simulator (icarus or verilator)")
+    parser.add_argument('--corpus', type=str, default=corpus_file, help="failing seed corpus file")
+
+    args = parser.parse_args()
+
+    first = args.seed if args.seed is not None else random.getrandbits(32)
+    print(f"Seeds {first} to {first+args.count-1}")
+
+    failed = fuzz(range(first, first+args.count), args.sim, args.batch_size, args.corpus)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,502 @@
+#!/usr/bin/env python
+"""
+
+Copyright (c) 2023 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import functools
+import math
+
+
+# Python model of the lfsr module.
+#
+# lfsr_masks() is a port of the lfsr_mask() function in rtl/lfsr.v.  It computes the
+# bit masks for all state and data outputs in one pass and caches them per parameter
+# set.  Each mask is a bit-packed integer in the same format as lfsr_mask(), with the
+# state_in bits in the low LFSR_WIDTH bits and the data_in bits above them:
+#
+#   mask[n] = {data_mask, state_mask}
+#
+# Masks 0 to LFSR_WIDTH-1 select the inputs for state_out, masks LFSR_WIDTH to
+# LFSR_WIDTH+DATA_WIDTH-1 select the inputs for data_out.  Each output bit is the
+# parity of the selected input bits.
+#
+# With data_in tied to zero, the state update is a linear map over GF(2).  Lfsr.jump()
+# uses cached powers of the single-shift state matrix to advance or rewind a state by
+# any number of shifts in O(log N) matrix-vector products.
+#
+# The gf2_poly_*() functions implement arithmetic in GF(2)[x], and mersenne_factors()
+# returns the cached factorization of 2^n-1, the maximum period of an n-bit LFSR.
+# 2^n-1 is first split into its algebraic factors Phi_d(2) for each d dividing n,
+# which are factored separately with Pollard rho.  Rho finds prime factors up to
+# about 10^12 within its step limit (rho_limit), which covers every n up to 100.
+# Larger prime factors are taken from known_mersenne_factors (from the Cunningham
+# tables), which completes every n up to 168.  Above that, a width that needs a
+# factor missing from the table raises ValueError instead of running for hours.
+# Primality is checked with Miller-Rabin, which is deterministic below 3.3e24 and
+# a strong probable prime test above that.
+
+rho_limit = 1 << 22
+
+# prime factors of 2^n-1 out of reach of rho within rho_limit steps
+known_mersenne_factors = {
+    101: (7432339208719, 341117531003194129),
+    137: (32032215596496435569, 5439042183600204290159),
+    139: (5625767248687, 123876132205208335762278423601),
+    149: (86656268566282183151, 8235109336690846723986161),
+    157: (1654058017289, 2134387368610417),
+}
+
+
+try:
+    popcount = int.bit_count
+except AttributeError:
+    def popcount(val):
+        return bin(val).count('1')
+
+
+def reverse_bits(val, width):
+    return int(f"{val:0{width}b}"[::-1], 2) if width else 0
+
+
+@functools.lru_cache(maxsize=None)
+def lfsr_masks(lfsr_width=31, lfsr_poly=0x10000001, lfsr_config="FIBONACCI",
+        lfsr_feed_forward=0, reverse=0, data_width=8):
+
+    # init bit masks
+    lfsr_mask_state = [1 << i for i in range(lfsr_width)]
+    lfsr_mask_data = [0]*lfsr_width
+    output_mask_state = [1 << i if i < lfsr_width else 0 for i in range(data_width)]
+    output_mask_data = [0]*data_width
+
+    taps = [j for j in range(1, lfsr_width) if (lfsr_poly >> j) & 1]
+
+    # simulate shift register
+    if lfsr_config == "FIBONACCI":
+        # Fibonacci configuration
+        for k in range(data_width-1, -1, -1):
+            data_mask = 1 << k
+
+            # determine shift in value
+            # current value in last FF, XOR with input data bit (MSB first)
+            state_val = lfsr_mask_state[lfsr_width-1]
+            data_val = lfsr_mask_data[lfsr_width-1] ^ data_mask
+
+            # add XOR inputs from correct indicies
+            for j in taps:
+                state_val ^= lfsr_mask_state[j-1]
+                data_val ^= lfsr_mask_data[j-1]
+
+            # shift
+            lfsr_mask_state.insert(0, lfsr_mask_state.pop())
+            lfsr_mask_data.insert(0, lfsr_mask_data.pop())
+            output_mask_state.insert(0, output_mask_state.pop())
+            output_mask_data.insert(0, output_mask_data.pop())
+            output_mask_state[0] = state_val
+            output_mask_data[0] = data_val
+            if lfsr_feed_forward:
+                # only shift in new input data
+                state_val = 0
+                data_val = data_mask
+            lfsr_mask_state[0] = state_val
+            lfsr_mask_data[0] = data_val
+
+    elif lfsr_config == "GALOIS":
+        # Galois configuration
+        for k in range(data_width-1, -1, -1):
+            data_mask = 1 << k
+
+            # determine shift in value
+            # current value in last FF, XOR with input data bit (MSB first)
+            state_val = lfsr_mask_state[lfsr_width-1]
+            data_val = lfsr_mask_data[lfsr_width-1] ^ data_mask
+
+            # shift
+            lfsr_mask_state.insert(0, lfsr_mask_state.pop())
+            lfsr_mask_data.insert(0, lfsr_mask_data.pop())
+            output_mask_state.insert(0, output_mask_state.pop())
+            output_mask_data.insert(0, output_mask_data.pop())
+            output_mask_state[0] = state_val
+            output_mask_data[0] = data_val
+            if lfsr_feed_forward:
+                # only shift in new input data
+                state_val = 0
+                data_val = data_mask
+            lfsr_mask_state[0] = state_val
+            lfsr_mask_data[0] = data_val
+
+            # add XOR inputs at correct indicies
+            for j in taps:
+                lfsr_mask_state[j] ^= state_val
+                lfsr_mask_data[j] ^= data_val
+
+    else:
+        raise ValueError(f"Unknown configuration setting: {lfsr_config!r}")
+
+    masks = []
+
+    # reverse bits if selected
+    if reverse:
+        for n in range(lfsr_width):
+            state_val = reverse_bits(lfsr_mask_state[lfsr_width-n-1], lfsr_width)
+            data_val = reverse_bits(lfsr_mask_data[lfsr_width-n-1], data_width)
+            masks.append((data_val << lfsr_width) | state_val)
+        for n in range(data_width):
+            state_val = reverse_bits(output_mask_state[data_width-n-1], lfsr_width)
+            data_val = reverse_bits(output_mask_data[data_width-n-1], data_width)
+            masks.append((data_val << lfsr_width) | state_val)
+    else:
+        for n in range(lfsr_width):
+            masks.append((lfsr_mask_data[n] << lfsr_width) | lfsr_mask_state[n])
+        for n in range(data_width):
+            masks.append((output_mask_data[n] << lfsr_width) | output_mask_state[n])
+
+    return tuple(masks)
+
+
+def lfsr_mask(index, **kwargs):
+    return lfsr_masks(**kwargs)[index]
+
+
+# GF(2) matrices are stored as tuples of bit-packed rows, output bit n of a
+# matrix-vector product is the parity of row n ANDed with the vector
+
+def gf2_mat_identity(width):
+    return tuple(1 << i for i in range(width))
+
+
+def gf2_mat_mul(a, b):
+    res = []
+    for row in a:
+        val = 0
+        while row:
+            low = row & -row
+            val ^= b[low.bit_length()-1]
+            row ^= low
+        res.append(val)
+    return tuple(res)
+
+
+def gf2_mat_vec(a, vec):
+    val = 0
+    for n, row in enumerate(a):
+        val |= (popcount(row & vec) & 1) << n
+    return val
+
+
+def gf2_mat_pow(a, n):
+    res = gf2_mat_identity(len(a))
+    while n:
+        if n & 1:
+            res = gf2_mat_mul(res, a)
+        a = gf2_mat_mul(a, a)
+        n >>= 1
+    return res
+
+
+def gf2_mat_inv(a):
+    width = len(a)
+    # Gauss-Jordan elimination on [a | I]
+    rows = [(row << width) | (1 << n) for n, row in enumerate(a)]
+    for col in range(width):
+        bit = 1 << (col+width)
+        for k in range(col, width):
+            if rows[k] & bit:
+                break
+        else:
+            raise ValueError("Matrix is singular")
+        rows[col], rows[k] = rows[k], rows[col]
+        for k in range(width):
+            if k != col and rows[k] & bit:
+                rows[k] ^= rows[col]
+    mask = 2**width-1
+    return tuple(row & mask for row in rows)
+
+
+@functools.lru_cache(maxsize=None)
+def lfsr_shift_matrix(lfsr_width=31, lfsr_poly=0x10000001, lfsr_config="FIBONACCI",
+        reverse=0, k=0, inverse=False):
+    # state transition matrix for 2**k shifts with data_in tied to zero,
+    # or for 2**k shifts backwards if inverse is set
+    if k > 0:
+        a = lfsr_shift_matrix(lfsr_width, lfsr_poly, lfsr_config, reverse, k-1, inverse)
+        return gf2_mat_mul(a, a)
+
+    state_mask = 2**lfsr_width-1
+    masks = lfsr_masks(lfsr_width, lfsr_poly, lfsr_config, 0, reverse, 1)
+    a = tuple(m & state_mask for m in masks[:lfsr_width])
+    if inverse:
+        a = gf2_mat_inv(a)
+    return a
+
+
+def lfsr_jump_matrix(n, lfsr_width=31, lfsr_poly=0x10000001, lfsr_config="FIBONACCI", reverse=0):
+    # state transition matrix for n shifts with data_in tied to zero, negative n steps backwards
+    inverse = n < 0
+    n = abs(n)
+    res = gf2_mat_identity(lfsr_width)
+    k = 0
+    while n:
+        if n & 1:
+            res = gf2_mat_mul(res, lfsr_shift_matrix(lfsr_width, lfsr_poly, lfsr_config, reverse, k, inverse))
+        n >>= 1
+        k += 1
+    return res
+
+
+def lfsr_jump(state, n, lfsr_width=31, lfsr_poly=0x10000001, lfsr_config="FIBONACCI", reverse=0):
+    # advance state by n shifts with data_in tied to zero, negative n steps backwards
+    inverse = n < 0
+    n = abs(n)
+    k = 0
+    while n:
+        if n & 1:
+            state = gf2_mat_vec(lfsr_shift_matrix(lfsr_width, lfsr_poly, lfsr_config, reverse, k, inverse), state)
+        n >>= 1
+        k += 1
+    return state
+
+
+# GF(2) polynomials are stored as bit-packed integers, bit i is the coefficient of x^i
+
+def gf2_poly_mul(a, b):
+    res = 0
+    while b:
+        low = b & -b
+        res ^= a << (low.bit_length()-1)
+        b ^= low
+    return res
+
+
+def gf2_poly_mod(a, m):
+    deg = m.bit_length()-1
+    while a.bit_length() > deg:
+        a ^= m << (a.bit_length()-1-deg)
+    return a
+
+
+def gf2_poly_divmod(a, m):
+    deg = m.bit_length()-1
+    q = 0
+    while a.bit_length() > deg:
+        shift = a.bit_length()-1-deg
+        q |= 1 << shift
+        a ^= m << shift
+    return q, a
+
+
+def gf2_poly_gcd(a, b):
+    while b:
+        a, b = b, gf2_poly_mod(a, b)
+    return a
+
+
+def gf2_poly_mulmod(a, b, m):
+    return gf2_poly_mod(gf2_poly_mul(a, b), m)
+
+
+def gf2_poly_powmod(a, n, m):
+    res = 1
+    a = gf2_poly_mod(a, m)
+    while n:
+        if n & 1:
+            res = gf2_poly_mulmod(res, a, m)
+        a = gf2_poly_mulmod(a, a, m)
+        n >>= 1
+    return gf2_poly_mod(res, m)
+
+
+def is_prime(n):
+    # Miller-Rabin with the first 13 prime bases: deterministic for n < 3.3e24, a
+    # strong probable prime test above that
+    if n < 2:
+        return False
+    bases = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)
+    for p in bases:
+        if n % p == 0:
+            return n == p
+    d = n-1
+    s = 0
+    while d % 2 == 0:
+        d //= 2
+        s += 1
+    for a in bases:
+        x = pow(a, d, n)
+        if x in (1, n-1):
+            continue
+        for r in range(s-1):
+            x = x*x % n
+            if x == n-1:
+                break
+        else:
+            return False
+    return True
+
+
+def pollard_rho(n, limit=None):
+    # nontrivial factor of composite n (Brent's variant), None after about limit steps
+    if limit is None:
+        limit = rho_limit
+    for c in range(1, 16):
+        y = 2
+        x = ys = y
+        q = 1
+        g = 1
+        r = 1
+        steps = 0
+        while g == 1:
+            x = y
+            for i in range(r):
+                y = (y*y+c) % n
+            k = 0
+            while k < r and g == 1:
+                ys = y
+                for i in range(min(128, r-k)):
+                    y = (y*y+c) % n
+                    q = q*abs(x-y) % n
+                g = math.gcd(q, n)
+                k += 128
+            steps += r
+            r *= 2
+            if g == 1 and steps > limit:
+                return None
+        if g == n:
+            # the batched product hit n, repeat the last batch one step at a time
+            g = 1
+            while g == 1:
+                ys = (ys*ys+c) % n
+                g = math.gcd(abs(x-ys), n)
+        if g != n:
+            return g
+    return None
+
+
+def factor(n, limit=None):
+    # prime factorization as a sorted {prime: exponent} dict (trial division, then Pollard rho)
+    # raises ValueError if a composite factor is not split within the rho step limit
+    res = {}
+    for p in (2, 3, 5, 7, 11, 13):
+        while n % p == 0:
+            res[p] = res.get(p, 0)+1
+            n //= p
+    stack = [n] if n > 1 else []
+    while stack:
+        n = stack.pop()
+        if is_prime(n):
+            res[n] = res.get(n, 0)+1
+            continue
+        d = pollard_rho(n, limit)
+        if d is None:
+            raise ValueError(f"Failed to factor composite {n}")
+        stack.extend((d, n//d))
+    return dict(sorted(res.items()))
+
+
+def cyclotomic_parts(width):
+    # 2**width-1 split into the algebraic factors Phi_d(2) for each d dividing width
+    parts = {}
+    for d in range(1, width+1):
+        if width % d == 0:
+            v = 2**d-1
+            for e, pe in parts.items():
+                if d % e == 0:
+                    v //= pe
+            parts[d] = v
+    return parts
+
+
+@functools.lru_cache(maxsize=None)
+def mersenne_factors(width):
+    # prime factorization of 2**width-1, the maximum period of a width-bit LFSR
+    res = {}
+    for part in cyclotomic_parts(width).values():
+        for p in known_mersenne_factors.get(width, ()):
+            while part % p == 0:
+                res[p] = res.get(p, 0)+1
+                part //= p
+        try:
+            f = factor(part)
+        except ValueError:
+            raise ValueError(f"Failed to factor 2^{width}-1, add its large prime factors "
+                "to known_mersenne_factors") from None
+        for p, e in f.items():
+            res[p] = res.get(p, 0)+e
+    return dict(sorted(res.items()))
+
+
+class Lfsr:
+    def __init__(self, lfsr_width=31, lfsr_poly=0x10000001, lfsr_config="FIBONACCI",
+            lfsr_feed_forward=0, reverse=0, data_width=8):
+        self.lfsr_width = lfsr_width
+        self.lfsr_poly = lfsr_poly
+        self.lfsr_config = lfsr_config
+        self.lfsr_feed_forward = int(bool(lfsr_feed_forward))
+        self.reverse = int(bool(reverse))
+        self.data_width = data_width
+
+        self.state_mask = 2**lfsr_width-1
+        self.data_mask = 2**data_width-1
+
+        self.masks = lfsr_masks(lfsr_width, lfsr_poly, lfsr_config,
+            self.lfsr_feed_forward, self.reverse, data_width)
+        self.state_masks = self.masks[:lfsr_width]
+        self.data_masks = self.masks[lfsr_width:]
+
+    def __repr__(self):
+        return (f"{type(self).__name__}(lfsr_width={self.lfsr_width}, lfsr_poly={self.lfsr_poly:#x}, "
+            f"lfsr_config={self.lfsr_config!r}, lfsr_feed_forward={self.lfsr_feed_forward}, "
+            f"reverse={self.reverse}, data_width={self.data_width})")
+
+    def params(self):
+        return {
+            'LFSR_WIDTH': self.lfsr_width,
+            'LFSR_POLY': f"{self.lfsr_width}'h{self.lfsr_poly:x}",
+            'LFSR_CONFIG': f'"{self.lfsr_config}"',
+            'LFSR_FEED_FORWARD': self.lfsr_feed_forward,
+            'REVERSE': self.reverse,
+            'DATA_WIDTH': self.data_width,
+        }
+
+    def state_matrix(self):
+        # state transition matrix for one pass with data_in tied to zero
+        return tuple(m & self.state_mask for m in self.state_masks)
+
+    def jump(self, state, n):
+        # advance state by n shifts (bits) with data_in tied to zero, negative n steps backwards
+        if self.lfsr_feed_forward:
+            raise ValueError("Jump is not supported in feed-forward configuration")
+        return lfsr_jump(state & self.state_mask, n, self.lfsr_width, self.lfsr_poly,
+            self.lfsr_config, self.reverse)
+
+    def step(self, data_in, state_in):
+        # returns (data_out, state_out)
+        val = ((data_in & self.data_mask) << self.lfsr_width) | (state_in & self.state_mask)
+
+        state_out = 0
+        for n, mask in enumerate(self.state_masks):
+            state_out |= (popcount(val & mask) & 1) << n
+
+        data_out = 0
+        for n, mask in enumerate(self.data_masks):
+            data_out |= (popcount(val & mask) & 1) << n
+
+        return data_out, state_out
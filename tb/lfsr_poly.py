@@ -0,0 +1,341 @@
+#!/usr/bin/env python
+"""
+
+Copyright (c) 2023 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import argparse
+import functools
+import math
+import os
+import re
+import sys
+
+try:
+    from lfsr_model import gf2_poly_divmod, gf2_poly_gcd, factor, mersenne_factors
+except ImportError:
+    # attempt import from current directory
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+    try:
+        from lfsr_model import gf2_poly_divmod, gf2_poly_gcd, factor, mersenne_factors
+    finally:
+        del sys.path[0]
+
+
+# Primitive polynomial verifier and period calculator.
+#
+# An LFSR_POLY value of width n stands for f(x) = x^n + LFSR_POLY, with bit k
+# of LFSR_POLY the coefficient of x^k (the x^n term is implied, as in lfsr.v).
+# The LFSR has the maximal period 2^n-1 if and only if f is primitive.
+#
+# PolyRing implements arithmetic modulo f with cached tables: multiplication
+# in 4-bit windows, squaring by spreading bits with a byte table, and
+# reduction 8 bits at a time with a table of multiples of f.  Then:
+#
+# irreducible  Rabin's test: x^(2^n) = x mod f, and gcd(x^(2^(n/q)) - x, f) = 1
+#              for each prime q dividing n
+# primitive    irreducible, and x^((2^n-1)/p) != 1 mod f for each prime p
+#              dividing 2^n-1 (from the cached factorization in lfsr_model)
+# period       order of x modulo f, which is the longest sequence period.  For
+#              reducible f this uses the square-free and distinct-degree
+#              factorizations: the order of x modulo the product of the
+#              degree-d factors is the smallest divisor t of 2^d-1 with
+#              x^t = 1, and a factor with multiplicity e multiplies the period
+#              by 2^ceil(log2(e)).  If x divides f (LFSR_POLY bit 0 clear) the
+#              sequence is not purely periodic and the period is None.
+
+tb_dir = os.path.dirname(os.path.realpath(__file__))
+rtl_dir = os.path.abspath(os.path.join(tb_dir, '..', 'rtl'))
+
+spread_table = tuple(int(f"{b:08b}".replace("", "0")[:-1], 2) for b in range(256))
+
+
+def gf2_poly_sqr(a):
+    res = 0
+    k = 0
+    while a:
+        res |= spread_table[a & 0xff] << k
+        a >>= 8
+        k += 16
+    return res
+
+
+def gf2_poly_sqrt(a):
+    # square root of a square (odd coefficients are zero)
+    res = 0
+    k = 0
+    while a:
+        if a & 1:
+            res |= 1 << k
+        a >>= 2
+        k += 1
+    return res
+
+
+def gf2_poly_deriv(a):
+    # odd powers x^k contribute x^(k-1)
+    mask = int("01"*((a.bit_length()+1)//2+1), 2)
+    return (a >> 1) & mask
+
+
+def gf2_poly_str(a):
+    terms = []
+    for k in range(a.bit_length()-1, -1, -1):
+        if (a >> k) & 1:
+            terms.append("1" if k == 0 else "x" if k == 1 else f"x^{k}")
+    return " + ".join(terms) or "0"
+
+
+class PolyRing:
+    # GF(2)[x] modulo f
+    def __init__(self, modulus):
+        self.modulus = modulus
+        self.degree = modulus.bit_length()-1
+        n = self.degree
+
+        # multiples of f that cancel 8 bits above x^n
+        self.reduce_table = [0]*256
+        for hi in range(256):
+            rem = hi << n
+            q, r = gf2_poly_divmod(rem, modulus)
+            self.reduce_table[hi] = rem ^ r
+
+    def reduce(self, a):
+        n = self.degree
+        table = self.reduce_table
+        while a.bit_length() > n:
+            s = max(a.bit_length()-n-8, 0)
+            a ^= table[(a >> (n+s)) & 0xff] << s
+        return a
+
+    def mul(self, a, b):
+        tab = [0]*16
+        for k in range(1, 16):
+            low = k & -k
+            tab[k] = tab[k ^ low] ^ (a << (low.bit_length()-1))
+        res = 0
+        for k in range((b.bit_length()+3)//4*4-4, -4, -4):
+            res = (res << 4) ^ tab[(b >> k) & 0xf]
+        return self.reduce(res)
+
+    def sqr(self, a):
+        return self.reduce(gf2_poly_sqr(a))
+
+    def pow(self, a, e):
+        res = 1
+        for k in range(e.bit_length()-1, -1, -1):
+            res = self.sqr(res)
+            if (e >> k) & 1:
+                res = self.mul(res, a)
+        return self.reduce(res)
+
+    def frobenius(self, a, k):
+        # a^(2^k)
+        for i in range(k):
+            a = self.sqr(a)
+        return a
+
+
+@functools.lru_cache(maxsize=None)
+def poly_ring(modulus):
+    return PolyRing(modulus)
+
+
+def full_poly(lfsr_width, lfsr_poly):
+    return (1 << lfsr_width) | (lfsr_poly & ((1 << lfsr_width)-1))
+
+
+def is_irreducible(f):
+    n = f.bit_length()-1
+    if n < 1:
+        return False
+    if n == 1:
+        return True
+    if not f & 1:
+        return False
+    ring = poly_ring(f)
+    if ring.frobenius(2, n) != 2:
+        return False
+    for q in factor(n):
+        if gf2_poly_gcd(f, ring.frobenius(2, n // q) ^ 2) != 1:
+            return False
+    return True
+
+
+def is_primitive(f):
+    n = f.bit_length()-1
+    if not is_irreducible(f):
+        return False
+    if n == 1:
+        return f == 0b11
+    ring = poly_ring(f)
+    order = 2**n-1
+    return all(ring.pow(2, order // p) != 1 for p in mersenne_factors(n))
+
+
+def squarefree_factors(f):
+    # [(g, e)] with f = prod(g^e), each g square-free
+    res = []
+
+    def rec(f, mult):
+        if f.bit_length() <= 1:
+            return
+        d = gf2_poly_deriv(f)
+        if not d:
+            rec(gf2_poly_sqrt(f), mult*2)
+            return
+        c = gf2_poly_gcd(f, d)
+        w = gf2_poly_divmod(f, c)[0]
+        i = 1
+        while w != 1:
+            y = gf2_poly_gcd(w, c)
+            z = gf2_poly_divmod(w, y)[0]
+            if z != 1:
+                res.append((z, i*mult))
+            i += 1
+            w = y
+            c = gf2_poly_divmod(c, y)[0]
+        if c != 1:
+            rec(gf2_poly_sqrt(c), mult*2)
+
+    rec(f, 1)
+    return res
+
+
+def distinct_degree_factors(g):
+    # [(h, d)] where h is the product of the degree-d irreducible factors of square-free g
+    res = []
+    d = 1
+    h = 2
+    while g.bit_length()-1 >= 2*d:
+        ring = poly_ring(g)
+        h = ring.sqr(ring.reduce(h))
+        part = gf2_poly_gcd(g, h ^ 2)
+        if part != 1:
+            res.append((part, d))
+            g = gf2_poly_divmod(g, part)[0]
+        d += 1
+    if g.bit_length() > 1:
+        res.append((g, g.bit_length()-1))
+    return res
+
+
+def x_order(g, d):
+    # order of x modulo g, where g is a product of distinct degree-d irreducibles
+    ring = poly_ring(g)
+    t = 2**d-1
+    for p in mersenne_factors(d):
+        while t % p == 0 and ring.pow(2, t // p) == 1:
+            t //= p
+    return t
+
+
+def period(f):
+    # longest period of the LFSR sequence for f, None if x divides f
+    if not f & 1:
+        return None
+    if f == 1:
+        return 1
+    res = 1
+    max_mult = 1
+    for g, e in squarefree_factors(f):
+        max_mult = max(max_mult, e)
+        for h, d in distinct_degree_factors(g):
+            res = math.lcm(res, x_order(h, d))
+    return res << math.ceil(math.log2(max_mult))
+
+
+def analyze(lfsr_width, lfsr_poly):
+    f = full_poly(lfsr_width, lfsr_poly)
+    irreducible = is_irreducible(f)
+    primitive = irreducible and is_primitive(f)
+    p = period(f)
+    return {
+        'lfsr_width': lfsr_width,
+        'lfsr_poly': lfsr_poly,
+        'polynomial': gf2_poly_str(f),
+        'irreducible': irreducible,
+        'primitive': primitive,
+        'period': p,
+        'max_period': 2**lfsr_width-1,
+        'factors': [(gf2_poly_str(h) if d == h.bit_length()-1 else f"degree {d} part: {gf2_poly_str(h)}", e)
+            for g, e in squarefree_factors(f) for h, d in distinct_degree_factors(g)],
+    }
+
+
+def lfsr_table(path=None):
+    # entries of the settings table in the lfsr.v header
+    if path is None:
+        path = os.path.join(rtl_dir, "lfsr.v")
+    with open(path) as f:
+        text = f.read()
+    start = text.index("Settings for common LFSR/CRC implementations")
+    table = text[start:text.index("*/", start)]
+
+    res = []
+    for line in table.splitlines():
+        m = re.match(r"(\S+)\s+(.+?)\s+(\d+)\s+(\d+)'h([0-9a-fA-F]+)", line)
+        if m:
+            res.append({
+                'name': m.group(1),
+                'config': m.group(2),
+                'lfsr_width': int(m.group(3)),
+                'lfsr_poly': int(m.group(5), 16),
+            })
+    return res
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check LFSR polynomials for primitivity and compute the period")
+    parser.add_argument('-w', '--lfsr-width', type=int, default=31, help="LFSR width")
+    parser.add_argument('-p', '--lfsr-poly', type=lambda x: int(x.split("'h")[-1], 16) if "'h" in x else int(x, 0),
+        default=0x10000001, help="LFSR polynomial (LFSR_POLY notation, hex or Verilog literal)")
+    parser.add_argument('--table', action='store_true', help="check the entries in the lfsr.v header table")
+
+    args = parser.parse_args()
+
+    if args.table:
+        for entry in lfsr_table():
+            res = analyze(entry['lfsr_width'], entry['lfsr_poly'])
+            status = "primitive" if res['primitive'] else "irreducible" if res['irreducible'] else "reducible"
+            print(f"{entry['name']:12s} {entry['lfsr_width']:3d}'h{entry['lfsr_poly']:x}: {status}, "
+                f"period {res['period']}" + (" (maximal)" if res['period'] == res['max_period'] else ""))
+        return
+
+    try:
+        res = analyze(args.lfsr_width, args.lfsr_poly)
+    except ValueError as ex:
+        print(f"Error: {ex}")
+        sys.exit(2)
+    print(f"Polynomial:  {res['polynomial']}")
+    print(f"Irreducible: {res['irreducible']}")
+    print(f"Primitive:   {res['primitive']}")
+    print(f"Period:      {res['period']} (maximal {res['max_period']})")
+    if not res['irreducible']:
+        print("Factors:     " + " * ".join(f"({g})" + (f"^{e}" if e > 1 else "") for g, e in res['factors']))
+
+    if not res['primitive']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
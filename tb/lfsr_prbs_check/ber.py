@@ -0,0 +1 @@
+../ber.py
\ No newline at end of file
@@ -0,0 +1 @@
+../lfsr_recover.py
\ No newline at end of file
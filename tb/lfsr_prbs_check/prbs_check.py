@@ -0,0 +1 @@
+../prbs_check.py
\ No newline at end of file
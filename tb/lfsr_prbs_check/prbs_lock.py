@@ -0,0 +1 @@
+../prbs_lock.py
\ No newline at end of file
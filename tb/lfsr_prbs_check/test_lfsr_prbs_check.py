@@ -26,15 +26,42 @@ THE SOFTWARE.
 import itertools
 import logging
 import os
+import random
+import sys
 
 import pytest
-import cocotb_test.simulator
 
 import cocotb
 from cocotb.clock import Clock
 from cocotb.triggers import RisingEdge
 from cocotb.regression import TestFactory
 
+try:
+    from ber import BerCounter
+    from lfsr_model import Lfsr
+    from prbs import PrbsGen, PRBS_SETTINGS
+    import cycle_model
+    import lfsr_recover
+    import multi_top
+    import prbs_check
+    import prbs_lock
+    import sim_cache
+except ImportError:
+    # attempt import from current directory
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+    try:
+        from ber import BerCounter
+        from lfsr_model import Lfsr
+        from prbs import PrbsGen, PRBS_SETTINGS
+        import cycle_model
+        import lfsr_recover
+        import multi_top
+        import prbs_check
+        import prbs_lock
+        import sim_cache
+    finally:
+        del sys.path[0]
+
 
 class TB:
     def __init__(self, dut):
@@ -84,37 +111,38 @@ def prbs31(state=0x7fffffff):
         yield ~state & 0xff
 
 
-def count_set_bits(n):
-    cnt = 0
-    while n:
-        n &= n - 1
-        cnt += 1
-    return cnt
+def prbs9_words(data_width):
+    return PrbsGen(lfsr_width=9, lfsr_poly=0x021, lfsr_init=0x1ff, lfsr_config="FIBONACCI",
+        reverse=0, invert=1, data_width=data_width)
+
+
+def prbs31_words(data_width):
+    return PrbsGen(lfsr_width=31, lfsr_poly=0x10000001, lfsr_init=0x7fffffff, lfsr_config="FIBONACCI",
+        reverse=0, invert=1, data_width=data_width)
 
 
 async def run_test_prbs(dut, ref_prbs):
 
     data_width = len(dut.data_out)
-    byte_lanes = data_width // 8
 
     tb = TB(dut)
 
     await tb.reset()
 
-    gen = chunks(ref_prbs(), byte_lanes)
+    gen = ref_prbs(data_width)
 
-    err_cnt = 0
+    ber = BerCounter(data_width)
 
     for i in range(512):
 
-        dut.data_in.value = int.from_bytes(bytes(next(gen)), 'big')
+        dut.data_in.value = next(gen)
         dut.data_in_valid.value = 1
 
         val = dut.data_out.value.integer
 
         tb.log.info("Error value: 0x%x", val)
 
-        err_cnt += count_set_bits(val)
+        ber.record(val)
 
         assert val == 0
 
@@ -122,21 +150,21 @@ async def run_test_prbs(dut, ref_prbs):
 
     dut.data_in_valid.value = 0
 
-    tb.log.info("Error count: %d", err_cnt)
+    tb.log.info("Error count: %d (BER %g)", ber.errors, ber.ber)
 
-    assert err_cnt == 0
+    assert ber.errors == 0
 
     await tb.reset()
 
     tb.log.info("Single error test")
 
-    gen = chunks(ref_prbs(), byte_lanes)
+    gen = ref_prbs(data_width)
 
-    err_cnt = 0
+    ber.reset()
 
     for i in range(64):
 
-        val = int.from_bytes(bytes(next(gen)), 'big')
+        val = next(gen)
 
         if i == 32:
             val = val ^ (1 << (data_width // 2))
@@ -148,28 +176,37 @@ async def run_test_prbs(dut, ref_prbs):
 
         tb.log.info("Error value: 0x%x", val)
 
-        err_cnt += count_set_bits(val)
+        ber.record(val)
 
         await RisingEdge(dut.clk)
 
     dut.data_in_valid.value = 0
 
-    tb.log.info("Error count: %d", err_cnt)
+    tb.log.info("Error count: %d (BER %g)", ber.errors, ber.ber)
 
     # one bit set per tap
-    assert err_cnt == 3
+    assert ber.errors == 3
+
+
+def select_test(dut):
+    # test coroutine and options for a parameter set
+    if dut.LFSR_POLY.value == 0x021:
+        return run_test_prbs, {'ref_prbs': prbs9_words}
+
+    if dut.LFSR_POLY.value == 0x10000001:
+        return run_test_prbs, {'ref_prbs': prbs31_words}
+
+    return None, {}
 
 
 if cocotb.SIM_NAME:
 
-    if cocotb.top.LFSR_POLY.value == 0x021:
-        factory = TestFactory(run_test_prbs)
-        factory.add_option("ref_prbs", [prbs9])
-        factory.generate_tests()
+    test, options = multi_top.select_test(cocotb.top, select_test)
 
-    if cocotb.top.LFSR_POLY.value == 0x10000001:
-        factory = TestFactory(run_test_prbs)
-        factory.add_option("ref_prbs", [prbs31])
+    if test is not None:
+        factory = TestFactory(test)
+        for name, val in options.items():
+            factory.add_option(name, [val])
         factory.generate_tests()
 
 
@@ -179,14 +216,19 @@ tests_dir = os.path.abspath(os.path.dirname(__file__))
 rtl_dir = os.path.abspath(os.path.join(tests_dir, '..', '..', 'rtl'))
 
 
+lfsr_prbs_check_params = [
+    (9,  "9'h021", "9'h1ff", "FIBONACCI", 0, 1, 8),
+    (9,  "9'h021", "9'h1ff", "FIBONACCI", 0, 1, 64),
+    (31, "31'h10000001", "31'h7fffffff", "FIBONACCI", 0, 1, 8),
+    (31, "31'h10000001", "31'h7fffffff", "FIBONACCI", 0, 1, 64),
+]
+
+
+@pytest.mark.skipif(multi_top.enabled, reason="covered by test_lfsr_prbs_check_multi")
+@pytest.mark.parametrize("sim", sim_cache.simulators)
 @pytest.mark.parametrize("style", ["AUTO", "LOOP"])
-@pytest.mark.parametrize(("lfsr_width", "lfsr_poly", "lfsr_init", "lfsr_config", "reverse", "invert", "data_width"), [
-            (9,  "9'h021", "9'h1ff", "FIBONACCI", 0, 1, 8),
-            (9,  "9'h021", "9'h1ff", "FIBONACCI", 0, 1, 64),
-            (31, "31'h10000001", "31'h7fffffff", "FIBONACCI", 0, 1, 8),
-            (31, "31'h10000001", "31'h7fffffff", "FIBONACCI", 0, 1, 64),
-        ])
-def test_lfsr_prbs_check(request, lfsr_width, lfsr_poly, lfsr_init, lfsr_config, reverse, invert, data_width, style):
+@pytest.mark.parametrize(("lfsr_width", "lfsr_poly", "lfsr_init", "lfsr_config", "reverse", "invert", "data_width"), lfsr_prbs_check_params)
+def test_lfsr_prbs_check(request, lfsr_width, lfsr_poly, lfsr_init, lfsr_config, reverse, invert, data_width, style, sim):
     dut = "lfsr_prbs_check"
     module = os.path.splitext(os.path.basename(__file__))[0]
     toplevel = dut
@@ -212,7 +254,8 @@ def test_lfsr_prbs_check(request, lfsr_width, lfsr_poly, lfsr_init, lfsr_config,
     sim_build = os.path.join(tests_dir, "sim_build",
         request.node.name.replace('[', '-').replace(']', ''))
 
-    cocotb_test.simulator.run(
+    sim_cache.run(
+        simulator=sim,
         python_search=[tests_dir],
         verilog_sources=verilog_sources,
         toplevel=toplevel,
@@ -221,3 +264,189 @@ def test_lfsr_prbs_check(request, lfsr_width, lfsr_poly, lfsr_init, lfsr_config,
         sim_build=sim_build,
         extra_env=extra_env,
     )
+
+
+@pytest.mark.skipif(not multi_top.enabled, reason="SIM_MULTI not set")
+@pytest.mark.parametrize("sim", sim_cache.simulators)
+def test_lfsr_prbs_check_multi(request, sim):
+    # all parameter sets in one simulation
+    multi_top.run_tests("lfsr_prbs_check", ['LFSR_WIDTH', 'LFSR_POLY', 'LFSR_INIT', 'LFSR_CONFIG', 'REVERSE', 'INVERT', 'DATA_WIDTH'], lfsr_prbs_check_params, ["AUTO", "LOOP"], tests_dir, request, sim)
+
+
+@pytest.mark.parametrize(("lfsr_width", "lfsr_poly", "lfsr_init", "lfsr_config", "reverse", "invert", "data_width"), lfsr_prbs_check_params)
+def test_lfsr_prbs_check_model(lfsr_width, lfsr_poly, lfsr_init, lfsr_config, reverse, invert, data_width):
+    dut = cycle_model.LfsrPrbsCheck(LFSR_WIDTH=lfsr_width, LFSR_POLY=lfsr_poly, LFSR_INIT=lfsr_init,
+        LFSR_CONFIG=lfsr_config, REVERSE=reverse, INVERT=invert, DATA_WIDTH=data_width)
+
+    # run the cocotb test against the cycle model, without a simulator
+    test, options = select_test(dut)
+    cycle_model.run(test, dut, **options)
+
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+@pytest.mark.parametrize(("data_width", "lane_width"), [(8, 1), (64, 8), (72, 1), (130, 10)])
+def test_ber_counter(monkeypatch, use_numpy, data_width, lane_width):
+    if use_numpy:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(sys.modules[BerCounter.__module__], "np", None)
+
+    rng = random.Random(data_width)
+    words = [0]*5000
+    for k in list(range(100, 104)) + [110, 2000, 2001, 4999]:
+        words[k] = rng.getrandbits(data_width) | 1
+
+    counter = BerCounter(data_width, lane_width, words_per_second=1000, burst_gap=2, capacity=256)
+    counter.record_words(words[:3000])
+    for w in words[3000:]:
+        counter.record(w)
+
+    lanes = [0]*((data_width+lane_width-1) // lane_width)
+    for w in words:
+        for n in range(data_width):
+            lanes[n // lane_width] += (w >> n) & 1
+
+    rep = counter.report()
+    assert rep['errors'] == sum(bin(w).count('1') for w in words)
+    assert rep['ber'] == rep['errors'] / (5000*data_width)
+    assert rep['lane_errors'] == lanes
+    assert rep['errored_words'] == 8
+    # 100-103, 110, 2000-2001, 4999
+    assert (rep['bursts'], rep['max_burst']) == (4, 4)
+    assert (rep['seconds'], rep['errored_seconds'], rep['error_free_seconds']) == (5, 3, 2)
+
+    counter.reset()
+    assert counter.errors == 0 and counter.words == 0
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+@pytest.mark.parametrize("reverse", [0, 1])
+@pytest.mark.parametrize("prbs", ["PRBS7", "PRBS23", "PRBS31"])
+def test_prbs_check_file(tmp_path, prbs, reverse, jobs):
+    settings = PRBS_SETTINGS[prbs]
+    lfsr_width = settings['lfsr_width']
+
+    # capture in DATA_WIDTH=8 order with single bit errors and a burst of garbage
+    rng = random.Random(lfsr_width)
+    data = bytearray(PrbsGen(reverse=reverse, data_width=8, **settings).words(16384))
+    for p in [k*3000 + rng.randrange(64, 1000) for k in range(20)]:
+        data[p // 8] ^= 1 << (p % 8 if reverse else 7 - p % 8)
+    data[12288:12544] = rng.randbytes(256)
+
+    path = tmp_path / "capture.bin"
+    path.write_bytes(data)
+
+    report = prbs_check.check_file(str(path), reverse=reverse, chunk_size=2048, jobs=jobs,
+        window_bits=1024, max_positions=10000, **settings)
+
+    # bit-serial reference using the feed-forward checker model
+    lfsr = Lfsr(lfsr_width, settings['lfsr_poly'], settings['lfsr_config'], 1, reverse, 8)
+    state = 0
+    positions = []
+    for k, b in enumerate(data):
+        out, state = lfsr.step(b ^ (0xff if settings['invert'] else 0), state)
+        positions.extend(k*8+n for n in range(8) if (out >> (n if reverse else 7-n)) & 1)
+    positions = [p for p in positions if p >= lfsr_width]
+
+    assert report['bits'] == len(data)*8 - lfsr_width
+    assert report['errors'] == len(positions)
+    assert report['error_positions'] == positions
+    assert report['ber'] == report['errors'] / report['bits']
+
+    # each single bit error is seen once per tap (3 for the trinomials)
+    assert sum(p < 8192*8 for p in positions) == 60
+
+    assert len(report['loss_of_lock']) == 1
+    event = report['loss_of_lock'][0]
+    assert event['start'] <= 12288*8 and event['end'] >= 12544*8
+
+
+@pytest.mark.parametrize("reverse", [0, 1])
+@pytest.mark.parametrize("prbs", list(PRBS_SETTINGS))
+def test_prbs_lock(prbs, reverse):
+    settings = PRBS_SETTINGS[prbs]
+    lfsr_width = settings['lfsr_width']
+    period = 2**lfsr_width-1
+
+    lock = prbs_lock.PrbsLock(lfsr_init=0x5, reverse=reverse, **settings)
+    assert lock.period == period
+
+    rng = random.Random(lfsr_width)
+    for k in range(4):
+        words = rng.randrange(period)
+        gen = PrbsGen(lfsr_init=0x5, reverse=reverse, data_width=8, **settings)
+        gen.seek(words)
+        data = bytes(gen.words(64))
+
+        # lock on an unaligned window
+        assert lock.locate(data, skip=rng.randrange(64)) == words*8 % period
+
+    data = bytearray(data)
+    data[-1] ^= 0x10
+    with pytest.raises(ValueError):
+        lock.locate(bytes(data), verify=len(data)*8)
+
+
+def test_prbs_lock_dlog():
+    # Pohlig-Hellman with repeated factors (2**6-1 = 3**2 * 7) and a prime order (2**31-1)
+    for lfsr_width, lfsr_poly in [(6, 0x21), (31, 0x10000001)]:
+        k_inv, modulus, order = prbs_lock.prbs_field(lfsr_width, lfsr_poly)
+        assert order == 2**lfsr_width-1
+        for n in [0, 1, order // 3, order-1]:
+            assert prbs_lock.dlog(prbs_lock.gf2_poly_powmod(2, n, modulus), modulus, order) == n
+
+    with pytest.raises(ValueError):
+        prbs_lock.PrbsLock(16, 0x1021, invert=0)
+
+
+@pytest.mark.parametrize("reverse", [0, 1])
+@pytest.mark.parametrize("prbs", list(PRBS_SETTINGS))
+def test_lfsr_recover(tmp_path, prbs, reverse):
+    settings = PRBS_SETTINGS[prbs]
+
+    data = bytes(PrbsGen(reverse=reverse, data_width=8, **settings).words(2048))
+    res = lfsr_recover.recover([data[k:k+100] for k in range(0, len(data), 100)], reverse)
+
+    assert res['prbs'] == prbs
+    assert (res['lfsr_width'], res['lfsr_poly'], res['invert']) == (settings['lfsr_width'], settings['lfsr_poly'], settings['invert'])
+    assert res['profile'][-1] == (res['profile'][-1][0], settings['lfsr_width'])
+    assert res['unique']
+
+    # the result plugs into the checker
+    path = tmp_path / "capture.bin"
+    path.write_bytes(data)
+    report = prbs_check.check_file(str(path), res['lfsr_width'], res['lfsr_poly'], res['lfsr_config'],
+        res['invert'], res['reverse'], jobs=1)
+    assert report['errors'] == 0
+
+
+def test_lfsr_recover_bm():
+    # compare with a plain bit-serial Berlekamp-Massey on random and short inputs
+    def ref_bm(s):
+        c, b, length, m = 1, 1, 0, 1
+        for n in range(len(s)):
+            d = s[n]
+            for i in range(1, length+1):
+                d ^= (c >> i) & s[n-i]
+            if d:
+                t = c
+                c ^= b << m
+                if 2*length <= n:
+                    length, b, m = n+1-length, t, 1
+                    continue
+            m += 1
+        return length, c
+
+    rng = random.Random(0)
+    for k in range(100):
+        data = rng.randbytes(rng.randint(1, 32))
+        bm = lfsr_recover.BerlekampMassey()
+        bm.update_bytes(data[:len(data)//2])
+        bm.update_bytes(data[len(data)//2:])
+        bits = int.from_bytes(data, 'big')
+        s = [(bits >> (len(data)*8-1-n)) & 1 for n in range(len(data)*8)]
+        assert (bm.length, bm.c) == ref_bm(s)
+
+    bm = lfsr_recover.BerlekampMassey(max_length=16)
+    with pytest.raises(ValueError):
+        bm.update_bytes(rng.randbytes(64))
@@ -0,0 +1 @@
+../prbs_pattern.py
\ No newline at end of file
@@ -26,15 +26,35 @@ THE SOFTWARE.
 import itertools
 import logging
 import os
+import sys
 
 import pytest
-import cocotb_test.simulator
 
 import cocotb
 from cocotb.clock import Clock
 from cocotb.triggers import RisingEdge
 from cocotb.regression import TestFactory
 
+try:
+    from prbs import PrbsGen, PRBS_SETTINGS, prbs_fill
+    import cycle_model
+    import multi_top
+    import prbs_pattern
+    import sim_cache
+    import vector_harness
+except ImportError:
+    # attempt import from current directory
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+    try:
+        from prbs import PrbsGen, PRBS_SETTINGS, prbs_fill
+        import cycle_model
+        import multi_top
+        import prbs_pattern
+        import sim_cache
+        import vector_harness
+    finally:
+        del sys.path[0]
+
 
 class TB:
     def __init__(self, dut):
@@ -83,22 +103,31 @@ def prbs31(state=0x7fffffff):
         yield ~state & 0xff
 
 
+def prbs9_words(data_width):
+    return PrbsGen(lfsr_width=9, lfsr_poly=0x021, lfsr_init=0x1ff, lfsr_config="FIBONACCI",
+        reverse=0, invert=1, data_width=data_width)
+
+
+def prbs31_words(data_width):
+    return PrbsGen(lfsr_width=31, lfsr_poly=0x10000001, lfsr_init=0x7fffffff, lfsr_config="FIBONACCI",
+        reverse=0, invert=1, data_width=data_width)
+
+
 async def run_test_prbs(dut, ref_prbs):
 
     data_width = len(dut.data_out)
-    byte_lanes = data_width // 8
 
     tb = TB(dut)
 
     await tb.reset()
 
-    gen = chunks(ref_prbs(), byte_lanes)
+    gen = ref_prbs(data_width)
 
     dut.enable.value = 1
     await RisingEdge(dut.clk)
 
     for i in range(512):
-        ref = int.from_bytes(bytes(next(gen)), 'big')
+        ref = next(gen)
         val = dut.data_out.value.integer
 
         tb.log.info("PRBS: 0x%x (ref: 0x%x)", val, ref)
@@ -108,16 +137,25 @@ async def run_test_prbs(dut, ref_prbs):
         await RisingEdge(dut.clk)
 
 
+def select_test(dut):
+    # test coroutine and options for a parameter set
+    if dut.LFSR_POLY.value == 0x021:
+        return run_test_prbs, {'ref_prbs': prbs9_words}
+
+    if dut.LFSR_POLY.value == 0x10000001:
+        return run_test_prbs, {'ref_prbs': prbs31_words}
+
+    return None, {}
+
+
 if cocotb.SIM_NAME:
 
-    if cocotb.top.LFSR_POLY.value == 0x021:
-        factory = TestFactory(run_test_prbs)
-        factory.add_option("ref_prbs", [prbs9])
-        factory.generate_tests()
+    test, options = multi_top.select_test(cocotb.top, select_test)
 
-    if cocotb.top.LFSR_POLY.value == 0x10000001:
-        factory = TestFactory(run_test_prbs)
-        factory.add_option("ref_prbs", [prbs31])
+    if test is not None:
+        factory = TestFactory(test)
+        for name, val in options.items():
+            factory.add_option(name, [val])
         factory.generate_tests()
 
 
@@ -127,14 +165,19 @@ tests_dir = os.path.abspath(os.path.dirname(__file__))
 rtl_dir = os.path.abspath(os.path.join(tests_dir, '..', '..', 'rtl'))
 
 
+lfsr_prbs_gen_params = [
+    (9,  "9'h021", "9'h1ff", "FIBONACCI", 0, 1, 8),
+    (9,  "9'h021", "9'h1ff", "FIBONACCI", 0, 1, 64),
+    (31, "31'h10000001", "31'h7fffffff", "FIBONACCI", 0, 1, 8),
+    (31, "31'h10000001", "31'h7fffffff", "FIBONACCI", 0, 1, 64),
+]
+
+
+@pytest.mark.skipif(multi_top.enabled, reason="covered by test_lfsr_prbs_gen_multi")
+@pytest.mark.parametrize("sim", sim_cache.simulators)
 @pytest.mark.parametrize("style", ["AUTO", "LOOP"])
-@pytest.mark.parametrize(("lfsr_width", "lfsr_poly", "lfsr_init", "lfsr_config", "reverse", "invert", "data_width"), [
-            (9,  "9'h021", "9'h1ff", "FIBONACCI", 0, 1, 8),
-            (9,  "9'h021", "9'h1ff", "FIBONACCI", 0, 1, 64),
-            (31, "31'h10000001", "31'h7fffffff", "FIBONACCI", 0, 1, 8),
-            (31, "31'h10000001", "31'h7fffffff", "FIBONACCI", 0, 1, 64),
-        ])
-def test_lfsr_prbs_gen(request, lfsr_width, lfsr_poly, lfsr_init, lfsr_config, reverse, invert, data_width, style):
+@pytest.mark.parametrize(("lfsr_width", "lfsr_poly", "lfsr_init", "lfsr_config", "reverse", "invert", "data_width"), lfsr_prbs_gen_params)
+def test_lfsr_prbs_gen(request, lfsr_width, lfsr_poly, lfsr_init, lfsr_config, reverse, invert, data_width, style, sim):
     dut = "lfsr_prbs_gen"
     module = os.path.splitext(os.path.basename(__file__))[0]
     toplevel = dut
@@ -160,7 +203,8 @@ def test_lfsr_prbs_gen(request, lfsr_width, lfsr_poly, lfsr_init, lfsr_config, r
     sim_build = os.path.join(tests_dir, "sim_build",
         request.node.name.replace('[', '-').replace(']', ''))
 
-    cocotb_test.simulator.run(
+    sim_cache.run(
+        simulator=sim,
         python_search=[tests_dir],
         verilog_sources=verilog_sources,
         toplevel=toplevel,
@@ -169,3 +213,178 @@ def test_lfsr_prbs_gen(request, lfsr_width, lfsr_poly, lfsr_init, lfsr_config, r
         sim_build=sim_build,
         extra_env=extra_env,
     )
+
+
+@pytest.mark.skipif(not multi_top.enabled, reason="SIM_MULTI not set")
+@pytest.mark.parametrize("sim", sim_cache.simulators)
+def test_lfsr_prbs_gen_multi(request, sim):
+    # all parameter sets in one simulation
+    multi_top.run_tests("lfsr_prbs_gen", ['LFSR_WIDTH', 'LFSR_POLY', 'LFSR_INIT', 'LFSR_CONFIG', 'REVERSE', 'INVERT', 'DATA_WIDTH'], lfsr_prbs_gen_params, ["AUTO", "LOOP"], tests_dir, request, sim)
+
+
+@pytest.mark.parametrize(("lfsr_width", "lfsr_poly", "lfsr_init", "lfsr_config", "reverse", "invert", "data_width"), lfsr_prbs_gen_params)
+def test_lfsr_prbs_gen_model(lfsr_width, lfsr_poly, lfsr_init, lfsr_config, reverse, invert, data_width):
+    dut = cycle_model.LfsrPrbsGen(LFSR_WIDTH=lfsr_width, LFSR_POLY=lfsr_poly, LFSR_INIT=lfsr_init,
+        LFSR_CONFIG=lfsr_config, REVERSE=reverse, INVERT=invert, DATA_WIDTH=data_width)
+
+    # run the cocotb test against the cycle model, without a simulator
+    test, options = select_test(dut)
+    cycle_model.run(test, dut, **options)
+
+
+@pytest.mark.parametrize(("lfsr_width", "lfsr_poly", "lfsr_init", "lfsr_config", "reverse", "invert", "data_width"), lfsr_prbs_gen_params)
+def test_lfsr_prbs_gen_vectors(request, lfsr_width, lfsr_poly, lfsr_init, lfsr_config, reverse, invert, data_width):
+    dut = "lfsr_prbs_gen"
+    module = "vector_harness"
+    cycles = vector_harness.cycles
+
+    verilog_sources = [
+        os.path.join(rtl_dir, f"{dut}.v"),
+        os.path.join(rtl_dir, "lfsr.v"),
+    ]
+
+    parameters = {}
+
+    parameters['LFSR_WIDTH'] = lfsr_width
+    parameters['LFSR_POLY'] = lfsr_poly
+    parameters['LFSR_INIT'] = lfsr_init
+    parameters['LFSR_CONFIG'] = f'"{lfsr_config}"'
+    parameters['REVERSE'] = reverse
+    parameters['INVERT'] = invert
+    parameters['DATA_WIDTH'] = data_width
+
+    sim_build = os.path.join(tests_dir, "sim_build",
+        request.node.name.replace('[', '-').replace(']', ''))
+
+    os.makedirs(sim_build, exist_ok=True)
+    stim_file = os.path.join(sim_build, "stim.memh")
+    resp_file = os.path.join(sim_build, "resp.memh")
+    harness_src = os.path.join(sim_build, f"{dut}_vectors.v")
+
+    toplevel, inputs, outputs = vector_harness.generate(dut, verilog_sources[0], parameters, cycles,
+        stim_file, resp_file, harness_src)
+
+    # reset for two cycles, then enable
+    rst = [1, 1] + [0]*(cycles-2)
+    enable = [0, 0] + [1]*(cycles-2)
+    vector_harness.write_memh(stim_file, vector_harness.pack(inputs, {'rst': rst, 'enable': enable}, cycles),
+        sum(w for p, w in inputs))
+
+    # output during cycle i reflects enables up to cycle i-1
+    gen = PrbsGen(lfsr_width, int(lfsr_poly.split("'h")[1], 16), int(lfsr_init.split("'h")[1], 16),
+        lfsr_config, reverse, invert, data_width)
+    words = gen.words(cycles-2)
+    expected = words[:1]*2 + words
+
+    sim_cache.run(
+        python_search=[tests_dir],
+        verilog_sources=[harness_src]+verilog_sources,
+        toplevel=toplevel,
+        module=module,
+        sim_build=sim_build,
+    )
+
+    vals, invalid = vector_harness.read_memh(resp_file, data_width)
+    vector_harness.compare(expected, vals, invalid, name="data_out")
+
+
+@pytest.mark.parametrize("data_width", [8, 16, 64, 72, 512])
+@pytest.mark.parametrize(("ref_prbs", "ref_words"), [
+            (prbs9, prbs9_words),
+            (prbs31, prbs31_words),
+        ])
+def test_prbs_gen_model(ref_prbs, ref_words, data_width):
+    gen = chunks(ref_prbs(), data_width // 8)
+    words = ref_words(data_width)
+
+    for i in range(256):
+        assert next(words) == int.from_bytes(bytes(next(gen)), 'big')
+
+    words.reset()
+    block = words.words(64)
+    words.reset()
+    assert block == [next(words) for i in range(64)]
+
+    # seek to an arbitrary word
+    words.reset()
+    words.seek(1000)
+    ref = ref_words(data_width)
+    for i in range(1000):
+        next(ref)
+    assert next(words) == next(ref)
+
+
+@pytest.mark.parametrize("reverse", [0, 1])
+@pytest.mark.parametrize("prbs", list(PRBS_SETTINGS))
+def test_prbs_fill(prbs, reverse):
+    np = pytest.importorskip("numpy")
+
+    settings = PRBS_SETTINGS[prbs]
+
+    ref = PrbsGen(reverse=reverse, data_width=8, **settings)
+    ref_bytes = bytes(ref.words(4099))
+
+    # byte buffer with partial word at the end
+    buf = np.zeros(4099, dtype=np.uint8)
+    state = prbs_fill(buf, reverse=reverse, block_words=16, **settings)
+    assert buf.tobytes() == ref_bytes
+    assert state == ref.state
+
+    # word buffer, continuing from the returned state
+    ref = PrbsGen(lfsr_init=state, reverse=reverse, data_width=64, **settings)
+    buf = np.zeros(777, dtype=np.uint64)
+    prbs_fill(buf, state=state, reverse=reverse, block_words=16, **settings)
+    assert [int(x) for x in buf] == ref.words(777)
+
+
+@pytest.mark.parametrize("fmt", prbs_pattern.formats)
+@pytest.mark.parametrize("data_width", [8, 10, 64, 66])
+@pytest.mark.parametrize("reverse", [0, 1])
+@pytest.mark.parametrize("prbs", ["PRBS7", "PRBS23", "PRBS31"])
+def test_prbs_pattern(tmp_path, prbs, reverse, data_width, fmt):
+    pytest.importorskip("numpy")
+
+    settings = PRBS_SETTINGS[prbs]
+    count = 3001
+    nbytes = (data_width+7) // 8
+
+    ref = PrbsGen(lfsr_init=0x15, reverse=reverse, data_width=data_width, **settings).words(count)
+
+    # small blocks to cover block boundaries and a partial last block
+    path = tmp_path / f"pattern.{fmt}"
+    prbs_pattern.write_pattern(str(path), fmt, count, lfsr_init=0x15, reverse=reverse,
+        data_width=data_width, block_size=100, **settings)
+
+    if fmt == "memh":
+        lines = [l for l in path.read_text().splitlines() if not l.startswith("//")]
+        assert all(len(l) == (data_width+3) // 4 for l in lines)
+        assert [int(l, 16) for l in lines] == ref
+        return
+
+    if fmt == "hex":
+        lines = path.read_text().splitlines()
+        assert all(len(l) == 64 for l in lines[:-1])
+        data = bytes.fromhex("".join(lines))
+    else:
+        data = path.read_bytes()
+
+    order = 'little' if reverse else 'big'
+    assert [int.from_bytes(data[k:k+nbytes], order) for k in range(0, len(data), nbytes)] == ref
+
+
+def test_prbs_pattern_period(tmp_path):
+    assert prbs_pattern.period_words(31, 8) == 2**28
+    assert prbs_pattern.period_words(7, 10) == 13
+
+    # whole periods for a seamless loop
+    assert prbs_pattern.loop_words(31, 8) == 2**31-1
+    assert prbs_pattern.loop_words(7, 10) == 127
+    assert prbs_pattern.loop_words(6, 9) == 7
+
+    pytest.importorskip("numpy")
+
+    settings = PRBS_SETTINGS["PRBS7"]
+    path = tmp_path / "pattern.memh"
+    assert prbs_pattern.write_pattern(str(path), "memh", data_width=10, loop=True, **settings) == 127
+    lines = [int(l, 16) for l in path.read_text().splitlines() if not l.startswith("//")]
+    assert lines*2 == PrbsGen(lfsr_init=0x7f, data_width=10, **settings).words(254)
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+"""
+
+Copyright (c) 2023 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import argparse
+import json
+import os
+import sys
+
+try:
+    from prbs import PRBS_SETTINGS
+    from prbs_lock import serial_bits
+except ImportError:
+    # attempt import from current directory
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+    try:
+        from prbs import PRBS_SETTINGS
+        from prbs_lock import serial_bits
+    finally:
+        del sys.path[0]
+
+
+# LFSR recovery from captured bit streams (Berlekamp-Massey).
+#
+# BerlekampMassey finds the shortest LFSR that generates a bit stream.  The
+# connection polynomial C(x) = 1 + c1 x + ... + cL x^L (the stream satisfies
+# s[n] = c1 s[n-1] + ... + cL s[n-L]) is kept as a bit-packed integer, and the
+# input is processed in blocks: the discrepancies of a whole block are computed
+# at once as the XOR of shifted copies of the block, one per tap of C (the same
+# convolution as in prbs_check.py), and the block is skipped up to the first
+# discrepancy, where the usual length and polynomial update is applied.  Clean
+# blocks double in size, so once the LFSR is found the rest of the stream is
+# checked at the speed of a few big-integer shifts.
+#
+# For a Fibonacci LFSR, the taps of C are the checker taps of lfsr.v, so the
+# result maps directly to LFSR_WIDTH = L and LFSR_POLY = C without the x^L
+# term.  An inverted stream satisfies the recurrence with an odd number of taps
+# only after complementing, so the complemented stream is analyzed in parallel
+# and the shorter result selects INVERT.
+#
+# The linear complexity profile is reported as the list of (bits, L) points
+# where the linear complexity changed.  The input bit order is the same as
+# prbs_check.py: MSB first within each byte for REVERSE=0, LSB first for
+# REVERSE=1.
+
+default_max_length = 1024
+default_chunk_size = 1 << 20
+
+
+class BerlekampMassey:
+    def __init__(self, max_length=default_max_length):
+        self.max_length = max_length
+        self.hist_bits = max_length+1
+        self.reset()
+
+    def __repr__(self):
+        return f"{type(self).__name__}(max_length={self.max_length})"
+
+    def reset(self):
+        self.n = 0
+        self.length = 0
+        self.c = 1
+        self.b = 1
+        self.m = 1
+        self.tail = 0
+        self.profile = []
+        self.block = 64
+
+    def taps(self):
+        c = self.c
+        taps = []
+        while c:
+            low = c & -c
+            taps.append(low.bit_length()-1)
+            c ^= low
+        return taps
+
+    def discrepancy(self):
+        # one step with a nonzero discrepancy at bit n
+        if 2*self.length <= self.n:
+            t = self.c
+            self.c ^= self.b << self.m
+            self.length = self.n+1-self.length
+            self.b = t
+            self.m = 1
+            self.profile.append((self.n+1, self.length))
+            if self.length > self.max_length:
+                raise ValueError(f"Linear complexity exceeds {self.max_length}")
+        else:
+            self.c ^= self.b << self.m
+            self.m += 1
+
+    def update(self, bits, nbits):
+        # process nbits bits, with serial bit k in bit k of bits
+        h = min(self.n, self.hist_bits)
+        x = (bits << h) | self.tail
+        k = 0
+        while k < nbits:
+            size = min(self.block, nbits-k)
+            length = self.length
+
+            # discrepancies for bits k to k+size-1
+            w = (x >> (h+k-length)) & ((1 << (length+size))-1)
+            e = 0
+            for d in self.taps():
+                e ^= w << d
+            e = (e >> length) & ((1 << size)-1)
+
+            if not e:
+                self.n += size
+                self.m += size
+                k += size
+                self.block *= 2
+                continue
+
+            skip = (e & -e).bit_length()-1
+            self.n += skip
+            self.m += skip
+            self.discrepancy()
+            self.n += 1
+            k += skip+1
+            self.block = 64
+
+        total = h+nbits
+        keep = min(total, self.hist_bits)
+        self.tail = (x >> (total-keep)) & ((1 << keep)-1)
+
+    def update_bytes(self, data, reverse=0):
+        self.update(serial_bits(data, reverse), len(data)*8)
+
+    @property
+    def lfsr_width(self):
+        return self.length
+
+    @property
+    def lfsr_poly(self):
+        return self.c & ((1 << self.length)-1)
+
+
+def prbs_name(lfsr_width, lfsr_poly):
+    for name, s in PRBS_SETTINGS.items():
+        if s['lfsr_width'] == lfsr_width and s['lfsr_poly'] == lfsr_poly:
+            return name
+    return None
+
+
+def recover(chunks, reverse=0, max_length=default_max_length):
+    # run on an iterable of byte strings, returns a result dict
+    bm = [BerlekampMassey(max_length), BerlekampMassey(max_length)]
+    nbits = 0
+    for data in chunks:
+        bits = serial_bits(data, reverse)
+        n = len(data)*8
+        for inv, b in enumerate(bm):
+            if b is None:
+                continue
+            try:
+                b.update(bits ^ ((1 << n)-1) if inv else bits, n)
+            except ValueError:
+                if bm[1-inv] is None:
+                    raise
+                bm[inv] = None
+        nbits += n
+
+    invert = 0 if bm[1] is None or (bm[0] is not None and bm[0].length <= bm[1].length) else 1
+    b = bm[invert]
+
+    return {
+        'bits': nbits,
+        'lfsr_width': b.lfsr_width,
+        'lfsr_poly': b.lfsr_poly,
+        'lfsr_config': "FIBONACCI",
+        'invert': invert,
+        'reverse': int(bool(reverse)),
+        'prbs': prbs_name(b.lfsr_width, b.lfsr_poly),
+        'degree': b.c.bit_length()-1,
+        # the LFSR is only determined if the stream is at least twice as long
+        'unique': nbits >= 2*b.length,
+        'profile': b.profile,
+    }
+
+
+def read_chunks(path, chunk_size=default_chunk_size, limit=None):
+    with open(path, 'rb') as f:
+        remaining = limit
+        while remaining is None or remaining > 0:
+            data = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+            if not data:
+                break
+            if remaining is not None:
+                remaining -= len(data)
+            yield data
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the minimal LFSR for a captured bit stream (Berlekamp-Massey)")
+    parser.add_argument('file', type=str, help="capture file")
+    parser.add_argument('-r', '--reverse', type=int, default=0, help="LSB first within each byte")
+    parser.add_argument('-n', '--bytes', type=int, help="number of bytes to analyze (default all)")
+    parser.add_argument('--max-length', type=int, default=default_max_length, help="maximum linear complexity")
+    parser.add_argument('--json', action='store_true', help="print JSON report")
+
+    args = parser.parse_args()
+
+    try:
+        res = recover(read_chunks(args.file, limit=args.bytes), args.reverse, args.max_length)
+    except ValueError as ex:
+        print(f"No LFSR found: {ex}")
+        sys.exit(1)
+
+    if args.json:
+        print(json.dumps(res, indent=2))
+        return
+
+    w = res['lfsr_width']
+    print(f"Bits:              {res['bits']}")
+    print(f"Linear complexity: {w}" + (f" ({res['prbs']})" if res['prbs'] else ""))
+    print(f"Profile:           {', '.join(f'{n}:{l}' for n, l in res['profile'])}")
+    if not res['unique']:
+        print(f"Warning: fewer than {2*w} bits, the LFSR is not unique")
+    if res['degree'] < w:
+        print(f"Warning: polynomial degree {res['degree']} is less than the width, not a pure LFSR sequence")
+    print(f"Parameters:        LFSR_WIDTH={w} LFSR_POLY={w}'h{res['lfsr_poly']:x} "
+        f"LFSR_CONFIG=\"FIBONACCI\" REVERSE={res['reverse']} INVERT={res['invert']}")
+    print(f"Check with:        prbs_check.py -w {w} -p {res['lfsr_poly']:#x} -c FIBONACCI "
+        f"-i {res['invert']} -r {res['reverse']} {args.file}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1 @@
+../cycle_model.py
\ No newline at end of file
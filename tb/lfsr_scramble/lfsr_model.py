@@ -0,0 +1 @@
+../lfsr_model.py
\ No newline at end of file
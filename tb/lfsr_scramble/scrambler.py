@@ -0,0 +1 @@
+../scrambler.py
\ No newline at end of file
@@ -26,15 +26,31 @@ THE SOFTWARE.
 import itertools
 import logging
 import os
+import sys
 
 import pytest
-import cocotb_test.simulator
 
 import cocotb
 from cocotb.clock import Clock
 from cocotb.triggers import RisingEdge
 from cocotb.regression import TestFactory
 
+try:
+    from scrambler import scramble_64b66b
+    import cycle_model
+    import multi_top
+    import sim_cache
+except ImportError:
+    # attempt import from current directory
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+    try:
+        from scrambler import scramble_64b66b
+        import cycle_model
+        import multi_top
+        import sim_cache
+    finally:
+        del sys.path[0]
+
 
 class TB:
     def __init__(self, dut):
@@ -64,20 +80,6 @@ def chunks(lst, n, padvalue=None):
     return itertools.zip_longest(*[iter(lst)]*n, fillvalue=padvalue)
 
 
-def scramble_64b66b(data, state=0x3ffffffffffffff):
-    data_out = bytearray()
-    for d in data:
-        b = 0
-        for i in range(8):
-            if bool(state & (1 << 38)) ^ bool(state & (1 << 57)) ^ bool(d & (1 << i)):
-                state = ((state & 0x1ffffffffffffff) << 1) | 1
-                b = b | (1 << i)
-            else:
-                state = (state & 0x1ffffffffffffff) << 1
-        data_out.append(b)
-    return data_out
-
-
 async def run_test_scramble(dut, ref_scramble):
 
     data_width = len(dut.data_in)
@@ -114,12 +116,23 @@ async def run_test_scramble(dut, ref_scramble):
     await RisingEdge(dut.clk)
 
 
+def select_test(dut):
+    # test coroutine and options for a parameter set
+    # if dut.LFSR_POLY.value == 0x8000000001:
+    if dut.LFSR_WIDTH == 58:
+        return run_test_scramble, {'ref_scramble': scramble_64b66b}
+
+    return None, {}
+
+
 if cocotb.SIM_NAME:
 
-    # if cocotb.top.LFSR_POLY.value == 0x8000000001:
-    if cocotb.top.LFSR_WIDTH == 58:
-        factory = TestFactory(run_test_scramble)
-        factory.add_option("ref_scramble", [scramble_64b66b])
+    test, options = multi_top.select_test(cocotb.top, select_test)
+
+    if test is not None:
+        factory = TestFactory(test)
+        for name, val in options.items():
+            factory.add_option(name, [val])
         factory.generate_tests()
 
 
@@ -129,12 +142,17 @@ tests_dir = os.path.abspath(os.path.dirname(__file__))
 rtl_dir = os.path.abspath(os.path.join(tests_dir, '..', '..', 'rtl'))
 
 
+lfsr_scramble_params = [
+    (58,  "58'h8000000001", "58'h3ffffffffffffff", "FIBONACCI", 1, 8),
+    (58,  "58'h8000000001", "58'h3ffffffffffffff", "FIBONACCI", 1, 64),
+]
+
+
+@pytest.mark.skipif(multi_top.enabled, reason="covered by test_lfsr_scramble_multi")
+@pytest.mark.parametrize("sim", sim_cache.simulators)
 @pytest.mark.parametrize("style", ["AUTO", "LOOP"])
-@pytest.mark.parametrize(("lfsr_width", "lfsr_poly", "lfsr_init", "lfsr_config", "reverse", "data_width"), [
-            (58,  "58'h8000000001", "58'h3ffffffffffffff", "FIBONACCI", 1, 8),
-            (58,  "58'h8000000001", "58'h3ffffffffffffff", "FIBONACCI", 1, 64),
-        ])
-def test_lfsr_scramble(request, lfsr_width, lfsr_poly, lfsr_init, lfsr_config, reverse, data_width, style):
+@pytest.mark.parametrize(("lfsr_width", "lfsr_poly", "lfsr_init", "lfsr_config", "reverse", "data_width"), lfsr_scramble_params)
+def test_lfsr_scramble(request, lfsr_width, lfsr_poly, lfsr_init, lfsr_config, reverse, data_width, style, sim):
     dut = "lfsr_scramble"
     module = os.path.splitext(os.path.basename(__file__))[0]
     toplevel = dut
@@ -159,7 +177,8 @@ def test_lfsr_scramble(request, lfsr_width, lfsr_poly, lfsr_init, lfsr_config, r
     sim_build = os.path.join(tests_dir, "sim_build",
         request.node.name.replace('[', '-').replace(']', ''))
 
-    cocotb_test.simulator.run(
+    sim_cache.run(
+        simulator=sim,
         python_search=[tests_dir],
         verilog_sources=verilog_sources,
         toplevel=toplevel,
@@ -168,3 +187,20 @@ def test_lfsr_scramble(request, lfsr_width, lfsr_poly, lfsr_init, lfsr_config, r
         sim_build=sim_build,
         extra_env=extra_env,
     )
+
+
+@pytest.mark.skipif(not multi_top.enabled, reason="SIM_MULTI not set")
+@pytest.mark.parametrize("sim", sim_cache.simulators)
+def test_lfsr_scramble_multi(request, sim):
+    # all parameter sets in one simulation
+    multi_top.run_tests("lfsr_scramble", ['LFSR_WIDTH', 'LFSR_POLY', 'LFSR_INIT', 'LFSR_CONFIG', 'REVERSE', 'DATA_WIDTH'], lfsr_scramble_params, ["AUTO", "LOOP"], tests_dir, request, sim)
+
+
+@pytest.mark.parametrize(("lfsr_width", "lfsr_poly", "lfsr_init", "lfsr_config", "reverse", "data_width"), lfsr_scramble_params)
+def test_lfsr_scramble_model(lfsr_width, lfsr_poly, lfsr_init, lfsr_config, reverse, data_width):
+    dut = cycle_model.LfsrScramble(LFSR_WIDTH=lfsr_width, LFSR_POLY=lfsr_poly, LFSR_INIT=lfsr_init,
+        LFSR_CONFIG=lfsr_config, REVERSE=reverse, DATA_WIDTH=data_width)
+
+    # run the cocotb test against the cycle model, without a simulator
+    test, options = select_test(dut)
+    cycle_model.run(test, dut, **options)
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+"""
+
+Copyright (c) 2023 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import itertools
+import json
+import os
+import sys
+
+try:
+    from lfsr_model import lfsr_masks, popcount, reverse_bits
+    import lfsr_poly
+except ImportError:
+    # attempt import from current directory
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+    try:
+        from lfsr_model import lfsr_masks, popcount, reverse_bits
+        import lfsr_poly
+    finally:
+        del sys.path[0]
+
+
+# Minimal-tap primitive polynomial search.
+#
+# Enumerates the trinomials x^n + x^a + 1 and pentanomials x^n + x^a + x^b +
+# x^c + 1 of width n (or any other odd number of terms) and reports the
+# primitive ones, cheapest first.  The cost of a polynomial is the number of
+# 2-input XOR gates of an lfsr instance with data_in tied to zero (as in
+# lfsr_prbs_gen) at the given DATA_WIDTH, counted from the lfsr_masks() matrix:
+# popcount(mask)-1 for each state_out and data_out mask.
+#
+# The search runs in two passes over a process pool:
+#
+# 1. the cost of every candidate is computed, and the candidates are sorted by
+#    cost, number of terms, and polynomial
+# 2. the candidates are tested for primitivity (lfsr_poly.is_primitive) in that
+#    order, with a bounded number of batches in flight, so primitive
+#    polynomials are reported in order of cost as soon as they are confirmed,
+#    and the search stops after the requested number of results
+#
+# A polynomial is primitive exactly when its reciprocal is, so each
+# reciprocal pair is tested once.  Trinomials of width divisible by 8 are
+# skipped without testing (Swan's theorem: they are all reducible), as are
+# candidates with an even number of terms (divisible by x+1).
+
+default_taps = (3, 5)
+
+
+def candidates(lfsr_width, taps=default_taps):
+    # LFSR_POLY values with the given numbers of terms (including x^n and 1)
+    for t in sorted(taps):
+        if t < 2 or t-2 > lfsr_width-1:
+            continue
+        for mid in itertools.combinations(range(1, lfsr_width), t-2):
+            yield sum(1 << k for k in mid) | 1
+
+
+def reciprocal(lfsr_width, lfsr_poly):
+    return reverse_bits((1 << lfsr_width) | lfsr_poly, lfsr_width+1) & ((1 << lfsr_width)-1)
+
+
+def prefilter(lfsr_width, lfsr_poly):
+    # False if the polynomial is known to be reducible
+    terms = popcount(lfsr_poly)+1
+    if terms % 2 == 0:
+        return False
+    if terms == 3 and lfsr_width % 8 == 0:
+        return False
+    return True
+
+
+def xor_cost(lfsr_width, lfsr_poly, data_width, lfsr_config="FIBONACCI"):
+    # 2-input XOR count for state_out and data_out with data_in tied to zero
+    state_mask = 2**lfsr_width-1
+    # uncached, the search visits each polynomial once
+    masks = lfsr_masks.__wrapped__(lfsr_width, lfsr_poly, lfsr_config, 0, 0, data_width)
+    return sum(max(popcount(m & state_mask)-1, 0) for m in masks)
+
+
+def cost_batch(lfsr_width, polys, data_width, lfsr_config):
+    return [xor_cost(lfsr_width, p, data_width, lfsr_config) for p in polys]
+
+
+def primitive_batch(lfsr_width, polys):
+    return [lfsr_poly.is_primitive(lfsr_poly.full_poly(lfsr_width, p)) for p in polys]
+
+
+def map_batches(fn, batches, jobs=None, window=None):
+    # ordered, lazy map of fn over batches of arguments, with at most window batches in flight
+    if jobs == 1:
+        for args in batches:
+            yield fn(*args)
+        return
+
+    if window is None:
+        window = 4*(jobs or os.cpu_count() or 1)
+
+    with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+        pending = collections.deque()
+        batches = iter(batches)
+        try:
+            while True:
+                while len(pending) < window:
+                    args = next(batches, None)
+                    if args is None:
+                        break
+                    pending.append(executor.submit(fn, *args))
+                if not pending:
+                    break
+                yield pending.popleft().result()
+        finally:
+            for f in pending:
+                f.cancel()
+
+
+def chunks(lst, n):
+    return [lst[k:k+n] for k in range(0, len(lst), n)]
+
+
+def search(lfsr_width, data_width=8, taps=default_taps, lfsr_config="FIBONACCI", jobs=None, batch_size=256):
+    # yields result dicts for primitive polynomials in order of cost
+    cands = [p for p in candidates(lfsr_width, taps) if prefilter(lfsr_width, p)]
+
+    costs = []
+    for res in map_batches(cost_batch, [(lfsr_width, b, data_width, lfsr_config) for b in chunks(cands, batch_size)], jobs):
+        costs.extend(res)
+
+    order = sorted(zip(costs, (popcount(p)+1 for p in cands), cands))
+
+    # test each reciprocal pair once, in order of first appearance
+    canon = {}
+    tests = []
+    for c, t, p in order:
+        q = min(p, reciprocal(lfsr_width, p))
+        if q not in canon:
+            canon[q] = None
+            tests.append(q)
+
+    k = 0
+    results = map_batches(primitive_batch, [(lfsr_width, b) for b in chunks(tests, batch_size)], jobs)
+    try:
+        for batch, res in zip(chunks(tests, batch_size), results):
+            canon.update(zip(batch, res))
+            while k < len(order):
+                c, t, p = order[k]
+                prim = canon[min(p, reciprocal(lfsr_width, p))]
+                if prim is None:
+                    break
+                if prim:
+                    yield {
+                        'lfsr_width': lfsr_width,
+                        'lfsr_poly': p,
+                        'polynomial': lfsr_poly.gf2_poly_str(lfsr_poly.full_poly(lfsr_width, p)),
+                        'terms': t,
+                        'data_width': data_width,
+                        'xor_cost': c,
+                    }
+                k += 1
+    finally:
+        results.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search for low-cost primitive trinomials and pentanomials")
+    parser.add_argument('-w', '--lfsr-width', type=int, default=64, help="LFSR width")
+    parser.add_argument('-d', '--data-width', type=int, default=64, help="data width for the XOR cost")
+    parser.add_argument('-c', '--lfsr-config', type=str, default="FIBONACCI", help="LFSR configuration (FIBONACCI or GALOIS)")
+    parser.add_argument('-t', '--taps', type=int, nargs='+', default=list(default_taps), help="numbers of terms (default 3 5)")
+    parser.add_argument('-n', '--count', type=int, default=10, help="number of results (0 for all)")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="worker processes (default CPU count)")
+    parser.add_argument('--json', action='store_true', help="print one JSON object per line")
+
+    args = parser.parse_args()
+
+    results = search(args.lfsr_width, args.data_width, args.taps, args.lfsr_config, args.jobs)
+    if args.count:
+        results = itertools.islice(results, args.count)
+
+    found = 0
+    for res in results:
+        found += 1
+        if args.json:
+            print(json.dumps(res), flush=True)
+        else:
+            print(f"{res['lfsr_width']}'h{res['lfsr_poly']:x}  cost {res['xor_cost']:6d}  {res['polynomial']}", flush=True)
+
+    if not found:
+        print("No primitive polynomials found")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+"""
+
+Copyright (c) 2023 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import itertools
+import json
+import os
+import re
+import sys
+
+import cocotb
+
+try:
+    import sim_cache
+except ImportError:
+    # attempt import from current directory
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+    try:
+        import sim_cache
+    finally:
+        del sys.path[0]
+
+
+# Multi-configuration wrapper top-level.
+#
+# generate() writes a top-level module that instantiates one module N times with
+# different parameter sets.  Each port of instance k is connected to a reg (inputs)
+# or wire (outputs) named u{k}_{port} in the top-level, so every instance has its
+# own clock, reset, and data signals.  The parameter sets are passed to the
+# simulation in the MULTI_CONFIGS environment variable.
+#
+# Instance wraps the top-level handle so that the existing test coroutines can
+# drive instance k as if it were the toplevel: dut.data_in maps to u{k}_data_in,
+# and dut.LFSR_POLY returns the parameter value from the configuration.
+#
+# In the test module, select_test(dut) returns the test coroutine and its options
+# for one parameter set.  With a multi-configuration top-level, the
+# run_test_multi coroutine runs the selected tests for all instances concurrently
+# in one simulation.
+#
+# run_tests() is the pytest side: it builds the configurations from a testbench
+# parameter list, generates the top-level, and runs it with sim_cache.run().
+#
+# Set SIM_MULTI=1 to run the multi-configuration tests instead of compiling and
+# simulating each parameter set separately.
+
+enabled = os.environ.get("SIM_MULTI", "0") not in ("", "0")
+
+
+def param_value(val):
+    # convert a Verilog parameter value to a Python value
+    if isinstance(val, int):
+        return val
+    val = str(val).strip()
+    if val.startswith('"') and val.endswith('"'):
+        return val[1:-1]
+    m = re.fullmatch(r"(\d*)'([bodhBODH])([0-9a-fA-F_xzXZ]+)", val)
+    if m:
+        return int(m.group(3).replace('_', ''), {'b': 2, 'o': 8, 'd': 10, 'h': 16}[m.group(2).lower()])
+    return int(val, 0)
+
+
+def read_ports(path, module):
+    # port names, directions, and width expressions from an ANSI-style module header
+    with open(path) as f:
+        text = f.read()
+
+    m = re.search(rf"module\s+{module}\b.*?\)\s*\((.*?)\);", text, re.S)
+    if not m:
+        raise ValueError(f"Module {module} not found in {path}")
+
+    ports = []
+    for d, width, name in re.findall(r"(input|output)\s+wire\s+(\[[^\]]*\])?\s*(\w+)", m.group(1)):
+        ports.append((d, name, width))
+    return ports
+
+
+def generate(dut, path, configs, output, name=None):
+    if name is None:
+        name = f"{dut}_multi"
+
+    ports = read_ports(path, dut)
+
+    lines = []
+
+    for k, params in enumerate(configs):
+        lines.append(f"// instance {k}")
+
+        for d, port, width in ports:
+            # substitute parameter values into width expressions
+            for p, v in params.items():
+                width = re.sub(rf"\b{p}\b", f"({v})", width)
+            if width:
+                width += " "
+            if d == "input":
+                lines.append(f"reg  {width}u{k}_{port} = 0;")
+            else:
+                lines.append(f"wire {width}u{k}_{port};")
+
+        lines.append("")
+        lines.append(f"{dut} #(")
+        lines.append(",\n".join(f"    .{p}({v})" for p, v in params.items()))
+        lines.append(")")
+        lines.append(f"u{k} (")
+        lines.append(",\n".join(f"    .{port}(u{k}_{port})" for d, port, width in ports))
+        lines.append(");")
+        lines.append("")
+
+    body = "\n".join(lines)
+
+    text = f"""// Language: Verilog 2001
+
+`resetall
+`timescale 1ns / 1ps
+`default_nettype none
+
+/*
+ * Multi-configuration wrapper for {dut} ({len(configs)} instances)
+ */
+module {name};
+
+{body}
+endmodule
+
+`resetall
+"""
+
+    with open(output, 'w') as f:
+        f.write(text)
+
+    return name
+
+
+def extra_env(configs):
+    return {'MULTI_CONFIGS': json.dumps(configs)}
+
+
+def configs():
+    val = os.environ.get("MULTI_CONFIGS")
+    return json.loads(val) if val else None
+
+
+class Param:
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == getattr(other, 'value', other)
+
+    def __int__(self):
+        return int(self.value)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.value!r})"
+
+
+class Instance:
+    def __init__(self, top, index, params):
+        self._top = top
+        self._prefix = f"u{index}_"
+        self._params = {k: Param(param_value(v)) for k, v in params.items()}
+
+    def __getattr__(self, name):
+        if name in self._params:
+            return self._params[name]
+        return getattr(self._top, self._prefix+name)
+
+
+def instances(top):
+    return [Instance(top, k, params) for k, params in enumerate(configs())]
+
+
+async def run_instance(dut, index, params, test, options):
+    # run the test on one instance, naming the instance and parameters on failure
+    try:
+        await test(Instance(dut, index, params), **options)
+    except Exception as ex:
+        desc = f"u{index} ({', '.join(f'{k}={v}' for k, v in params.items())})"
+        dut._log.error("Instance %s failed: %r", desc, ex)
+        raise AssertionError(f"Instance {desc} failed: {type(ex).__name__}: {ex}") from ex
+
+
+async def run_test_multi(dut, select_test):
+    tasks = []
+    for k, params in enumerate(configs()):
+        test, options = select_test(Instance(dut, k, params))
+        if test is not None:
+            tasks.append(cocotb.start_soon(run_instance(dut, k, params, test, options)))
+
+    for task in tasks:
+        await task
+
+
+def select_test(top, select):
+    # test coroutine and options for the toplevel, single or multi-configuration
+    if configs():
+        return run_test_multi, {'select_test': select}
+    return select(top)
+
+
+def verilog_value(val):
+    # Python parameter value as a Verilog expression, plain strings are Verilog strings
+    if isinstance(val, str) and "'" not in val:
+        return f'"{val}"'
+    return val
+
+
+def run_tests(dut, param_names, params, styles, tests_dir, request, sim):
+    # run the tests in the test module of the request for all parameter sets and
+    # styles in one simulation
+    module = os.path.splitext(os.path.basename(str(request.fspath)))[0]
+    rtl_dir = os.path.abspath(os.path.join(tests_dir, '..', '..', 'rtl'))
+
+    verilog_sources = [os.path.join(rtl_dir, f"{dut}.v")]
+    if dut != "lfsr":
+        verilog_sources.append(os.path.join(rtl_dir, "lfsr.v"))
+
+    configs = []
+    for values, style in itertools.product(params, styles):
+        parameters = {name: verilog_value(v) for name, v in zip(param_names, values)}
+        parameters['STYLE'] = verilog_value(style)
+        configs.append(parameters)
+
+    sim_build = os.path.join(tests_dir, "sim_build",
+        request.node.name.replace('[', '-').replace(']', ''))
+
+    os.makedirs(sim_build, exist_ok=True)
+    multi_src = os.path.join(sim_build, f"{dut}_multi.v")
+    toplevel = generate(dut, verilog_sources[0], configs, multi_src)
+
+    sim_cache.run(
+        simulator=sim,
+        python_search=[tests_dir],
+        verilog_sources=[multi_src]+verilog_sources,
+        toplevel=toplevel,
+        module=module,
+        sim_build=sim_build,
+        extra_env=extra_env(configs),
+    )
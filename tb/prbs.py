@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+"""
+
+Copyright (c) 2023 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import functools
+import operator
+import os
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from lfsr_model import lfsr_masks, lfsr_jump, lfsr_jump_matrix
+except ImportError:
+    # attempt import from current directory
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+    try:
+        from lfsr_model import lfsr_masks, lfsr_jump, lfsr_jump_matrix
+    finally:
+        del sys.path[0]
+
+
+# PRBS reference models.
+#
+# PrbsGen models lfsr_prbs_gen and produces whole DATA_WIDTH-bit words.  Both the
+# data output and the next state of the lfsr module are linear functions of the
+# current state, so they are precomputed as one lookup table per state byte.  Each
+# table entry holds {data_out, state_out} for that byte of state, and one output word
+# is the XOR of ceil(LFSR_WIDTH/8) table entries, independent of DATA_WIDTH.
+#
+# prbs_fill() generates long sequences with numpy.  The output buffer is split into
+# many sub-blocks, the starting state of each sub-block is computed with matrix
+# jumps, and then all sub-blocks are advanced together 64 bits at a time using the
+# same lookup tables as PrbsGen.
+#
+# Settings for common PRBS implementations (from the lfsr.v header):
+#
+# Name        Configuration           Length  Polynomial      Notes
+# PRBS6       Fibonacci               6       6'h21
+# PRBS7       Fibonacci               7       7'h41
+# PRBS9       Fibonacci               9       9'h021          ITU V.52
+# PRBS10      Fibonacci               10      10'h081         ITU
+# PRBS11      Fibonacci               11      11'h201         ITU O.152
+# PRBS15      Fibonacci, inverted     15      15'h4001        ITU O.152
+# PRBS17      Fibonacci               17      17'h04001
+# PRBS20      Fibonacci               20      20'h00009       ITU V.57
+# PRBS23      Fibonacci, inverted     23      23'h040001      ITU O.151
+# PRBS29      Fibonacci, inverted     29      29'h08000001
+# PRBS31      Fibonacci, inverted     31      31'h10000001
+
+PRBS_SETTINGS = {
+    'PRBS6':  dict(lfsr_width=6,  lfsr_poly=0x21,       lfsr_config="FIBONACCI", invert=0),
+    'PRBS7':  dict(lfsr_width=7,  lfsr_poly=0x41,       lfsr_config="FIBONACCI", invert=0),
+    'PRBS9':  dict(lfsr_width=9,  lfsr_poly=0x021,      lfsr_config="FIBONACCI", invert=0),
+    'PRBS10': dict(lfsr_width=10, lfsr_poly=0x081,      lfsr_config="FIBONACCI", invert=0),
+    'PRBS11': dict(lfsr_width=11, lfsr_poly=0x201,      lfsr_config="FIBONACCI", invert=0),
+    'PRBS15': dict(lfsr_width=15, lfsr_poly=0x4001,     lfsr_config="FIBONACCI", invert=1),
+    'PRBS17': dict(lfsr_width=17, lfsr_poly=0x04001,    lfsr_config="FIBONACCI", invert=0),
+    'PRBS20': dict(lfsr_width=20, lfsr_poly=0x00009,    lfsr_config="FIBONACCI", invert=0),
+    'PRBS23': dict(lfsr_width=23, lfsr_poly=0x040001,   lfsr_config="FIBONACCI", invert=1),
+    'PRBS29': dict(lfsr_width=29, lfsr_poly=0x08000001, lfsr_config="FIBONACCI", invert=1),
+    'PRBS31': dict(lfsr_width=31, lfsr_poly=0x10000001, lfsr_config="FIBONACCI", invert=1),
+}
+
+
+@functools.lru_cache(maxsize=None)
+def prbs_tables(lfsr_width, lfsr_poly, lfsr_config, reverse, data_width):
+    masks = lfsr_masks(lfsr_width, lfsr_poly, lfsr_config, 0, reverse, data_width)
+    state_mask = 2**lfsr_width-1
+
+    # columns: contribution of each state bit to {data_out, state_out}
+    cols = []
+    for i in range(lfsr_width):
+        val = 0
+        for n, mask in enumerate(masks):
+            if (mask >> i) & 1:
+                val |= 1 << n
+        cols.append(val)
+
+    tables = []
+    for k in range(0, lfsr_width, 8):
+        table = [0]*256
+        for b in range(1, 256):
+            low = b & -b
+            i = k + low.bit_length()-1
+            table[b] = table[b ^ low] ^ (cols[i] if i < lfsr_width else 0)
+        tables.append(tuple(table))
+
+    return tuple(tables), state_mask
+
+
+class PrbsGen:
+    def __init__(self, lfsr_width=31, lfsr_poly=0x10000001, lfsr_init=None, lfsr_config="FIBONACCI",
+            reverse=0, invert=1, data_width=8):
+        self.lfsr_width = lfsr_width
+        self.lfsr_poly = lfsr_poly
+        self.lfsr_config = lfsr_config
+        self.reverse = int(bool(reverse))
+        self.invert = int(bool(invert))
+        self.data_width = data_width
+
+        self.state_mask = 2**lfsr_width-1
+        self.data_mask = 2**data_width-1
+        self.lfsr_init = self.state_mask if lfsr_init is None else lfsr_init
+
+        self.tables, _ = prbs_tables(lfsr_width, lfsr_poly, lfsr_config, self.reverse, data_width)
+        self.nbytes = len(self.tables)
+        self.out_invert = self.data_mask << lfsr_width if self.invert else 0
+
+        self.state = self.lfsr_init
+
+    def __repr__(self):
+        return (f"{type(self).__name__}(lfsr_width={self.lfsr_width}, lfsr_poly={self.lfsr_poly:#x}, "
+            f"lfsr_init={self.lfsr_init:#x}, lfsr_config={self.lfsr_config!r}, reverse={self.reverse}, "
+            f"invert={self.invert}, data_width={self.data_width})")
+
+    def reset(self):
+        self.state = self.lfsr_init
+
+    def seek(self, n):
+        # move by n words relative to the current position
+        self.state = lfsr_jump(self.state, n*self.data_width, self.lfsr_width, self.lfsr_poly,
+            self.lfsr_config, self.reverse)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        # data_out for the current state, then advance (enable asserted)
+        val = functools.reduce(operator.xor,
+            map(operator.getitem, self.tables, self.state.to_bytes(self.nbytes, 'little')))
+        val ^= self.out_invert
+        self.state = val & self.state_mask
+        return val >> self.lfsr_width
+
+    def words(self, count):
+        tables = self.tables
+        nbytes = self.nbytes
+        state_mask = self.state_mask
+        out_invert = self.out_invert
+        lfsr_width = self.lfsr_width
+        xor = operator.xor
+        getitem = operator.getitem
+        reduce = functools.reduce
+
+        state = self.state
+        out = []
+        for k in range(count):
+            val = reduce(xor, map(getitem, tables, state.to_bytes(nbytes, 'little')))
+            state = val & state_mask
+            out.append((val ^ out_invert) >> lfsr_width)
+        self.state = state
+        return out
+
+
+@functools.lru_cache(maxsize=None)
+def prbs_np_tables(lfsr_width, lfsr_poly, lfsr_config, reverse):
+    # split {data_out, state_out} tables for 64-bit words into data and state arrays
+    tables, state_mask = prbs_tables(lfsr_width, lfsr_poly, lfsr_config, reverse, 64)
+    data_tables = np.array([[v >> lfsr_width for v in t] for t in tables], dtype=np.uint64)
+    state_tables = np.array([[v & state_mask for v in t] for t in tables], dtype=np.uint64)
+    return data_tables, state_tables
+
+
+def np_parity(val):
+    val = val ^ (val >> np.uint64(32))
+    val ^= val >> np.uint64(16)
+    val ^= val >> np.uint64(8)
+    val ^= val >> np.uint64(4)
+    val ^= val >> np.uint64(2)
+    val ^= val >> np.uint64(1)
+    return val & np.uint64(1)
+
+
+def np_mat_vec(a, vec):
+    # GF(2) matrix-vector product over an array of states
+    out = np.zeros_like(vec)
+    for n, row in enumerate(a):
+        out |= np_parity(vec & np.uint64(row)) << np.uint64(n)
+    return out
+
+
+def prbs_fill(buf, lfsr_width=31, lfsr_poly=0x10000001, state=None, lfsr_config="FIBONACCI",
+        reverse=0, invert=1, block_words=256):
+    # Fill buf with the PRBS sequence starting from state, returns the next state
+    #
+    # buf is a numpy uint64 array, filled with 64-bit words as produced by lfsr_prbs_gen
+    # with DATA_WIDTH=64, or a uint8 array, filled with the same bit stream packed into
+    # bytes in lfsr_prbs_gen DATA_WIDTH=8 order.
+
+    if np is None:
+        raise ImportError("prbs_fill requires numpy")
+    if lfsr_width > 64:
+        raise ValueError("prbs_fill supports LFSR_WIDTH up to 64")
+
+    state_mask = 2**lfsr_width-1
+    state = state_mask if state is None else state & state_mask
+    reverse = int(bool(reverse))
+    params = (lfsr_width, lfsr_poly, lfsr_config, reverse)
+
+    if buf.dtype == np.uint64:
+        words = buf
+        tail = buf[len(buf):].view(np.uint8)
+    elif buf.dtype == np.uint8:
+        n = len(buf) - len(buf) % 8
+        words = buf[:n].view('<u8' if reverse else '>u8')
+        tail = buf[n:]
+    else:
+        raise TypeError("Buffer must be uint64 or uint8")
+
+    count = len(words)
+    block_words = max(1, min(block_words, count))
+    lanes = count // block_words
+
+    if lanes:
+        data_tables, state_tables = prbs_np_tables(*params)
+        out = words[:lanes*block_words].reshape(lanes, block_words)
+
+        # starting states of all sub-blocks by repeated doubling
+        states = np.array([state], dtype=np.uint64)
+        while len(states) < lanes:
+            n = min(len(states), lanes-len(states))
+            jump = lfsr_jump_matrix(len(states)*block_words*64, *params)
+            states = np.concatenate((states, np_mat_vec(jump, states[:n])))
+
+        inv = np.uint64(2**64-1 if invert else 0)
+        shifts = [np.uint64(k) for k in range(0, lfsr_width, 8)]
+        byte_mask = np.uint64(0xff)
+
+        for i in range(block_words):
+            data = np.zeros(lanes, dtype=np.uint64)
+            next_states = np.zeros(lanes, dtype=np.uint64)
+            for k, shift in enumerate(shifts):
+                idx = (states >> shift) & byte_mask
+                data ^= data_tables[k][idx]
+                next_states ^= state_tables[k][idx]
+            out[:, i] = data ^ inv
+            states = next_states
+
+        state = int(states[-1])
+
+    # remaining words and bytes
+    gen = PrbsGen(lfsr_width, lfsr_poly, state, lfsr_config, reverse, invert, 64)
+    for k in range(lanes*block_words, count):
+        words[k] = next(gen)
+    gen = PrbsGen(lfsr_width, lfsr_poly, gen.state, lfsr_config, reverse, invert, 8)
+    for k in range(len(tail)):
+        tail[k] = next(gen)
+
+    return gen.state
@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+"""
+
+Copyright (c) 2023 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import argparse
+import concurrent.futures
+import functools
+import json
+import mmap
+import os
+import re
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from lfsr_model import Lfsr, popcount
+    from prbs import PRBS_SETTINGS
+except ImportError:
+    # attempt import from current directory
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+    try:
+        from lfsr_model import Lfsr, popcount
+        from prbs import PRBS_SETTINGS
+    finally:
+        del sys.path[0]
+
+
+# Streaming PRBS checker for captured data files.
+#
+# The capture is treated as a serial bit stream in file order, MSB first within
+# each byte (REVERSE=0) or LSB first (REVERSE=1).  This is the byte stream of
+# lfsr_prbs_gen output words stored big-endian for REVERSE=0 and little-endian
+# for REVERSE=1, for any DATA_WIDTH that is a multiple of 8.
+#
+# The self-synchronizing checker (lfsr_prbs_check, LFSR_FEED_FORWARD=1) is a
+# linear, time-invariant FIR filter over GF(2): the error stream is the received
+# stream convolved with the impulse response of the checker, which is derived
+# from the lfsr model for the given polynomial and configuration.  INVERT
+# complements the input, which flips every error bit when the impulse response
+# has odd weight.  A chunk of the file is loaded as one Python integer and the
+# convolution is a few shifts and XORs of that integer, followed by
+# int.bit_count for the error count.  Error positions are located by scanning
+# for nonzero bytes.
+#
+# Like the hardware checker, the first taps bits of the file are used to
+# synchronize and are not checked.  Loss-of-lock events are runs of windows
+# (window bits each) with an error ratio above the threshold; the checker
+# re-synchronizes by itself once LFSR_WIDTH correct bits have been received.
+#
+# The file is memory-mapped and split into chunks that are processed in a
+# process pool.  Each chunk also reads the preceding bytes needed for the
+# checker history, so chunks are independent.
+
+default_chunk_size = 64 << 20
+
+if np is not None:
+    popcount_table = np.array([bin(k).count("1") for k in range(256)], dtype=np.uint8)
+
+
+@functools.lru_cache(maxsize=None)
+def impulse_response(lfsr_width, lfsr_poly, lfsr_config="FIBONACCI"):
+    # delays (in bits) of the checker taps, including 0 for the current bit
+    lfsr = Lfsr(lfsr_width, lfsr_poly, lfsr_config, lfsr_feed_forward=1, reverse=0, data_width=1)
+    state = 0
+    taps = []
+    for n in range(2*lfsr_width+2):
+        out, state = lfsr.step(1 if n == 0 else 0, state)
+        if out:
+            taps.append(n)
+    if state or any(n > lfsr_width for n in taps):
+        raise ValueError("Checker is not a finite impulse response filter for this configuration")
+    return tuple(taps)
+
+
+def check_chunk(path, offset, length, taps, invert, reverse, window_bits, threshold, max_positions):
+    # returns (errors, error positions, bad window runs) for bytes offset to offset+length
+    span = taps[-1]
+    start = max(offset - (span+7)//8, 0)
+    nbits = length*8
+
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        buf = mm[start:offset+length]
+
+    if reverse:
+        # serial bit n at integer bit n, history in the low bits
+        x = int.from_bytes(buf, 'little')
+        e = 0
+        for d in taps:
+            e ^= x << d
+        e >>= (offset-start)*8
+    else:
+        # serial bit n at integer bit len-1-n, history in the high bits
+        x = int.from_bytes(buf, 'big')
+        e = 0
+        for d in taps:
+            e ^= x >> d
+    e &= (1 << nbits)-1
+
+    if invert and len(taps) % 2:
+        e ^= (1 << nbits)-1
+
+    if offset == 0:
+        # synchronization
+        sync = (1 << min(span, nbits))-1
+        e &= ~(sync if reverse else sync << (nbits-min(span, nbits)))
+
+    errors = popcount(e)
+    eb = e.to_bytes(length, 'little' if reverse else 'big')
+    del x, e
+
+    positions = []
+    if errors:
+        for m in re.finditer(rb'[^\x00]', eb):
+            if len(positions) >= max_positions:
+                break
+            b = eb[m.start()]
+            for k in range(8):
+                if (b >> (k if reverse else 7-k)) & 1:
+                    positions.append((offset+m.start())*8+k)
+        positions = positions[:max_positions]
+
+    # windows with error ratio above the threshold, as runs of (first, last, errors)
+    runs = []
+    if errors > threshold*window_bits:
+        wb = window_bits // 8
+        first = offset // wb
+        if np is not None:
+            arr = np.frombuffer(eb, dtype=np.uint8)
+            pad = -len(arr) % wb
+            if pad:
+                arr = np.concatenate((arr, np.zeros(pad, dtype=np.uint8)))
+            counts = popcount_table[arr].reshape(-1, wb).sum(axis=1, dtype=np.int64).tolist()
+        else:
+            counts = [popcount(int.from_bytes(eb[k:k+wb], 'big')) for k in range(0, length, wb)]
+        for j, c in enumerate(counts):
+            if c > threshold*window_bits:
+                if runs and runs[-1][1] == first+j-1:
+                    runs[-1][1] = first+j
+                    runs[-1][2] += c
+                else:
+                    runs.append([first+j, first+j, c])
+
+    return errors, positions, runs
+
+
+def check_file(path, lfsr_width=31, lfsr_poly=0x10000001, lfsr_config="FIBONACCI", invert=1, reverse=0,
+        chunk_size=default_chunk_size, jobs=None, window_bits=4096, threshold=0.1, max_positions=100):
+    taps = impulse_response(lfsr_width, lfsr_poly, lfsr_config)
+
+    if window_bits % 8:
+        raise ValueError("Window size must be a multiple of 8 bits")
+
+    size = os.path.getsize(path)
+    wb = window_bits // 8
+    chunk_size = max(chunk_size // wb, 1) * wb
+    chunks = [(k, min(chunk_size, size-k)) for k in range(0, size, chunk_size)]
+
+    args = (taps, invert, reverse, window_bits, threshold, max_positions)
+
+    if jobs == 1 or len(chunks) <= 1:
+        results = (check_chunk(path, offset, length, *args) for offset, length in chunks)
+        return summarize(size, taps, window_bits, max_positions, results)
+
+    with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+        futures = [executor.submit(check_chunk, path, offset, length, *args) for offset, length in chunks]
+        return summarize(size, taps, window_bits, max_positions, (f.result() for f in futures))
+
+
+def summarize(size, taps, window_bits, max_positions, results):
+    errors = 0
+    positions = []
+    events = []
+    for e, pos, runs in results:
+        errors += e
+        positions.extend(pos[:max_positions-len(positions)])
+        for first, last, c in runs:
+            if events and events[-1]['end'] == first*window_bits:
+                events[-1]['end'] = (last+1)*window_bits
+                events[-1]['errors'] += c
+            else:
+                events.append({'start': first*window_bits, 'end': (last+1)*window_bits, 'errors': c})
+
+    bits = max(size*8 - taps[-1], 0)
+    for ev in events:
+        ev['end'] = min(ev['end'], size*8)
+
+    return {
+        'bits': bits,
+        'errors': errors,
+        'ber': errors / bits if bits else 0.0,
+        'error_positions': positions,
+        'loss_of_lock': events,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming PRBS checker for captured data files")
+    parser.add_argument('file', type=str, help="capture file")
+    parser.add_argument('--prbs', type=str, choices=list(PRBS_SETTINGS), help="PRBS pattern (sets width, poly, config and invert)")
+    parser.add_argument('-w', '--lfsr-width', type=int, default=31, help="LFSR width")
+    parser.add_argument('-p', '--lfsr-poly', type=lambda x: int(x, 0), default=0x10000001, help="LFSR polynomial")
+    parser.add_argument('-c', '--lfsr-config', type=str, default="FIBONACCI", help="LFSR configuration (FIBONACCI or GALOIS)")
+    parser.add_argument('-i', '--invert', type=int, default=None, help="invert input (default from --prbs, else 1)")
+    parser.add_argument('-r', '--reverse', type=int, default=0, help="LSB first within each byte")
+    parser.add_argument('--chunk-size', type=int, default=default_chunk_size >> 20, help="chunk size (MB)")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="worker processes (default CPU count)")
+    parser.add_argument('--window', type=int, default=4096, help="loss-of-lock window (bits)")
+    parser.add_argument('--threshold', type=float, default=0.1, help="loss-of-lock error ratio")
+    parser.add_argument('--max-positions', type=int, default=100, help="number of error positions to report")
+    parser.add_argument('--json', action='store_true', help="print JSON report")
+
+    args = parser.parse_args()
+
+    settings = dict(lfsr_width=args.lfsr_width, lfsr_poly=args.lfsr_poly, lfsr_config=args.lfsr_config, invert=1)
+    if args.prbs:
+        settings.update(PRBS_SETTINGS[args.prbs])
+    if args.invert is not None:
+        settings['invert'] = args.invert
+
+    report = check_file(args.file, reverse=args.reverse, chunk_size=args.chunk_size << 20, jobs=args.jobs,
+        window_bits=args.window, threshold=args.threshold, max_positions=args.max_positions, **settings)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"Bits:   {report['bits']}")
+    print(f"Errors: {report['errors']}")
+    print(f"BER:    {report['ber']:.3e}")
+    if report['error_positions']:
+        print(f"Error positions (bit offset): {', '.join(str(p) for p in report['error_positions'])}")
+    for ev in report['loss_of_lock']:
+        print(f"Loss of lock: bits {ev['start']} to {ev['end']}, {ev['errors']} errors")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+"""
+
+Copyright (c) 2023 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import argparse
+import functools
+import math
+import operator
+import os
+import sys
+
+try:
+    from lfsr_model import (lfsr_masks, lfsr_jump, lfsr_shift_matrix, gf2_mat_inv, gf2_mat_vec,
+        gf2_poly_mulmod, gf2_poly_powmod, factor, mersenne_factors)
+    from prbs import PRBS_SETTINGS
+except ImportError:
+    # attempt import from current directory
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+    try:
+        from lfsr_model import (lfsr_masks, lfsr_jump, lfsr_shift_matrix, gf2_mat_inv, gf2_mat_vec,
+            gf2_poly_mulmod, gf2_poly_powmod, factor, mersenne_factors)
+        from prbs import PRBS_SETTINGS
+    finally:
+        del sys.path[0]
+
+
+# PRBS lock position solver.
+#
+# Finds the position of received PRBS data in the sequence of lfsr_prbs_gen,
+# as the number of bits generated since the LFSR was set to LFSR_INIT.
+#
+# The first LFSR_WIDTH received bits are a linear function of the LFSR state
+# before the first bit (the data_out masks of lfsr_masks() with
+# DATA_WIDTH=LFSR_WIDTH), so the state is recovered by inverting that matrix.
+# Any further received bits are checked against the sequence from that state.
+#
+# For the offset, the single-shift state matrix A is mapped onto GF(2^n): a
+# state s corresponds to the polynomial P(x) with s = P(A) s0 for the fixed
+# state s0 = 1, found with the inverse of the Krylov matrix [s0, A s0, ...,
+# A^(n-1) s0], and one shift is multiplication by x modulo the characteristic
+# polynomial of A.  The offset n of state s from LFSR_INIT is then the discrete
+# logarithm x^n = P_s / P_init, computed with Pohlig-Hellman over the factors
+# of the order of x and baby-step giant-step for each prime factor.  Both the
+# baby-step tables and the multiply-by-constant steps (byte lookup tables, as
+# in prbs.py) are cached per polynomial, so repeated solves for the same
+# pattern cost only the giant steps.  PRBS31 (2^31-1 is prime) takes about
+# 46k giant steps at most.
+#
+# The received data uses the same bit order as prbs_check.py: the serial
+# bit stream in file order, MSB first within each byte for REVERSE=0 and LSB
+# first for REVERSE=1.
+
+max_bsgs_order = 1 << 48
+
+
+@functools.lru_cache(maxsize=None)
+def prbs_field(lfsr_width, lfsr_poly, lfsr_config="FIBONACCI", reverse=0):
+    # returns (Krylov matrix inverse, modulus, order of x)
+    a = lfsr_shift_matrix(lfsr_width, lfsr_poly, lfsr_config, reverse)
+
+    cols = [1]
+    for k in range(lfsr_width):
+        cols.append(gf2_mat_vec(a, cols[-1]))
+    krylov = tuple(sum(((c >> n) & 1) << i for i, c in enumerate(cols[:lfsr_width])) for n in range(lfsr_width))
+    try:
+        k_inv = gf2_mat_inv(krylov)
+    except ValueError:
+        raise ValueError("Polynomial is not irreducible") from None
+
+    # characteristic polynomial from A^n s0 in the Krylov basis
+    modulus = (1 << lfsr_width) | gf2_mat_vec(k_inv, cols[lfsr_width])
+
+    order = 2**lfsr_width-1
+    if gf2_poly_powmod(2, order, modulus) != 1:
+        raise ValueError("Polynomial is not irreducible")
+    for p in mersenne_factors(lfsr_width):
+        while order % p == 0 and gf2_poly_powmod(2, order // p, modulus) == 1:
+            order //= p
+
+    return k_inv, modulus, order
+
+
+@functools.lru_cache(maxsize=None)
+def mul_tables(c, modulus):
+    # byte lookup tables for multiplication by c modulo modulus
+    width = modulus.bit_length()-1
+    cols = []
+    val = c
+    for i in range(width):
+        cols.append(val)
+        val = gf2_poly_mulmod(val, 2, modulus)
+
+    tables = []
+    for k in range(0, width, 8):
+        table = [0]*256
+        for b in range(1, 256):
+            low = b & -b
+            i = k + low.bit_length()-1
+            table[b] = table[b ^ low] ^ (cols[i] if i < width else 0)
+        tables.append(tuple(table))
+    return tuple(tables)
+
+
+def mul_table_apply(tables, val):
+    return functools.reduce(operator.xor, map(operator.getitem, tables, val.to_bytes(len(tables), 'little')))
+
+
+@functools.lru_cache(maxsize=None)
+def bsgs_table(gamma, p, modulus):
+    # baby steps {gamma^j: j} for j < m, and the tables for multiplication by gamma^-m
+    if p > max_bsgs_order:
+        raise ValueError(f"Prime factor {p} is too large for baby-step giant-step")
+    m = math.isqrt(p-1)+1
+    tables = mul_tables(gamma, modulus)
+    baby = {}
+    val = 1
+    for j in range(m):
+        baby.setdefault(val, j)
+        val = mul_table_apply(tables, val)
+    giant = mul_tables(gf2_poly_powmod(gamma, p-m % p, modulus), modulus)
+    return baby, m, giant
+
+
+def bsgs(gamma, h, p, modulus):
+    # d with gamma^d = h, where gamma has prime order p
+    baby, m, giant = bsgs_table(gamma, p, modulus)
+    val = h
+    for i in range(m):
+        j = baby.get(val)
+        if j is not None:
+            return (i*m + j) % p
+        val = mul_table_apply(giant, val)
+    raise ValueError("Element is not in the subgroup")
+
+
+def dlog(h, modulus, order):
+    # n with x^n = h modulo modulus, x of the given order (Pohlig-Hellman)
+    n = 0
+    mod = 1
+    for p, e in factor(order).items():
+        gamma = gf2_poly_powmod(2, order // p, modulus)
+        xp = 0
+        for k in range(e):
+            hk = gf2_poly_mulmod(h, gf2_poly_powmod(2, (order-xp) % order, modulus), modulus)
+            hk = gf2_poly_powmod(hk, order // p**(k+1), modulus)
+            xp += bsgs(gamma, hk, p, modulus) * p**k
+        # combine with the Chinese remainder theorem
+        pe = p**e
+        n += mod * ((xp - n) * pow(mod, -1, pe) % pe)
+        mod *= pe
+    return n % order
+
+
+bit_reverse_table = bytes(int(f"{b:08b}"[::-1], 2) for b in range(256))
+
+
+def serial_bits(data, reverse=0):
+    # received bytes as an integer with serial bit n in bit n
+    if not reverse:
+        data = bytes(data).translate(bit_reverse_table)
+    return int.from_bytes(data, 'little')
+
+
+class PrbsLock:
+    def __init__(self, lfsr_width=31, lfsr_poly=0x10000001, lfsr_init=None, lfsr_config="FIBONACCI",
+            reverse=0, invert=1):
+        self.lfsr_width = lfsr_width
+        self.lfsr_poly = lfsr_poly
+        self.lfsr_config = lfsr_config
+        self.reverse = int(bool(reverse))
+        self.invert = int(bool(invert))
+
+        self.state_mask = 2**lfsr_width-1
+        self.lfsr_init = self.state_mask if lfsr_init is None else lfsr_init
+
+        # data_out for LFSR_WIDTH bits as a function of the state
+        masks = lfsr_masks(lfsr_width, lfsr_poly, lfsr_config, 0, self.reverse, lfsr_width)
+        self.out_matrix = tuple(m & self.state_mask for m in masks[lfsr_width:])
+        self.out_inv = gf2_mat_inv(self.out_matrix)
+
+        self.k_inv, self.modulus, self.period = prbs_field(lfsr_width, lfsr_poly, lfsr_config, self.reverse)
+        self.init_log = self.log(self.lfsr_init)
+
+    def __repr__(self):
+        return (f"{type(self).__name__}(lfsr_width={self.lfsr_width}, lfsr_poly={self.lfsr_poly:#x}, "
+            f"lfsr_init={self.lfsr_init:#x}, lfsr_config={self.lfsr_config!r}, reverse={self.reverse}, "
+            f"invert={self.invert})")
+
+    def word(self, bits):
+        # LFSR_WIDTH serial bits (bit n = serial bit n) to a data_out word
+        if self.reverse:
+            word = bits & self.state_mask
+        else:
+            word = int(f"{bits & self.state_mask:0{self.lfsr_width}b}"[::-1], 2)
+        return word ^ (self.state_mask if self.invert else 0)
+
+    def state(self, bits):
+        # LFSR state before the first of LFSR_WIDTH serial bits
+        return gf2_mat_vec(self.out_inv, self.word(bits))
+
+    def log(self, state):
+        # discrete log of the state relative to the state 1
+        if not state & self.state_mask:
+            raise ValueError("All-zero state is not part of the sequence")
+        return dlog(gf2_mat_vec(self.k_inv, state), self.modulus, self.period)
+
+    def offset(self, state):
+        # number of shifts from LFSR_INIT to state
+        n = (self.log(state) - self.init_log) % self.period
+        if lfsr_jump(self.lfsr_init, n, self.lfsr_width, self.lfsr_poly, self.lfsr_config, self.reverse) != state:
+            raise ValueError("State is not in the sequence from LFSR_INIT")
+        return n
+
+    def expected(self, state, nbits):
+        # nbits serial bits starting from state
+        bits = 0
+        for k in range(0, nbits, self.lfsr_width):
+            bits |= self.bits(state) << k
+            state = lfsr_jump(state, self.lfsr_width, self.lfsr_width, self.lfsr_poly,
+                self.lfsr_config, self.reverse)
+        return bits & (2**nbits-1)
+
+    def bits(self, state):
+        # LFSR_WIDTH serial bits from state (inverse of state())
+        word = gf2_mat_vec(self.out_matrix, state) ^ (self.state_mask if self.invert else 0)
+        if self.reverse:
+            return word
+        return int(f"{word:0{self.lfsr_width}b}"[::-1], 2)
+
+    def locate(self, data, skip=0, verify=256):
+        # offset of bit 0 of data (bytes) in the sequence, using the bits from skip onwards;
+        # raises ValueError if the following verify bits do not match
+        nbits = len(data)*8 - skip
+        if nbits < self.lfsr_width:
+            raise ValueError(f"Need at least {self.lfsr_width} bits, got {nbits}")
+
+        bits = serial_bits(data, self.reverse) >> skip
+        state = self.state(bits)
+
+        nbits = min(nbits, self.lfsr_width+verify)
+        mismatch = (bits ^ self.expected(state, nbits)) & (2**nbits-1)
+        if mismatch:
+            raise ValueError(f"Data does not match the sequence at bit {skip + (mismatch & -mismatch).bit_length()-1}")
+
+        return (self.offset(state) - skip) % self.period
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the position of captured data in a PRBS sequence")
+    parser.add_argument('files', type=str, nargs='*', help="capture files (one per lane)")
+    parser.add_argument('-x', '--hex', type=str, action='append', default=[], help="captured data as hex bytes")
+    parser.add_argument('--prbs', type=str, default="PRBS31", choices=list(PRBS_SETTINGS), help="PRBS pattern")
+    parser.add_argument('-s', '--seed', type=lambda x: int(x, 0), help="LFSR_INIT (default all ones)")
+    parser.add_argument('-i', '--invert', type=int, help="inverted data (default from the PRBS table)")
+    parser.add_argument('-r', '--reverse', type=int, default=0, help="LSB first within each byte")
+    parser.add_argument('--skip', type=int, default=0, help="bits to skip before locking")
+    parser.add_argument('--verify', type=int, default=256, help="bits to verify after the lock window")
+
+    args = parser.parse_args()
+
+    settings = dict(PRBS_SETTINGS[args.prbs])
+    if args.invert is not None:
+        settings['invert'] = args.invert
+
+    lock = PrbsLock(lfsr_init=args.seed, reverse=args.reverse, **settings)
+
+    lanes = []
+    for path in args.files:
+        with open(path, 'rb') as f:
+            lanes.append((path, f.read((args.skip + lock.lfsr_width + args.verify + 7) // 8)))
+    for k, val in enumerate(args.hex):
+        lanes.append((f"hex{k}", bytes.fromhex(val)))
+
+    if not lanes:
+        parser.error("No data")
+
+    failed = False
+    ref = None
+    for name, data in lanes:
+        try:
+            n = lock.locate(data, args.skip, args.verify)
+        except ValueError as ex:
+            print(f"{name}: {ex}")
+            failed = True
+            continue
+        if ref is None:
+            ref = n
+        # skew relative to the first lane, in (-period/2, period/2]
+        skew = (n - ref) % lock.period
+        if skew > lock.period // 2:
+            skew -= lock.period
+        print(f"{name}: offset {n} bits (period {lock.period}), skew {skew:+d} bits")
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
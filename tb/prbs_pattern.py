@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+"""
+
+Copyright (c) 2023 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import argparse
+import math
+import os
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from prbs import PRBS_SETTINGS, prbs_fill
+except ImportError:
+    # attempt import from current directory
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+    try:
+        from prbs import PRBS_SETTINGS, prbs_fill
+    finally:
+        del sys.path[0]
+
+
+# PRBS pattern file generator.
+#
+# Writes count DATA_WIDTH-bit words of lfsr_prbs_gen output, starting from
+# LFSR_INIT (the seed), to a file in one of these formats:
+#
+# bin   each word in ceil(DATA_WIDTH/8) bytes, big-endian for REVERSE=0 and
+#       little-endian for REVERSE=1.  For DATA_WIDTH a multiple of 8 this is the
+#       serial bit stream, as read by prbs_check.py
+# hex   the bin output as hex text, 32 bytes per line
+# memh  one word per line in hex, with a comment header, for $readmemh
+#
+# The default count is one full period of 2^LFSR_WIDTH-1 bits, rounded up to
+# whole words.  Unless DATA_WIDTH divides 2^LFSR_WIDTH-1, the last word then
+# runs into the next period, so a generator that loops the file has a phase
+# slip at the wrap.  With loop set, the count is lcm(2^LFSR_WIDTH-1, DATA_WIDTH)
+# bits instead (DATA_WIDTH periods at most), and the file repeats seamlessly.
+#
+# The sequence is produced with prbs_fill() in fixed-size blocks of the serial
+# bit stream (DATA_WIDTH=8 byte order), which are repacked into words with
+# NumPy, so memory use depends only on the block size.
+
+formats = ["bin", "hex", "memh"]
+
+default_block_size = 4 << 20
+
+if np is not None:
+    hex_digits = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+    hex_pairs = np.stack((hex_digits.repeat(16), np.tile(hex_digits, 16)), axis=1)
+
+
+def period_words(lfsr_width, data_width):
+    return -(-(2**lfsr_width-1) // data_width)
+
+
+def loop_words(lfsr_width, data_width):
+    # shortest whole number of words that is also a whole number of periods
+    return math.lcm(2**lfsr_width-1, data_width) // data_width
+
+
+def pack_words(stream, count, data_width, reverse):
+    # split serial stream bytes into count words of ceil(data_width/8) bytes each,
+    # in the byte order of the bin format
+    nbytes = (data_width+7) // 8
+    if data_width % 8 == 0:
+        return stream[:count*nbytes].reshape(count, nbytes)
+
+    order = 'little' if reverse else 'big'
+    bits = np.unpackbits(stream, bitorder=order)[:count*data_width].reshape(count, data_width)
+    pad = np.zeros((count, nbytes*8-data_width), dtype=np.uint8)
+    # the first bit of each word is the MSB for REVERSE=0 and the LSB for REVERSE=1
+    bits = np.concatenate((bits, pad) if reverse else (pad, bits), axis=1)
+    return np.packbits(bits, axis=1, bitorder=order)
+
+
+def format_memh(words, data_width, reverse):
+    # one word per line in hex
+    digits = (data_width+3) // 4
+    if reverse:
+        words = words[:, ::-1]
+    text = hex_pairs[words].reshape(len(words), -1)[:, -digits:]
+    newline = np.full((len(words), 1), ord('\n'), dtype=np.uint8)
+    return np.concatenate((text, newline), axis=1).tobytes()
+
+
+def format_hex(data, line_bytes=32):
+    # hex text, line_bytes per line
+    text = hex_pairs[np.frombuffer(data, dtype=np.uint8)].reshape(-1)
+    lines = len(text) // (line_bytes*2)
+    out = [np.concatenate((text[:lines*line_bytes*2].reshape(lines, -1),
+        np.full((lines, 1), ord('\n'), dtype=np.uint8)), axis=1).tobytes()]
+    if len(text) > lines*line_bytes*2:
+        out.append(text[lines*line_bytes*2:].tobytes() + b"\n")
+    return b"".join(out)
+
+
+def pattern_blocks(count, lfsr_width=31, lfsr_poly=0x10000001, lfsr_init=None, lfsr_config="FIBONACCI",
+        reverse=0, invert=1, data_width=8, block_size=default_block_size):
+    # yields the pattern as arrays of words, block_size stream bytes at a time
+    if np is None:
+        raise ImportError("prbs_pattern requires numpy")
+
+    # whole hex lines and whole bytes per block
+    step = 256
+    block_words = max(block_size*8 // data_width // step, 1) * step
+
+    state = lfsr_init
+    buf = np.zeros((block_words*data_width+7) // 8, dtype=np.uint8)
+    for k in range(0, count, block_words):
+        n = min(block_words, count-k)
+        stream = buf[:(n*data_width+7) // 8]
+        state = prbs_fill(stream, lfsr_width, lfsr_poly, state, lfsr_config, reverse, invert)
+        yield pack_words(stream, n, data_width, reverse)
+
+
+def write_pattern(path, fmt="bin", count=None, lfsr_width=31, lfsr_poly=0x10000001, lfsr_init=None,
+        lfsr_config="FIBONACCI", reverse=0, invert=1, data_width=8, block_size=default_block_size, name=None,
+        loop=False):
+    if fmt not in formats:
+        raise ValueError(f"Unknown format {fmt!r}")
+    if count is None:
+        count = loop_words(lfsr_width, data_width) if loop else period_words(lfsr_width, data_width)
+    if lfsr_init is None:
+        lfsr_init = 2**lfsr_width-1
+
+    blocks = pattern_blocks(count, lfsr_width, lfsr_poly, lfsr_init, lfsr_config,
+        reverse, invert, data_width, block_size)
+
+    with open(path, 'wb') as f:
+        if fmt == "memh":
+            f.write(f"// {name or 'PRBS'}: LFSR_WIDTH={lfsr_width} LFSR_POLY={lfsr_width}'h{lfsr_poly:x} "
+                f"LFSR_INIT={lfsr_width}'h{lfsr_init:x} LFSR_CONFIG=\"{lfsr_config}\" "
+                f"REVERSE={reverse} INVERT={invert} DATA_WIDTH={data_width}\n"
+                f"// {count} words\n".encode())
+
+        for words in blocks:
+            if fmt == "bin":
+                f.write(words.tobytes())
+            elif fmt == "hex":
+                f.write(format_hex(words.tobytes()))
+            else:
+                f.write(format_memh(words, data_width, reverse))
+
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PRBS pattern file generator")
+    parser.add_argument('output', type=str, help="output file")
+    parser.add_argument('--prbs', type=str, default="PRBS31", choices=list(PRBS_SETTINGS), help="PRBS pattern")
+    parser.add_argument('-f', '--format', type=str, default="bin", choices=formats, help="output format")
+    parser.add_argument('-d', '--data-width', type=int, default=8, help="data width")
+    parser.add_argument('-n', '--count', type=int,
+        help="number of words (default one period rounded up to whole words, which does not loop seamlessly "
+        "unless DATA_WIDTH divides 2^LFSR_WIDTH-1)")
+    parser.add_argument('--loop', action='store_true',
+        help="write lcm(2^LFSR_WIDTH-1, DATA_WIDTH) bits, so that the file loops without a phase slip")
+    parser.add_argument('-s', '--seed', type=lambda x: int(x, 0), help="initial LFSR state (default all ones)")
+    parser.add_argument('-i', '--invert', type=int, help="invert output (default from the PRBS table)")
+    parser.add_argument('-r', '--reverse', type=int, default=0, help="bit-reverse output")
+    parser.add_argument('--block-size', type=int, default=default_block_size >> 20, help="block size (MB)")
+
+    args = parser.parse_args()
+
+    settings = dict(PRBS_SETTINGS[args.prbs])
+    if args.invert is not None:
+        settings['invert'] = args.invert
+
+    if args.seed is not None and not 0 < args.seed < 2**settings['lfsr_width']:
+        parser.error(f"Seed must be nonzero and fit in {settings['lfsr_width']} bits")
+
+    if args.loop and args.count is not None:
+        parser.error("--loop and --count are mutually exclusive")
+
+    count = write_pattern(args.output, args.format, args.count, lfsr_init=args.seed, reverse=args.reverse,
+        data_width=args.data_width, block_size=args.block_size << 20, name=args.prbs, loop=args.loop, **settings)
+
+    print(f"Wrote {count} {args.data_width}-bit words of {args.prbs} to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
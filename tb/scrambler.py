@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+"""
+
+Copyright (c) 2023 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import itertools
+import time
+
+
+# Self-synchronizing scrambler and descrambler models for lfsr_scramble and
+# lfsr_descramble in the Fibonacci configuration with REVERSE set (LSB first), as
+# used for 64b66b.
+#
+# Bit t of the stream is bit t % 8 of byte t // 8.  For a polynomial with tap
+# lags L (LFSR_WIDTH and each set bit of LFSR_POLY), the scrambler computes
+#
+#   y[t] = d[t] ^ XOR(y[t-l] for l in L)
+#
+# and the descrambler computes
+#
+#   d[t] = y[t] ^ XOR(y[t-l] for l in L)
+#
+# The descrambler is a pure feed-forward function and is computed over a whole block
+# with shifted XORs of one big integer.  The scrambler is the inverse, multiplication
+# by 1/(1 + sum(x^l)), which is evaluated as the product of (1 + sum(x^(l*2^i))) for
+# increasing i until the smallest lag exceeds the block length, so each block takes
+# O(log(block length)) shifted XORs.
+#
+# Both models carry state across calls, so long streams and multi-GB captures can be
+# processed in chunks.  State uses the same convention as the reference models in the
+# testbenches: bit 0 is the most recent output bit of the scrambler (input bit of
+# the descrambler).
+
+
+def reverse_bits(val, width):
+    return int(f"{val:0{width}b}"[::-1], 2)
+
+
+class ScramblerBase:
+    default_chunk_size = 1 << 16
+
+    def __init__(self, lfsr_width=58, lfsr_poly=0x8000000001, state=None, chunk_size=None):
+        self.lfsr_width = lfsr_width
+        self.lfsr_poly = lfsr_poly
+        self.state_mask = 2**lfsr_width-1
+        self.chunk_size = chunk_size or self.default_chunk_size
+
+        self.lags = [lfsr_width] + [j for j in range(1, lfsr_width) if (lfsr_poly >> j) & 1]
+
+        # history bits, bit j is stream bit j-LFSR_WIDTH relative to the next bit
+        self.hist = 0
+        self.set_state(self.state_mask if state is None else state)
+
+    def set_state(self, state):
+        self.hist = reverse_bits(state & self.state_mask, self.lfsr_width)
+
+    def get_state(self):
+        return reverse_bits(self.hist, self.lfsr_width)
+
+    state = property(get_state, set_state)
+
+    def process(self, data):
+        data = memoryview(data).cast('B')
+        if len(data) <= self.chunk_size:
+            return self.process_chunk(data)
+        return b''.join(self.process_chunk(data[k:k+self.chunk_size])
+            for k in range(0, len(data), self.chunk_size))
+
+    def __call__(self, data):
+        return self.process(data)
+
+
+class Scrambler(ScramblerBase):
+    # cost per bit grows with log(chunk size)
+    default_chunk_size = 1 << 12
+
+    def process_chunk(self, data):
+        n = len(data)*8
+        w = self.lfsr_width
+        mask = (1 << (n+w))-1
+
+        # prefix the data with inputs that reproduce the current history
+        prefix = self.hist
+        for lag in self.lags:
+            prefix ^= self.hist << lag
+        val = (int.from_bytes(data, 'little') << w) | (prefix & self.state_mask)
+
+        # multiply by 1/(1 + sum(x^lag)) mod x^(n+w)
+        k = 1
+        while min(self.lags)*k < n+w:
+            acc = val
+            for lag in self.lags:
+                acc ^= val << (lag*k)
+            val = acc & mask
+            k *= 2
+
+        self.hist = val >> n
+        return (val >> w).to_bytes(len(data), 'little')
+
+
+class Descrambler(ScramblerBase):
+    def process_chunk(self, data):
+        n = len(data)*8
+        w = self.lfsr_width
+
+        val = (int.from_bytes(data, 'little') << w) | self.hist
+        acc = val
+        for lag in self.lags:
+            acc ^= val << lag
+
+        self.hist = val >> n
+        return ((acc >> w) & ((1 << n)-1)).to_bytes(len(data), 'little')
+
+
+def scramble_64b66b(data, state=0x3ffffffffffffff):
+    return Scrambler(58, 0x8000000001, state)(data)
+
+
+def descramble_64b66b(data, state=0x3ffffffffffffff):
+    return Descrambler(58, 0x8000000001, state)(data)
+
+
+def scramble_64b66b_bitwise(data, state=0x3ffffffffffffff):
+    data_out = bytearray()
+    for d in data:
+        b = 0
+        for i in range(8):
+            if bool(state & (1 << 38)) ^ bool(state & (1 << 57)) ^ bool(d & (1 << i)):
+                state = ((state & 0x1ffffffffffffff) << 1) | 1
+                b = b | (1 << i)
+            else:
+                state = (state & 0x1ffffffffffffff) << 1
+        data_out.append(b)
+    return data_out
+
+
+def benchmark(size=1 << 24):
+    data = bytes(itertools.islice(itertools.cycle(range(251)), size))
+
+    def run(name, func, data):
+        start = time.perf_counter()
+        func(data)
+        t = time.perf_counter() - start
+        print(f"{name:<28} {len(data)/t/1e6:10.3f} MB/s")
+
+    run("scramble (bitwise)", scramble_64b66b_bitwise, data[:size // 256])
+    for name, cls in [("scramble", Scrambler), ("descramble", Descrambler)]:
+        for chunk_size in [1 << 10, 1 << 12, 1 << 16, 1 << 20]:
+            run(f"{name} (chunk {chunk_size})", cls(chunk_size=chunk_size), data)
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,373 @@
+#!/usr/bin/env python
+"""
+
+Copyright (c) 2023 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import argparse
+import datetime
+import itertools
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    from multi_top import read_ports
+    from vector_harness import port_widths
+    from sim_cache import build_jobs, simulator_version
+except ImportError:
+    # attempt import from current directory
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+    try:
+        from multi_top import read_ports
+        from vector_harness import port_widths
+        from sim_cache import build_jobs, simulator_version
+    finally:
+        del sys.path[0]
+
+
+# Simulator performance benchmark.
+#
+# Builds each DUT standalone (without cocotb) in a free-running bench top-level
+# that generates the clock, drives the data inputs from a toggling pattern,
+# holds the enable and valid inputs high, and folds all outputs into a sink
+# register so nothing is optimized away.  For lfsr, state_out is fed back to
+# state_in.  The simulation runs for the number of cycles given by the +cycles
+# plusarg.
+#
+# Sweeps simulator, DUT, DATA_WIDTH, LFSR_WIDTH, LFSR_CONFIG and STYLE, and
+# records for each point:
+#
+# compile_time     iverilog, or verilator and the C++ build
+# elab_time        simulator startup and elaboration, run with +cycles=0
+# cycles_per_sec   steady-state simulated clock cycles per second, excluding elab_time
+#
+# The report is written to tb/sim_bench.json, and each run is appended to the
+# history file tb/sim_bench_history.jsonl (JSON lines), regardless of the
+# working directory.  Points where
+# cycles_per_sec dropped, or elab_time grew, by more than the threshold relative
+# to the median of the previous runs are reported as regressions.
+#
+# Verilator builds use --binary and --timing (Verilator 5).
+
+tb_dir = os.path.dirname(os.path.realpath(__file__))
+rtl_dir = os.path.abspath(os.path.join(tb_dir, '..', 'rtl'))
+
+report_file = os.path.join(tb_dir, "sim_bench.json")
+history_file = os.path.join(tb_dir, "sim_bench_history.jsonl")
+
+duts = {
+    "lfsr": {
+        'LFSR_FEED_FORWARD': 0,
+        'REVERSE': 1,
+    },
+    "lfsr_crc": {
+        'REVERSE': 1,
+        'INVERT': 1,
+    },
+    "lfsr_prbs_gen": {
+        'REVERSE': 0,
+        'INVERT': 1,
+    },
+    "lfsr_scramble": {
+        'REVERSE': 1,
+    },
+}
+
+# polynomials for the LFSR_WIDTH sweep
+polys = {
+    9: 0x021,
+    16: 0x8005,
+    23: 0x040001,
+    31: 0x10000001,
+    32: 0x04c11db7,
+    58: 0x8000000001,
+    64: 0x42f0e1eba9ea3693,
+}
+
+default_simulators = ["icarus", "verilator"]
+default_data_widths = [8, 32, 64, 128, 256, 512, 1024]
+default_lfsr_widths = [9, 16, 32, 64]
+default_configs = ["GALOIS", "FIBONACCI"]
+default_styles = ["LOOP", "REDUCTION"]
+
+# history entries used for the regression baseline
+baseline_runs = 5
+
+point_keys = ('simulator', 'dut', 'data_width', 'lfsr_width', 'config', 'style')
+
+
+def bench_top(dut, params):
+    # free-running bench top-level for a DUT
+    int_params = {k: v for k, v in params.items() if isinstance(v, int)}
+    ports = port_widths(read_ports(os.path.join(rtl_dir, f"{dut}.v"), dut), int_params)
+
+    lines = []
+    conn = []
+    sink = []
+    for d, p, w in ports:
+        if p == "clk":
+            conn.append(f"    .{p}(clk)")
+        elif p == "state_in":
+            lines.append(f"reg [{w-1}:0] {p} = {w}'d1;")
+            lines.append(f"always @(posedge clk) {p} <= state_out;")
+            conn.append(f"    .{p}({p})")
+        elif p == "rst":
+            conn.append(f"    .{p}(cycles < 2)")
+        elif d == "input" and w == 1:
+            conn.append(f"    .{p}(1'b1)")
+        elif d == "input":
+            lines.append(f"reg [{w-1}:0] {p} = {w}'d1;")
+            lines.append(f"always @(posedge clk) {p} <= ~{p} ^ ({p} << 1);")
+            conn.append(f"    .{p}({p})")
+        else:
+            lines.append(f"wire [{w-1}:0] {p};")
+            conn.append(f"    .{p}({p})")
+            sink.append(f"^{p}")
+
+    body = "\n".join(lines)
+    conn = ",\n".join(conn)
+    param_list = ",\n".join(f"    .{p}({v})" for p, v in params.items())
+
+    return f"""`timescale 1ns / 1ps
+
+module bench;
+
+reg clk = 1'b0;
+always #5 clk = ~clk;
+
+integer cycles = 0;
+integer limit = 0;
+reg sink = 1'b0;
+
+{body}
+
+{dut} #(
+{param_list}
+)
+uut (
+{conn}
+);
+
+initial begin
+    if (!$value$plusargs("cycles=%d", limit)) begin
+        limit = 0;
+    end
+end
+
+always @(posedge clk) begin
+    sink <= sink ^ {' ^ '.join(sink)};
+    cycles <= cycles + 1;
+    if (cycles >= limit) begin
+        $display("cycles %0d sink %b", cycles, sink);
+        $finish;
+    end
+end
+
+endmodule
+"""
+
+
+def timed(cmd, **kwargs):
+    start = time.perf_counter()
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, **kwargs)
+    return time.perf_counter() - start
+
+
+def compile_sim(sim, toplevel, sources, work_dir):
+    # returns (command to run the simulation, compile time)
+    if sim == "icarus":
+        out = os.path.join(work_dir, f"{toplevel}.vvp")
+        t = timed(["iverilog", "-g2012", "-s", toplevel, "-o", out] + sources)
+        return ["vvp", "-n", out], t
+    elif sim == "verilator":
+        obj_dir = os.path.join(work_dir, "obj_dir")
+        cmd = ["verilator", "--binary", "--timing", "-Wno-fatal", "-Wno-SELRANGE", "-Wno-WIDTH",
+            "-j", str(build_jobs), "--top-module", toplevel, "-Mdir", obj_dir, "-o", toplevel] + sources
+        t = timed(cmd)
+        return [os.path.join(obj_dir, toplevel)], t
+
+    raise ValueError(f"Unsupported simulator: {sim}")
+
+
+def build(sim, dut, params, work_dir):
+    # returns (command to run the simulation, compile time)
+    top = os.path.join(work_dir, "bench.v")
+    with open(top, 'w') as f:
+        f.write(bench_top(dut, params))
+
+    sources = [top, os.path.join(rtl_dir, f"{dut}.v")]
+    if dut != "lfsr":
+        sources.append(os.path.join(rtl_dir, "lfsr.v"))
+
+    return compile_sim(sim, "bench", sources, work_dir)
+
+
+def run_bench(sim, dut, data_width, lfsr_width=32, config="GALOIS", style="REDUCTION", cycles=100000):
+    params = {}
+    params['LFSR_WIDTH'] = lfsr_width
+    params['LFSR_POLY'] = f"{lfsr_width}'h{polys[lfsr_width]:x}"
+    params['LFSR_CONFIG'] = f'"{config}"'
+    params.update(duts[dut])
+    params['DATA_WIDTH'] = data_width
+    params['STYLE'] = f'"{style}"'
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        cmd, compile_time = build(sim, dut, params, work_dir)
+        elab_time = timed(cmd + ["+cycles=0"], cwd=work_dir)
+        run_time = timed(cmd + [f"+cycles={cycles}"], cwd=work_dir)
+
+    return {
+        'simulator': sim,
+        'version': simulator_version(sim),
+        'dut': dut,
+        'data_width': data_width,
+        'lfsr_width': lfsr_width,
+        'config': config,
+        'style': style,
+        'parameters': params,
+        'cycles': cycles,
+        'compile_time': compile_time,
+        'elab_time': elab_time,
+        'run_time': run_time,
+        'cycles_per_sec': cycles / max(run_time - elab_time, 1e-9),
+    }
+
+
+def point_key(res):
+    return tuple(res[k] for k in point_keys)
+
+
+def read_history(path):
+    history = []
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    history.append(json.loads(line))
+    return history
+
+
+def find_regressions(history, results, threshold=0.1, runs=baseline_runs):
+    # compare results against the median of the last runs for each point
+    # returns a list of (result, metric, baseline value)
+    previous = {}
+    for entry in history:
+        for res in entry['results']:
+            previous.setdefault(point_key(res), []).append(res)
+
+    regressions = []
+    for res in results:
+        prev = previous.get(point_key(res), [])[-runs:]
+        if not prev:
+            continue
+
+        rate = statistics.median(r['cycles_per_sec'] for r in prev)
+        if res['cycles_per_sec'] < rate * (1-threshold):
+            regressions.append((res, 'cycles_per_sec', rate))
+
+        elab = statistics.median(r['elab_time'] for r in prev)
+        if res['elab_time'] > elab * (1+threshold):
+            regressions.append((res, 'elab_time', elab))
+
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=tb_dir, check=True,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulator performance benchmark")
+    parser.add_argument('--sim', type=str, nargs='+', default=default_simulators, help="simulators")
+    parser.add_argument('--dut', type=str, nargs='+', default=list(duts), help="modules")
+    parser.add_argument('--data-width', type=int, nargs='+', default=default_data_widths, help="DATA_WIDTH values")
+    parser.add_argument('--lfsr-width', type=int, nargs='+', default=default_lfsr_widths,
+        help=f"LFSR_WIDTH values ({', '.join(str(w) for w in polys)})")
+    parser.add_argument('--config', type=str, nargs='+', default=default_configs, help="LFSR_CONFIG values")
+    parser.add_argument('--style', type=str, nargs='+', default=default_styles, help="STYLE values")
+    parser.add_argument('--cycles', type=int, default=100000, help="simulated cycles per run")
+    parser.add_argument('-o', '--output', type=str, default=report_file, help="JSON report file (default tb/sim_bench.json)")
+    parser.add_argument('--history', type=str, default=history_file, help="results history file (default tb/sim_bench_history.jsonl)")
+    parser.add_argument('--threshold', type=float, default=0.1, help="regression threshold (fraction)")
+    parser.add_argument('--no-history', action='store_true', help="do not append results to history")
+
+    args = parser.parse_args()
+
+    for w in args.lfsr_width:
+        if w not in polys:
+            parser.error(f"no polynomial for LFSR_WIDTH {w}")
+
+    results = []
+
+    print(f"{'simulator':<10} {'dut':<14} {'width':>6} {'lfsr':>5} {'config':<10} {'style':<10} "
+        f"{'compile':>9} {'elab':>9} {'cycles/s':>12}")
+
+    for sim in args.sim:
+        exe = {"icarus": "iverilog"}.get(sim, sim)
+        if shutil.which(exe) is None:
+            print(f"{sim}: {exe} not found, skipping")
+            continue
+        for dut, data_width, lfsr_width, config, style in itertools.product(args.dut, args.data_width,
+                args.lfsr_width, args.config, args.style):
+            res = run_bench(sim, dut, data_width, lfsr_width, config, style, args.cycles)
+            results.append(res)
+            print(f"{sim:<10} {dut:<14} {data_width:>6} {lfsr_width:>5} {config:<10} {style:<10} "
+                f"{res['compile_time']:8.3f}s {res['elab_time']:8.3f}s {res['cycles_per_sec']:12.1f}")
+
+    report = {
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'results': results,
+    }
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"Wrote {len(results)} results to '{args.output}'")
+
+    history = read_history(args.history)
+    regressions = find_regressions(history, results, args.threshold)
+
+    for res, metric, base in regressions:
+        desc = " ".join(str(res[k]) for k in point_keys)
+        print(f"REGRESSION {desc}: {metric} {res[metric]:.3f} (baseline {base:.3f})")
+
+    if results and not args.no_history:
+        with open(args.history, 'a') as f:
+            f.write(json.dumps(report) + "\n")
+
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
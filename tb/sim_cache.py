@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+"""
+
+Copyright (c) 2023 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import argparse
+import contextlib
+import fcntl
+import functools
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+import pytest
+import cocotb
+import cocotb_test.simulator
+
+
+# Content-addressed build cache for cocotb-test runs.
+#
+# run() is a drop-in replacement for cocotb_test.simulator.run().  The compiled
+# simulator artifacts are stored in a shared cache directory, keyed on a hash of
+# the contents of the HDL sources, the parameters and other compile options, and
+# the simulator and its version.  The Python test module is not part of the key,
+# so changes to the testbench alone do not trigger recompilation, and identical
+# RTL and parameter sets are shared between tests, runs and xdist workers.
+#
+# On a hit, the artifacts are copied into sim_build and the simulation runs
+# without compiling.  On a miss, the design is compiled with force_compile set
+# (sim_build may hold a stale build for a different parameter set) and the
+# result is stored in the cache before running the simulation.
+#
+# The cache directory is protected with an flock() lock, entries are published
+# with an atomic rename, and the least recently used entries are evicted once
+# the total size exceeds the limit.
+#
+# Environment variables:
+#
+# SIM_CACHE       set to 0 to disable the cache
+# SIM_CACHE_DIR   cache directory (default tb/sim_cache)
+# SIM_CACHE_SIZE  cache size limit in MB (default 1024)
+# SIM_BUILD_JOBS  parallel C++ compile jobs for verilator (default CPU count)
+#
+# The simulator argument of run() takes precedence over SIM, which is only the
+# default, and the resolved simulator is used for the options, the cache key and
+# the run itself.
+#
+# Icarus builds are cached as the whole sim_build contents.  For verilator, only
+# the model executable is cached; cocotb-test always re-runs verilator and make,
+# so a model fetched from the cache (or just built) is run with the Verilator
+# class below, which skips those steps.  The key includes the verilator version
+# line and the cocotb version, since the executable links the cocotb VPI library.
+#
+# simulators is the simulator dimension for the pytest matrices, with verilator
+# skipped when it is not installed.  simulator_args() applies the same options
+# as the verilator branch of the tb/*/Makefile files, and compiles the verilated
+# model with parallel make jobs.
+
+cache_dir = os.environ.get("SIM_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), "sim_cache"))
+
+cache_size = int(os.environ.get("SIM_CACHE_SIZE", 1024)) * 1024 * 1024
+
+enabled = os.environ.get("SIM_CACHE", "1") not in ("", "0")
+
+# compile options that do not change the build output
+runtime_args = {"python_search", "module", "sim_build", "work_dir", "extra_env", "testcase",
+    "seed", "plus_args", "sim_args", "simulation_args", "force_compile", "compile_only", "gui"}
+
+# files in sim_build that belong to a simulation run rather than the build
+runtime_files = ("results.xml", ".fst", ".vcd", ".log", ".dat", ".lock")
+
+build_jobs = int(os.environ.get("SIM_BUILD_JOBS", os.cpu_count() or 1))
+
+cached_simulators = {"icarus", "verilator"}
+
+simulators = [
+    pytest.param("icarus"),
+    pytest.param("verilator", marks=pytest.mark.skipif(shutil.which("verilator") is None,
+        reason="verilator not found")),
+]
+
+
+class Verilator(cocotb_test.simulator.Verilator):
+    # with prebuilt set, runs the model executable in sim_build without verilator and make
+    def __init__(self, *args, prebuilt=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prebuilt = prebuilt
+
+    def build_command(self):
+        cmds = super().build_command()
+        if self.prebuilt and not self.compile_only:
+            # verilator and make come first, the model run last
+            cmds = cmds[-1:]
+        return cmds
+
+
+simulator_classes = {
+    "icarus": cocotb_test.simulator.Icarus,
+    "verilator": Verilator,
+}
+
+version_commands = {
+    "icarus": ["iverilog", "-V"],
+    "verilator": ["verilator", "--version"],
+}
+
+
+@functools.lru_cache(maxsize=None)
+def simulator_version(sim):
+    cmd = version_commands.get(sim, [sim, "-version"])
+    try:
+        out = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=False).stdout
+    except OSError:
+        return None
+    lines = out.decode('utf-8', 'replace').splitlines()
+    return lines[0].strip() if lines else ""
+
+
+def source_list(sources):
+    # (library, path) pairs for plain source lists and per-library dicts
+    if sources is None:
+        return []
+    if isinstance(sources, dict):
+        return [(lib, path) for lib, paths in sources.items() for path in paths]
+    return [("", path) for path in sources]
+
+
+@functools.lru_cache(maxsize=None)
+def file_digest(path, mtime, size):
+    # mtime and size are part of the cache key so that edits are picked up
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def build_key(sim, **kwargs):
+    h = hashlib.sha256()
+
+    def add(name, val):
+        h.update(f"{name}={json.dumps(val, sort_keys=True, default=str)}\n".encode())
+
+    add("simulator", sim)
+    add("version", simulator_version(sim))
+    add("cocotb", cocotb.__version__)
+
+    for name in ("verilog_sources", "vhdl_sources"):
+        for lib, path in source_list(kwargs.get(name)):
+            st = os.stat(path)
+            add(name, [lib, os.path.basename(path), file_digest(os.path.abspath(path), st.st_mtime_ns, st.st_size)])
+
+    for name, val in sorted(kwargs.items()):
+        if name in runtime_args or name in ("verilog_sources", "vhdl_sources"):
+            continue
+        add(name, val)
+
+    return h.hexdigest()
+
+
+@contextlib.contextmanager
+def locked(path=None):
+    if path is None:
+        path = cache_dir
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, ".lock"), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def build_files(sim_build, names=None):
+    # files to cache, all build outputs or only the given names
+    if names is not None:
+        yield from (name for name in names if os.path.isfile(os.path.join(sim_build, name)))
+        return
+    for root, dirs, files in os.walk(sim_build):
+        for name in files:
+            if name.endswith(runtime_files):
+                continue
+            yield os.path.relpath(os.path.join(root, name), sim_build)
+
+
+def cache_files(sim, kwargs):
+    # build outputs to cache, None for all of sim_build
+    if sim == "verilator":
+        # the model executable, named after the toplevel
+        return [kwargs["toplevel"]]
+    return None
+
+
+def dir_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, dirs, files in os.walk(path) for name in files)
+
+
+def entries():
+    if not os.path.isdir(cache_dir):
+        return []
+    ret = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.startswith('.') or not os.path.isdir(path):
+            continue
+        ret.append((os.path.getmtime(path), dir_size(path), path))
+    return sorted(ret)
+
+
+def evict(limit=None):
+    # remove least recently used entries until the cache fits in the limit
+    if limit is None:
+        limit = cache_size
+    with locked():
+        lst = entries()
+        total = sum(size for mtime, size, path in lst)
+        for mtime, size, path in lst:
+            if total <= limit:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+    return total
+
+
+def fetch(key, sim_build):
+    entry = os.path.join(cache_dir, key)
+    with locked():
+        if not os.path.isdir(entry):
+            return False
+        now = time.time()
+        # mark as most recently used
+        os.utime(entry, (now, now))
+        for name in build_files(entry):
+            dst = os.path.join(sim_build, name)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            shutil.copy2(os.path.join(entry, name), dst)
+            # newer than the sources so the simulator does not rebuild
+            os.utime(dst, (now, now))
+    return True
+
+
+def store(key, sim_build, names=None):
+    entry = os.path.join(cache_dir, key)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=".tmp-", dir=cache_dir)
+    try:
+        for name in build_files(sim_build, names):
+            dst = os.path.join(tmp, name)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            shutil.copy2(os.path.join(sim_build, name), dst)
+        with locked():
+            if os.path.isdir(entry):
+                # stored concurrently by another worker
+                shutil.rmtree(tmp)
+            else:
+                os.rename(tmp, entry)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    evict()
+
+
+def simulator_args(sim, kwargs):
+    # per-simulator options
+    kwargs = dict(kwargs)
+    if sim == "verilator":
+        kwargs["compile_args"] = list(kwargs.get("compile_args") or []) + ["-Wno-SELRANGE", "-Wno-WIDTH"]
+        extra_env = dict(kwargs.get("extra_env") or {})
+        extra_env.setdefault("MAKEFLAGS", f"-j{build_jobs}")
+        kwargs["extra_env"] = extra_env
+    return kwargs
+
+
+def run_sim(sim, **kwargs):
+    # cocotb_test.simulator.run() lets SIM override its simulator argument, so the
+    # simulator class is selected here
+    cls = simulator_classes.get(sim)
+    if cls is None:
+        return cocotb_test.simulator.run(simulator=sim, **kwargs)
+    return cls(**kwargs).run()
+
+
+def run(simulator=None, **kwargs):
+    __tracebackhide__ = True  # Hide the traceback when using PyTest.
+
+    sim = simulator or os.getenv("SIM") or "icarus"
+
+    kwargs = simulator_args(sim, kwargs)
+
+    if (not enabled or sim not in cached_simulators or kwargs.get("waves") or kwargs.get("compile_only")
+            or simulator_version(sim) is None):
+        return run_sim(sim, **kwargs)
+
+    sim_build = os.path.abspath(kwargs.get("sim_build", "sim_build"))
+    os.makedirs(sim_build, exist_ok=True)
+    kwargs["sim_build"] = sim_build
+
+    key = build_key(sim, **kwargs)
+
+    if not fetch(key, sim_build):
+        run_sim(sim, **dict(kwargs, compile_only=True, force_compile=True))
+        store(key, sim_build, cache_files(sim, kwargs))
+
+    if sim == "verilator":
+        kwargs["prebuilt"] = True
+
+    return run_sim(sim, **kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulator build cache maintenance")
+    parser.add_argument('--clear', action='store_true', help="remove all entries")
+    parser.add_argument('--evict', action='store_true', help="evict entries down to the size limit")
+
+    args = parser.parse_args()
+
+    if args.clear:
+        evict(0)
+    elif args.evict:
+        evict()
+
+    lst = entries()
+    print(f"{cache_dir}: {len(lst)} entries, {sum(e[1] for e in lst)/1e6:.1f} MB (limit {cache_size/1e6:.1f} MB)")
+
+
+if __name__ == '__main__':
+    main()
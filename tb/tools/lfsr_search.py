@@ -0,0 +1 @@
+../lfsr_search.py
\ No newline at end of file
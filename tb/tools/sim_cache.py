@@ -0,0 +1 @@
+../sim_cache.py
\ No newline at end of file
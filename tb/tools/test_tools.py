@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+"""
+
+Copyright (c) 2023 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import asyncio
+import itertools
+import logging
+import math
+import os
+import random
+import sys
+import types
+
+import pytest
+
+try:
+    from lfsr_model import Lfsr, lfsr_masks, popcount, mersenne_factors
+    import lfsr_model
+    import lfsr_poly
+    import lfsr_search
+    import multi_top
+    import sim_bench
+    import sim_cache
+    import vector_harness
+except ImportError:
+    # attempt import from current directory
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+    try:
+        from lfsr_model import Lfsr, lfsr_masks, popcount, mersenne_factors
+        import lfsr_model
+        import lfsr_poly
+        import lfsr_search
+        import multi_top
+        import sim_bench
+        import sim_cache
+        import vector_harness
+    finally:
+        del sys.path[0]
+
+
+# Tests for the shared testbench tooling in tb/
+
+tests_dir = os.path.abspath(os.path.dirname(__file__))
+rtl_dir = os.path.abspath(os.path.join(tests_dir, '..', '..', 'rtl'))
+
+
+def test_sim_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(sim_cache, "cache_dir", str(tmp_path / "cache"))
+
+    src = tmp_path / "lfsr.v"
+    src.write_text("module lfsr; endmodule\n")
+
+    args = dict(verilog_sources=[str(src)], toplevel="lfsr", parameters={'LFSR_WIDTH': 32}, module="test_lfsr")
+    key = sim_cache.build_key("icarus", **args)
+
+    # Python-only settings do not change the key, HDL and parameters do
+    assert sim_cache.build_key("icarus", **dict(args, module="other", sim_build="other")) == key
+    assert sim_cache.build_key("icarus", **dict(args, parameters={'LFSR_WIDTH': 31})) != key
+    src.write_text("module lfsr; wire x; endmodule\n")
+    assert sim_cache.build_key("icarus", **args) != key
+
+    build = tmp_path / "build"
+    build.mkdir()
+    (build / "lfsr.vvp").write_bytes(b"x"*1000)
+    (build / "tmp_results.xml").write_text("")
+
+    assert not sim_cache.fetch(key, str(tmp_path / "out"))
+    sim_cache.store(key, str(build))
+    assert sim_cache.fetch(key, str(tmp_path / "out"))
+    assert sorted(os.listdir(tmp_path / "out")) == ["lfsr.vvp"]
+
+    # least recently used entries are evicted first
+    sim_cache.store("a", str(build))
+    sim_cache.store("b", str(build))
+    os.utime(tmp_path / "cache" / "b", (0, 0))
+    sim_cache.fetch(key, str(tmp_path / "out"))
+    assert sim_cache.evict(2000) == 2000
+    assert sorted(e[2] for e in sim_cache.entries()) == [str(tmp_path / "cache" / n) for n in sorted(["a", key])]
+
+    # the simulator argument takes precedence over SIM
+    runs = []
+
+    class Recorder:
+        def __init__(self, **kwargs):
+            runs.append((type(self).__name__, kwargs.get("compile_args")))
+
+        def run(self):
+            pass
+
+    for name in ["icarus", "verilator"]:
+        monkeypatch.setitem(sim_cache.simulator_classes, name, type(name, (Recorder,), {}))
+    monkeypatch.setattr(sim_cache, "enabled", False)
+    monkeypatch.setenv("SIM", "verilator")
+    sim_cache.run(simulator="icarus", **args)
+    sim_cache.run(**args)
+    assert runs == [("icarus", None), ("verilator", ["-Wno-SELRANGE", "-Wno-WIDTH"])]
+
+    # verilator caches the model executable and runs it prebuilt
+    runs = []
+
+    class Verilator(Recorder):
+        def __init__(self, **kwargs):
+            runs.append((kwargs.get("compile_only", False), kwargs.get("prebuilt", False)))
+            self.kwargs = kwargs
+
+        def run(self):
+            if self.kwargs.get("compile_only"):
+                sim_build = self.kwargs["sim_build"]
+                (tmp_path / sim_build / "Vtop.cpp").write_text("")
+                (tmp_path / sim_build / "lfsr").write_bytes(b"x"*100)
+
+    monkeypatch.setitem(sim_cache.simulator_classes, "verilator", Verilator)
+    monkeypatch.setattr(sim_cache, "enabled", True)
+    monkeypatch.setattr(sim_cache, "simulator_version", lambda sim: "Verilator 5.0")
+    for name in ["build1", "build2"]:
+        sim_cache.run(simulator="verilator", **dict(args, sim_build=str(tmp_path / name)))
+    assert runs == [(True, False), (False, True), (False, True)]
+    assert sorted(os.listdir(tmp_path / "build2")) == ["lfsr"]
+
+
+def test_multi_top(tmp_path, monkeypatch):
+    configs = []
+    for (lfsr_width, lfsr_poly, lfsr_config, reverse, data_width) in [
+                (32, "32'h4c11db7", "GALOIS", 1, 8),
+                (32, "32'h4c11db7", "GALOIS", 1, 64),
+                (9,  "9'h021", "FIBONACCI", 0, 8),
+                (9,  "9'h021", "FIBONACCI", 0, 64),
+            ]:
+        configs.append({'LFSR_WIDTH': lfsr_width, 'LFSR_POLY': multi_top.verilog_value(lfsr_poly),
+            'LFSR_CONFIG': multi_top.verilog_value(lfsr_config), 'REVERSE': reverse, 'DATA_WIDTH': data_width})
+
+    assert configs[0]['LFSR_CONFIG'] == '"GALOIS"' and configs[0]['LFSR_POLY'] == "32'h4c11db7"
+
+    path = tmp_path / "lfsr_multi.v"
+    assert multi_top.generate("lfsr", os.path.join(rtl_dir, "lfsr.v"), configs, str(path)) == "lfsr_multi"
+
+    text = path.read_text()
+    assert text.count("lfsr #(") == len(configs)
+    assert "reg  [(64)-1:0] u1_data_in = 0;" in text
+    assert "wire [(32)-1:0] u1_state_out;" in text
+
+    async def run_crc(dut):
+        pass
+
+    async def run_prbs(dut):
+        pass
+
+    def select_test(dut):
+        if dut.LFSR_CONFIG == "GALOIS":
+            return run_crc, {}
+        return run_prbs, {}
+
+    monkeypatch.setenv("MULTI_CONFIGS", multi_top.extra_env(configs)['MULTI_CONFIGS'])
+    insts = multi_top.instances(None)
+    assert [select_test(inst)[0] for inst in insts] == [run_crc]*2 + [run_prbs]*2
+    assert insts[2].LFSR_POLY == 0x021 and insts[2].LFSR_CONFIG.value == "FIBONACCI"
+
+    # failures name the instance and its parameters
+    async def fail(inst):
+        assert inst.LFSR_WIDTH == 0
+
+    top = types.SimpleNamespace(_log=logging.getLogger())
+    with pytest.raises(AssertionError, match=r"u2 \(LFSR_WIDTH=9, LFSR_POLY=9'h021, .*DATA_WIDTH=8\)"):
+        asyncio.run(multi_top.run_instance(top, 2, multi_top.configs()[2], fail, {}))
+
+
+@pytest.mark.parametrize("width", [1, 32, 64, 72])
+def test_vector_harness(tmp_path, width):
+    words = [random.getrandbits(width) for k in range(100)]
+    path = str(tmp_path / "resp.memh")
+
+    vector_harness.write_memh(path, words, width)
+    with open(path, 'a') as f:
+        f.write("x"*((width+3) // 4)+"\n")
+
+    vals, invalid = vector_harness.read_memh(path, width)
+    assert [int(v) for v in vals[:100]] == words
+    assert list(invalid) == [False]*100 + [True]
+
+    assert vector_harness.compare(words, vals, invalid) == 100
+    with pytest.raises(AssertionError, match="cycle 100 of 101"):
+        vector_harness.compare(words+[0], vals, invalid)
+    words[42] ^= 1
+    with pytest.raises(AssertionError, match="cycle 42 of 100"):
+        vector_harness.compare(words, vals, invalid)
+
+    assert vector_harness.pack([('rst', 1), ('data_in', 8), ('data_in_valid', 1)],
+        {'rst': [1, 0], 'data_in': [0xab, 0xcd], 'data_in_valid': 1}, 2) == [0x357, 0x19b]
+
+
+def test_sim_bench():
+    params = {'LFSR_WIDTH': 32, 'LFSR_POLY': "32'h4c11db7", 'LFSR_CONFIG': '"GALOIS"', 'LFSR_FEED_FORWARD': 0,
+        'REVERSE': 1, 'DATA_WIDTH': 64, 'STYLE': '"REDUCTION"'}
+    text = sim_bench.bench_top("lfsr", params)
+    assert "always @(posedge clk) state_in <= state_out;" in text
+    assert "reg [63:0] data_in = 64'd1;" in text
+
+    def result(rate, elab=1.0, style="LOOP"):
+        return {'simulator': "icarus", 'dut': "lfsr", 'data_width': 64, 'lfsr_width': 32,
+            'config': "GALOIS", 'style': style, 'cycles_per_sec': rate, 'elab_time': elab}
+
+    history = [{'results': [result(r)]} for r in [1000, 1100, 900]]
+    assert sim_bench.find_regressions(history, [result(950)], 0.1) == []
+    assert sim_bench.find_regressions(history, [result(850, 1.2)], 0.1) == [
+        (result(850, 1.2), 'cycles_per_sec', 1000), (result(850, 1.2), 'elab_time', 1.0)]
+    # points without history are not compared
+    assert sim_bench.find_regressions(history, [result(1, style="REDUCTION")], 0.1) == []
+
+
+def test_mersenne_factors(monkeypatch):
+    # every width up to 168, with the large factors from known_mersenne_factors
+    for width in range(1, 169):
+        factors = mersenne_factors(width)
+        assert math.prod(p**e for p, e in factors.items()) == 2**width-1
+        assert all(lfsr_model.is_prime(p) for p in factors)
+
+    assert mersenne_factors(137) == {32032215596496435569: 1, 5439042183600204290159: 1}
+
+    # without the table entry, the step limit stops rho with the width in the message
+    monkeypatch.delitem(lfsr_model.known_mersenne_factors, 101)
+    monkeypatch.setattr(lfsr_model, 'rho_limit', 1 << 16)
+    with pytest.raises(ValueError, match=r"2\^101-1"):
+        mersenne_factors.__wrapped__(101)
+
+
+def test_lfsr_poly_table():
+    # every entry in the lfsr.v header table
+    reducible = {
+        'CRC16-IBM': 2**15-1,
+        'CRC16-CCITT': 2**15-1,
+        'CRC32C': 2**31-1,
+    }
+
+    table = lfsr_poly.lfsr_table()
+    assert len(table) == 17
+
+    for entry in table:
+        res = lfsr_poly.analyze(entry['lfsr_width'], entry['lfsr_poly'])
+        if entry['name'] in reducible:
+            assert not res['irreducible'] and not res['primitive']
+            assert res['period'] == reducible[entry['name']]
+        else:
+            assert res['primitive'], entry['name']
+            assert res['period'] == 2**entry['lfsr_width']-1
+
+
+def test_lfsr_poly_period():
+    # compare with the cycle lengths of the lfsr model for all small polynomials
+    for lfsr_width in range(2, 8):
+        for poly in range(1, 2**lfsr_width, 2):
+            lfsr = Lfsr(lfsr_width, poly, "FIBONACCI", 0, 0, 1)
+            period = 0
+            for state in range(1, 2**lfsr_width):
+                s = lfsr.jump(state, 1)
+                n = 1
+                while s != state:
+                    s = lfsr.jump(s, 1)
+                    n += 1
+                period = max(period, n)
+
+            f = lfsr_poly.full_poly(lfsr_width, poly)
+            assert lfsr_poly.period(f) == period
+            assert lfsr_poly.is_primitive(f) == (period == 2**lfsr_width-1)
+
+    # beyond 64 bits
+    assert lfsr_poly.is_primitive(lfsr_poly.full_poly(127, 0b11))
+    assert lfsr_poly.is_primitive(lfsr_poly.full_poly(89, (1 << 38) | 1))
+    assert not lfsr_poly.is_irreducible(lfsr_poly.full_poly(96, 1))
+    # (x^3 + 1)^32
+    assert lfsr_poly.period(lfsr_poly.full_poly(96, 1)) == 96
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_lfsr_search(jobs):
+    # exhaustive check for a small width
+    lfsr_width = 12
+    data_width = 16
+
+    res = list(lfsr_search.search(lfsr_width, data_width, jobs=jobs, batch_size=16))
+
+    ref = []
+    for p in lfsr_search.candidates(lfsr_width):
+        if lfsr_poly.is_primitive(lfsr_poly.full_poly(lfsr_width, p)):
+            masks = lfsr_masks(lfsr_width, p, "FIBONACCI", 0, 0, data_width)
+            cost = sum(max(popcount(m & (2**lfsr_width-1))-1, 0) for m in masks)
+            ref.append((cost, popcount(p)+1, p))
+
+    assert [(r['xor_cost'], r['terms'], r['lfsr_poly']) for r in res] == sorted(ref)
+
+    # early exit, PRBS31 is among the cheapest trinomials
+    res = list(itertools.islice(lfsr_search.search(31, 8, taps=[3], jobs=jobs), 5))
+    assert len(res) == 5
+    assert 0x10000001 in [r['lfsr_poly'] for r in res]
+
+    # no primitive trinomials for widths divisible by 8
+    assert not list(lfsr_search.search(16, 8, taps=[3], jobs=jobs))
@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+"""
+
+Copyright (c) 2023 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+import os
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import cocotb
+from cocotb.triggers import RisingEdge
+from cocotb.regression import TestFactory
+
+try:
+    from multi_top import read_ports
+except ImportError:
+    # attempt import from current directory
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__)))
+    try:
+        from multi_top import read_ports
+    finally:
+        del sys.path[0]
+
+
+# File-based stimulus/response harness.
+#
+# For long runs, writing and reading DUT signals from Python every cycle is
+# dominated by the simulator interface overhead.  In this mode, the stimulus is
+# generated up front and written to a $readmemh file, one line per clock cycle
+# with all DUT inputs except clk packed MSB first in port order.  generate()
+# writes a harness top-level that generates the clock, streams the stimulus into
+# the DUT, and writes the packed DUT outputs to a response file, one line per
+# cycle.  The only interaction with cocotb is waiting for the done flag.
+#
+# Stimulus line i is applied on clock edge i, and response line i is sampled on
+# the following falling edge, so a registered output in response line i reflects
+# stimulus lines 0 through i-1.
+#
+# read_memh() parses the response file with NumPy (for widths up to 64 bits) and
+# compare() checks it against the expected values, reporting the first mismatch
+# with its cycle index.  X and Z values in the response never match.
+#
+# Set VECTOR_CYCLES to change the default run length.
+
+cycles = int(os.environ.get("VECTOR_CYCLES", 1 << 16))
+
+
+def write_memh(path, words, width):
+    digits = (width+3) // 4
+    with open(path, 'w') as f:
+        if np is not None and isinstance(words, np.ndarray):
+            np.savetxt(f, words, fmt=f"%0{digits}x")
+        else:
+            f.write("".join(f"{w:0{digits}x}\n" for w in words))
+
+
+def read_memh(path, width):
+    # returns values and a mask of lines that contain X or Z
+    digits = (width+3) // 4
+
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    if np is not None and width <= 64:
+        lines = np.frombuffer(data, dtype=np.uint8).reshape(-1, digits+1)[:, :digits]
+        lut = np.full(256, 0xff, dtype=np.uint8)
+        for k, c in enumerate(b"0123456789abcdef"):
+            lut[c] = k
+            lut[ord(chr(c).upper())] = k
+        nibbles = lut[lines]
+        invalid = (nibbles == 0xff).any(axis=1)
+        nibbles[nibbles == 0xff] = 0
+        vals = np.zeros(len(lines), dtype=np.uint64)
+        for k in range(digits):
+            vals = (vals << np.uint64(4)) | nibbles[:, k].astype(np.uint64)
+        return vals, invalid
+
+    vals = []
+    invalid = []
+    for line in data.split():
+        try:
+            vals.append(int(line, 16))
+            invalid.append(False)
+        except ValueError:
+            vals.append(0)
+            invalid.append(True)
+    return vals, invalid
+
+
+def compare(expected, actual, invalid=None, start=0, name="output"):
+    # check response against expected values from cycle start on
+    # raises AssertionError on the first mismatch, returns the number of cycles checked
+    if len(actual) < len(expected):
+        raise AssertionError(f"Response truncated: {len(actual)} of {len(expected)} cycles")
+
+    if invalid is None:
+        invalid = [False]*len(actual)
+
+    if np is not None and isinstance(actual, np.ndarray):
+        expected = np.asarray(expected, dtype=np.uint64)
+        bad = (expected[start:] != actual[start:len(expected)]) | np.asarray(invalid[start:len(expected)])
+        idx = np.flatnonzero(bad)
+        if len(idx):
+            k = int(idx[0])+start
+            raise AssertionError(f"Mismatch on {name} at cycle {k} of {len(expected)}: "
+                f"0x{int(actual[k]):x}{' (X/Z)' if invalid[k] else ''} (ref: 0x{int(expected[k]):x}), "
+                f"{len(idx)} mismatched cycles")
+    else:
+        for k in range(start, len(expected)):
+            if invalid[k] or expected[k] != actual[k]:
+                raise AssertionError(f"Mismatch on {name} at cycle {k} of {len(expected)}: "
+                    f"0x{actual[k]:x}{' (X/Z)' if invalid[k] else ''} (ref: 0x{expected[k]:x})")
+
+    return len(expected)-start
+
+
+def port_widths(ports, params):
+    # evaluate width expressions of (direction, name, width) port tuples
+    ret = []
+    for d, name, width in ports:
+        if width:
+            msb, lsb = width[1:-1].split(':')
+            w = eval(msb, {}, dict(params)) - eval(lsb, {}, dict(params)) + 1
+        else:
+            w = 1
+        ret.append((d, name, w))
+    return ret
+
+
+def generate(dut, path, params, cycles, stim_file, resp_file, output, name=None):
+    # returns (module name, input fields, output fields), fields are (name, width) MSB first
+    if name is None:
+        name = f"{dut}_vectors"
+
+    int_params = {}
+    for p, v in params.items():
+        try:
+            int_params[p] = int(v)
+        except (TypeError, ValueError):
+            pass
+
+    ports = port_widths(read_ports(path, dut), int_params)
+    inputs = [(p, w) for d, p, w in ports if d == "input" and p != "clk"]
+    outputs = [(p, w) for d, p, w in ports if d == "output"]
+    in_width = sum(w for p, w in inputs)
+
+    lines = []
+    for d, p, w in ports:
+        if p != "clk":
+            lines.append(f"wire [{w-1}:0] {p};")
+    lines.append("")
+    lines.append(f"assign {{{', '.join(p for p, w in inputs)}}} = stim_reg;")
+    lines.append("")
+    lines.append(f"{dut} #(")
+    lines.append(",\n".join(f"    .{p}({v})" for p, v in params.items()))
+    lines.append(")")
+    lines.append("uut (")
+    lines.append(",\n".join(f"    .{p}({p})" for d, p, w in ports))
+    lines.append(");")
+
+    body = "\n".join(lines)
+
+    text = f"""// Language: Verilog 2001
+
+`resetall
+`timescale 1ns / 1ps
+`default_nettype none
+
+/*
+ * File-based stimulus/response harness for {dut} ({cycles} cycles)
+ */
+module {name};
+
+localparam CYCLES = {cycles};
+
+reg clk = 1'b0;
+reg done = 1'b0;
+
+always #5 clk = ~clk;
+
+reg [{in_width-1}:0] stim_mem[0:CYCLES-1];
+reg [{in_width-1}:0] stim_reg = 0;
+integer index = 0;
+integer fd;
+
+{body}
+
+initial begin
+    $readmemh("{stim_file}", stim_mem);
+    fd = $fopen("{resp_file}", "w");
+end
+
+always @(posedge clk) begin
+    if (index < CYCLES) begin
+        stim_reg <= stim_mem[index];
+        index <= index + 1;
+    end
+end
+
+always @(negedge clk) begin
+    if (index > 0 && !done) begin
+        $fwrite(fd, "%h\\n", {{{', '.join(p for p, w in outputs)}}});
+        if (index == CYCLES) begin
+            $fclose(fd);
+            done <= 1'b1;
+            if ($test$plusargs("finish")) begin
+                $finish;
+            end
+        end
+    end
+end
+
+endmodule
+
+`resetall
+"""
+
+    with open(output, 'w') as f:
+        f.write(text)
+
+    return name, inputs, outputs
+
+
+def pack(fields, values, count):
+    # pack per-field values (sequences or constants) into stimulus words, first field in the MSBs
+    words = [0]*count
+    for name, width in fields:
+        val = values.get(name, 0)
+        mask = (1 << width)-1
+        if isinstance(val, int):
+            words = [(w << width) | (val & mask) for w in words]
+        else:
+            words = [(w << width) | (int(v) & mask) for w, v in zip(words, val)]
+    return words
+
+
+async def run_test_vectors(dut):
+    await RisingEdge(dut.done)
+
+
+if cocotb.SIM_NAME:
+
+    factory = TestFactory(run_test_vectors)
+    factory.generate_tests()